@@ -41,38 +41,8 @@ COMPANY_INFO = {
 }
 
 # --- GRAPE VARIETIES ---
-GRAPE_VARIETIES = [
-    {
-        "name": "ARD 35 / Arra 35",
-        "aliases": ["ard35", "ard 35", "arra35", "arra 35", "अरा ३५", "एआरडी ३५"],
-        "description": "ARD 35 (Arra 35) is a premium black seeded grape variety popular in Maharashtra. Known for excellent yield and market demand.",
-        "file": "35.docx"
-    },
-    {
-        "name": "ARD 36 / Arra 36",
-        "aliases": ["ard36", "ard 36", "arra36", "arra 36", "अरा ३६", "एआरडी ३६"],
-        "description": "ARD 36 (Arra 36) is another premium grape variety with high export potential.",
-        "file": "36.docx"
-    },
-    {
-        "name": "Arra 15",
-        "aliases": ["arra15", "arra 15", "अरा १५", "15"],
-        "description": "Arra 15 is a popular grape variety in Maharashtra known for good sweetness.",
-        "file": "15.docx"
-    },
-    {
-        "name": "Crimson Seedless",
-        "aliases": ["crimson", "crimpson", "क्रिमसन"],
-        "description": "Crimson Seedless is a globally popular red seedless grape variety with high market value.",
-        "file": "cri.docx"
-    },
-    {
-        "name": "Thompson Seedless",
-        "aliases": ["thompson", "thomson", "थॉम्पसन"],
-        "description": "Thompson Seedless is one of the most widely cultivated seedless grape varieties worldwide.",
-        "file": "th.docx"
-    },
-]
+# Shared with the bot's variety-aware retrieval (reply/gemini_service.py)
+from reply.varieties import GRAPE_VARIETIES
 
 def create_company_chunks():
     """Create chunks from company information"""
@@ -234,6 +234,46 @@ CACHES = {
         'TIMEOUT': None,  # Cache forever
     }
 }
+# Knowledge base hot reload: how often each worker polls the version key
+KB_POLL_SECONDS = config('KB_POLL_SECONDS', default=30, cast=int)
+# Conversation memory: compress older turns into a summary every N turns
+SUMMARY_EVERY_N_TURNS = config('SUMMARY_EVERY_N_TURNS', default=4, cast=int)
+# Greetings come from reply/responses.py; True sends them through Gemini again
+GEMINI_LLM_GREETINGS = config('GEMINI_LLM_GREETINGS', default=False, cast=bool)
+# Burst coalescing (reply/bursts.py): debounce window in seconds per intent
+BURST_WINDOWS = {
+    'greeting': config('BURST_WINDOW_GREETING', default=6, cast=float),
+    'ack': config('BURST_WINDOW_ACK', default=3, cast=float),
+    'labor': config('BURST_WINDOW_LABOR', default=4, cast=float),
+    'default': config('BURST_WINDOW_DEFAULT', default=2.5, cast=float),
+}
+BURST_MAX_WAIT_SECONDS = config('BURST_MAX_WAIT_SECONDS', default=15, cast=float)
+# Cluster-wide Gemini limits (reply/quota.py), shared by all workers via Redis
+GEMINI_RPM = config('GEMINI_RPM', default=60, cast=int)
+GEMINI_TPM = config('GEMINI_TPM', default=1000000, cast=int)
+GEMINI_MAX_CONCURRENCY = config('GEMINI_MAX_CONCURRENCY', default=4, cast=int)
+GEMINI_QUEUE_DEADLINE_SECONDS = config('GEMINI_QUEUE_DEADLINE_SECONDS', default=20, cast=float)
+# Model per generate_reply path (reply/model_router.py): primary first, then fallbacks
+GEMINI_MODEL_ROUTES = {
+    'greeting': config('GEMINI_MODELS_GREETING', default='gemini-2.0-flash-lite,gemini-2.0-flash-exp', cast=Csv()),
+    'labor': config('GEMINI_MODELS_LABOR', default='gemini-2.0-flash-lite,gemini-2.0-flash-exp', cast=Csv()),
+    'rag': config('GEMINI_MODELS_RAG', default='gemini-2.0-flash-exp,gemini-2.0-flash-lite', cast=Csv()),
+    'summary': config('GEMINI_MODELS_SUMMARY', default='gemini-2.0-flash-lite,gemini-2.0-flash-exp', cast=Csv()),
+    'default': config('GEMINI_MODELS_DEFAULT', default='gemini-2.0-flash-exp', cast=Csv()),
+}
+GEMINI_SLOW_P95_MS = config('GEMINI_SLOW_P95_MS', default=8000, cast=int)
+# End-to-end budget per reply (reply/deadline.py); RAG / long history are dropped when it runs low
+REPLY_BUDGET_SECONDS = config('REPLY_BUDGET_SECONDS', default=25, cast=float)
+GEMINI_HEDGE_REQUESTS = config('GEMINI_HEDGE_REQUESTS', default=True, cast=bool)
+WHATSAPP_TIMEOUT_SECONDS = config('WHATSAPP_TIMEOUT_SECONDS', default=10, cast=float)
+# Spray schedules answered from the calender_* tables (reply/crop_calendar.py)
+CROP_CALENDAR_REFRESH_SECONDS = config('CROP_CALENDAR_REFRESH_SECONDS', default=600, cast=int)
+# Daily reminders (manage.py send_reminders): approved template with 3 body params
+REMINDER_TEMPLATE = config('REMINDER_TEMPLATE', default='spray_reminder')
+REMINDER_SENDS_PER_SECOND = config('REMINDER_SENDS_PER_SECOND', default=20, cast=float)
+# Message / webhook log archival (manage.py archive_messages, reply/archive.py)
+ARCHIVE_AFTER_DAYS = config('ARCHIVE_AFTER_DAYS', default=180, cast=int)
+ARCHIVE_DELETE_CHUNK = config('ARCHIVE_DELETE_CHUNK', default=1000, cast=int)
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
 
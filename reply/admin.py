@@ -2,7 +2,7 @@ from django.contrib import admin
 
 from django.contrib import admin
 from .models import WhatsAppUser, Conversation, Message, MediaFile, WhatsAppTemplate, WebhookLog
-from .models import ServiceInquiry, UnknownQuery, ChatSession
+from .models import ServiceInquiry, UnknownQuery, ChatSession, ApiUsage, FarmerCropProfile, MessageArchive
 
 @admin.register(ServiceInquiry)
 class ServiceInquiryAdmin(admin.ModelAdmin):
@@ -72,3 +72,31 @@ class WhatsAppTemplateAdmin(admin.ModelAdmin):
 @admin.register(WebhookLog)
 class WebhookLogAdmin(admin.ModelAdmin):
     list_display = ('timestamp', 'processed')
+
+
+@admin.register(ApiUsage)
+class ApiUsageAdmin(admin.ModelAdmin):
+    list_display = ('date', 'path', 'model', 'call_type', 'whatsapp_user', 'calls', 'errors', 'failovers',
+                    'input_tokens', 'output_tokens', 'avg_latency_ms')
+    list_filter = ('date', 'path', 'model', 'call_type')
+    search_fields = ('whatsapp_user__name', 'whatsapp_user__phone_number')
+
+    def avg_latency_ms(self, obj):
+        return obj.total_latency_ms // obj.calls if obj.calls else 0
+    avg_latency_ms.short_description = 'Avg latency (ms)'
+
+
+@admin.register(FarmerCropProfile)
+class FarmerCropProfileAdmin(admin.ModelAdmin):
+    list_display = ('whatsapp_user', 'crop_variety', 'pruning_date', 'language', 'reminders_enabled', 'last_reminded_on')
+    list_filter = ('reminders_enabled', 'language', 'crop_variety')
+    search_fields = ('whatsapp_user__name', 'whatsapp_user__phone_number')
+    raw_id_fields = ('whatsapp_user',)
+
+
+@admin.register(MessageArchive)
+class MessageArchiveAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'conversation', 'first_at', 'last_at', 'row_count', 'size_bytes', 'path')
+    list_filter = ('kind',)
+    search_fields = ('conversation__whatsapp_user__phone_number', 'path')
+    raw_id_fields = ('conversation',)
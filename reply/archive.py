@@ -0,0 +1,266 @@
+"""
+Message / webhook log archival.
+
+Rows older than ARCHIVE_AFTER_DAYS are moved out of whatsapp_message and
+whatsapp_webhooklog into gzipped JSON Lines files in the default storage,
+partitioned by date:
+
+    archive/messages/YYYY/MM/conversation-<id>-<first id>.jsonl.gz
+    archive/webhooklogs/YYYY/MM/DD-<first id>.jsonl.gz
+
+Each file gets a MessageArchive tombstone (conversation, time range, row
+count) written before its rows are deleted, and the deletes run in short
+transactions of ARCHIVE_DELETE_CHUNK ids, so live traffic never waits on a
+long lock. A run interrupted between the file and the deletes only leaves
+rows that exist twice; readers drop the archived copy, and the next run
+finishes their deletes instead of archiving them again.
+
+Archived messages are rehydrated on demand (chat page with ?archived=1,
+the chat export) from the tombstones overlapping the wanted range; decoded
+files are cached for ARCHIVE_CACHE_SECONDS since they never change. Media
+files stay where they are: the archived rows keep their media_url / path.
+"""
+import gzip
+import json
+import logging
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F, Max, Sum
+from django.utils.dateparse import parse_datetime
+
+from .models import Message, MessageArchive, WebhookLog
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = getattr(settings, 'ARCHIVE_AFTER_DAYS', 180)
+ARCHIVE_DELETE_CHUNK = getattr(settings, 'ARCHIVE_DELETE_CHUNK', 1000)
+ARCHIVE_CACHE_SECONDS = getattr(settings, 'ARCHIVE_CACHE_SECONDS', 3600)
+READ_CHUNK = 2000
+
+MESSAGE_FIELDS = (
+    'id', 'conversation_id', 'whatsapp_message_id', 'message_type', 'direction', 'text_content',
+    'media_url', 'media_id', 'mime_type', 'caption', 'template_name', 'template_language',
+    'template_params', 'status', 'timestamp', 'created_at', 'updated_at', 'error_message',
+)
+WEBHOOK_LOG_FIELDS = ('id', 'timestamp', 'payload', 'processed', 'error')
+DATETIME_FIELDS = ('timestamp', 'created_at', 'updated_at')
+
+
+class ArchivedMessage:
+    """Read-only stand-in for a Message rebuilt from an archive row (templates read the same attributes)"""
+    archived = True
+
+    def __init__(self, row):
+        self.__dict__.update(row)
+        for field in DATETIME_FIELDS:
+            if isinstance(row.get(field), str):
+                setattr(self, field, parse_datetime(row[field]))
+
+    def __str__(self):
+        return f"{self.direction} - {self.message_type} - {self.timestamp} (archived)"
+
+
+# --- Writing ---
+
+class ArchiveJSONEncoder(DjangoJSONEncoder):
+    """Datetimes to the microsecond (DjangoJSONEncoder cuts them to milliseconds), so they match the live rows"""
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _write(path, rows):
+    """Gzipped JSON Lines into the default storage; returns (stored name, size)"""
+    lines = '\n'.join(json.dumps(row, cls=ArchiveJSONEncoder, ensure_ascii=False) for row in rows)
+    data = gzip.compress(lines.encode('utf-8'))
+    return default_storage.save(path, ContentFile(data)), len(data)
+
+
+def _delete_in_chunks(model, ids, chunk_size, pause):
+    for i in range(0, len(ids), chunk_size):
+        with transaction.atomic():
+            model.objects.filter(id__in=ids[i:i + chunk_size]).delete()
+        if pause:
+            time.sleep(pause)
+
+
+def _partitions(rows, partition_of):
+    """Consecutive rows (already ordered by timestamp) grouped by partition"""
+    current, batch = None, []
+    for row in rows:
+        partition = partition_of(row)
+        if batch and partition != current:
+            yield current, batch
+            batch = []
+        current = partition
+        batch.append(row)
+    if batch:
+        yield current, batch
+
+
+def _finish_interrupted(queryset, archives, chunk_size, pause, stats):
+    """Delete the rows of queryset already in one of these archives (left by an interrupted run)"""
+    oldest = queryset.order_by('timestamp').values_list('timestamp', flat=True).first()
+    if oldest is None:
+        return
+    done = _archived_ids(archives.filter(last_at__gte=oldest))
+    if not done:
+        return
+    ids = [row_id for row_id in queryset.values_list('id', flat=True).iterator(chunk_size=READ_CHUNK)
+           if row_id in done]
+    _delete_in_chunks(queryset.model, ids, chunk_size, pause)
+    stats['finished'] += len(ids)
+    if ids:
+        logger.info(f"📦 Finished deleting {len(ids)} already archived {queryset.model._meta.model_name} row(s)")
+
+
+def _archive_partition(kind, path, rows, conversation_id, chunk_size, pause, stats):
+    model = Message if kind == 'message' else WebhookLog
+    name, size = _write(path, rows)
+    MessageArchive.objects.create(
+        kind=kind, conversation_id=conversation_id, path=name, row_count=len(rows), size_bytes=size,
+        first_at=rows[0]['timestamp'], last_at=rows[-1]['timestamp'],
+    )
+    _delete_in_chunks(model, [row['id'] for row in rows], chunk_size, pause)
+    stats['files'] += 1
+    stats['rows'] += len(rows)
+    stats['bytes'] += size
+
+
+def archive_messages(cutoff, chunk_size=ARCHIVE_DELETE_CHUNK, pause=0.0, dry_run=False):
+    """Archive messages older than cutoff, one file per conversation and month; returns stats"""
+    stats = {'conversations': 0, 'files': 0, 'rows': 0, 'bytes': 0, 'finished': 0}
+    old = Message.objects.filter(timestamp__lt=cutoff)
+    if dry_run:
+        stats['rows'] = old.count()
+        stats['conversations'] = old.values('conversation_id').distinct().order_by().count()
+        return stats
+
+    conversation_ids = list(old.values_list('conversation_id', flat=True).distinct().order_by())
+    for conversation_id in conversation_ids:
+        archives = MessageArchive.objects.filter(kind='message', conversation_id=conversation_id)
+        _finish_interrupted(old.filter(conversation_id=conversation_id), archives, chunk_size, pause, stats)
+        rows = (
+            old.filter(conversation_id=conversation_id).order_by('timestamp', 'id')
+            .values(*MESSAGE_FIELDS, media_path=F('media_file__file')).iterator(chunk_size=READ_CHUNK)
+        )
+        for (year, month), batch in _partitions(rows, lambda row: (row['timestamp'].year, row['timestamp'].month)):
+            path = f"archive/messages/{year}/{month:02d}/conversation-{conversation_id}-{batch[0]['id']}.jsonl.gz"
+            _archive_partition('message', path, batch, conversation_id, chunk_size, pause, stats)
+        stats['conversations'] += 1
+        logger.info(f"📦 Archived messages of conversation {conversation_id}")
+    return stats
+
+
+def archive_webhook_logs(cutoff, chunk_size=ARCHIVE_DELETE_CHUNK, pause=0.0, dry_run=False):
+    """Archive webhook logs older than cutoff, one file per day; returns stats"""
+    stats = {'files': 0, 'rows': 0, 'bytes': 0, 'finished': 0}
+    old = WebhookLog.objects.filter(timestamp__lt=cutoff)
+    if dry_run:
+        stats['rows'] = old.count()
+        return stats
+
+    _finish_interrupted(old, MessageArchive.objects.filter(kind='webhooklog'), chunk_size, pause, stats)
+
+    rows = old.order_by('timestamp', 'id').values(*WEBHOOK_LOG_FIELDS).iterator(chunk_size=READ_CHUNK)
+    for day, batch in _partitions(rows, lambda row: row['timestamp'].date()):
+        path = f"archive/webhooklogs/{day:%Y/%m/%d}-{batch[0]['id']}.jsonl.gz"
+        _archive_partition('webhooklog', path, batch, None, chunk_size, pause, stats)
+    return stats
+
+
+# --- Rehydration ---
+
+def _load(archive):
+    """Rows of one archive file (cached: files never change)"""
+    key = f'archive_rows:{archive.id}'
+    rows = cache.get(key)
+    if rows is None:
+        with default_storage.open(archive.path, 'rb') as f:
+            text = gzip.decompress(f.read()).decode('utf-8')
+        rows = [json.loads(line) for line in text.splitlines() if line]
+        try:
+            cache.set(key, rows, timeout=ARCHIVE_CACHE_SECONDS)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not cache archive {archive.path}: {e}")
+    return rows
+
+
+def _archived_ids(archives):
+    """Row ids in these archive files (unreadable ones are skipped)"""
+    ids = set()
+    for archive in archives:
+        try:
+            ids.update(row['id'] for row in _load(archive))
+        except Exception as e:
+            logger.error(f"❌ Could not read archive {archive.path}: {e}")
+    return ids
+
+
+def archived_count(conversation):
+    """Archived messages that are not also live (the files are only read when some could be)"""
+    archives = conversation.archives.filter(kind='message')
+    totals = archives.aggregate(total=Sum('row_count'), last_at=Max('last_at'))
+    if not totals['total']:
+        return 0
+    live_ids = set(conversation.messages.filter(timestamp__lte=totals['last_at']).values_list('id', flat=True))
+    if not live_ids:
+        return totals['total']
+    return len(_archived_ids(archives) - live_ids)
+
+
+def archived_messages(conversation, since=None, until=None):
+    """[ArchivedMessage, ...] oldest first, from the archives overlapping [since, until]"""
+    archives = conversation.archives.filter(kind='message')
+    if since:
+        archives = archives.filter(last_at__gte=since)
+    if until:
+        archives = archives.filter(first_at__lte=until)
+    by_id = {}  # a row archived twice is kept once
+    for archive in archives:
+        try:
+            rows = _load(archive)
+        except Exception as e:
+            logger.error(f"❌ Could not read archive {archive.path}: {e}")
+            continue
+        for row in rows:
+            by_id.setdefault(row['id'], row)
+    messages = [ArchivedMessage(row) for row in by_id.values()]
+    messages = [
+        m for m in messages
+        if (since is None or m.timestamp >= since) and (until is None or m.timestamp <= until)
+    ]
+    messages.sort(key=lambda m: (m.timestamp, m.id))
+    return messages
+
+
+def with_archived(conversation, live_messages, since=None, until=None):
+    """Live messages plus the archived ones, oldest first (a row in both is shown once, live)"""
+    live = list(live_messages)
+    live_ids = {m.id for m in live}
+    archived = [m for m in archived_messages(conversation, since, until) if m.id not in live_ids]
+    return sorted(archived + live, key=lambda m: (m.timestamp, m.id))
+
+
+def export_rows(conversation):
+    """Every message of a conversation as JSON-ready dicts, oldest first (a row in both is exported live)"""
+    archived = archived_messages(conversation)
+    live = conversation.messages.order_by('timestamp', 'id').values(*MESSAGE_FIELDS)
+    live_ids = set()
+    if archived:
+        # Only live rows inside the archived range can be duplicates
+        live_ids = set(live.filter(timestamp__lte=archived[-1].timestamp).values_list('id', flat=True))
+    for message in archived:
+        if message.id not in live_ids:
+            yield {field: getattr(message, field, None) for field in MESSAGE_FIELDS} | {'archived': True}
+    for row in live.iterator(chunk_size=READ_CHUNK):
+        yield row | {'archived': False}
@@ -0,0 +1,262 @@
+"""
+Burst coalescing: several rapid-fire messages -> one LLM call.
+
+Every inbound text bumps a per-conversation sequence number in Redis and
+schedules a reply job for the end of a short debounce window. When a job
+fires it only proceeds if its sequence number is still the latest; otherwise
+a newer message scheduled a later job that will answer the whole burst. The
+reply checks again right before calling the LLM, and a generation that
+finishes after a newer message arrived is dropped as stale - the newer job
+answers everything, including the messages the stale one saw.
+
+Jobs are durable: they sit in a Redis sorted set scored by their fire time,
+and every worker runs one BurstScheduler thread that claims due jobs (ZREM
+decides the single winner) and runs them on a small bounded pool. A worker
+restart therefore never loses a reply - any live worker picks the job up.
+Without Redis sorted sets (or when Redis fails) jobs fall back to the same
+scheduler's in-process queue, with no delay on errors, so a message is
+always answered.
+"""
+import heapq
+import json
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+from .deadline import REPLY_BUDGET_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a follow-up message, by intent of the latest message.
+# "hi" is almost always followed by the actual request; a full question
+# rarely is.
+DEFAULT_BURST_WINDOWS = {
+    'greeting': 6,
+    'ack': 3,
+    'labor': 4,
+    'default': 2.5,
+}
+BURST_WINDOWS = {**DEFAULT_BURST_WINDOWS, **getattr(settings, 'BURST_WINDOWS', {})}
+# Never hold a burst longer than this after its first message
+BURST_MAX_WAIT_SECONDS = getattr(settings, 'BURST_MAX_WAIT_SECONDS', 15)
+MAX_BATCH_MESSAGES = 10
+BURST_KEY_TTL = 24 * 3600
+BURST_REPLY_WORKERS = getattr(settings, 'BURST_REPLY_WORKERS', 4)
+BURST_POLL_SECONDS = 0.25
+# Redis errors pause the durable polling (not the in-process queue) this long
+POLL_ERROR_BACKOFF_SECONDS = 5
+# The burst start outlives its reply job by this much (generation + slack)
+START_KEY_GRACE_SECONDS = REPLY_BUDGET_SECONDS + 30
+DUE_KEY = 'burst_due'
+
+
+def _seq_key(conversation_id):
+    return f'burst_seq:{conversation_id}'
+
+
+def _start_key(conversation_id):
+    return f'burst_start:{conversation_id}'
+
+
+def window_for(intent):
+    """Debounce window for a message with this intent"""
+    for name in ('greeting', 'ack', 'labor'):
+        if getattr(intent, name, False):
+            return BURST_WINDOWS[name]
+    return BURST_WINDOWS['default']
+
+
+def register_message(conversation_id, message_id):
+    """Record a new inbound message; returns (seq, burst_start)"""
+    key = _seq_key(conversation_id)
+    cache.add(key, 0, timeout=BURST_KEY_TTL)
+    seq = cache.incr(key)
+    start = {'message_id': message_id, 'at': time.time()}
+    # Kept until the reply job fires (see schedule)
+    timeout = math.ceil(BURST_MAX_WAIT_SECONDS + START_KEY_GRACE_SECONDS)
+    if not cache.add(_start_key(conversation_id), start, timeout=timeout):
+        start = cache.get(_start_key(conversation_id)) or start
+    return seq, start
+
+
+def is_latest(conversation_id, seq):
+    """False only if a newer message is known; without the cache, answer anyway"""
+    if seq is None:
+        return True
+    try:
+        return cache.get(_seq_key(conversation_id)) == seq
+    except Exception as e:
+        logger.warning(f"⚠️ Burst cache unavailable, answering #{seq}: {e}")
+        return True
+
+
+def finish_burst(conversation_id, first_message_id):
+    """Close the burst we just answered (unless a new one already began)"""
+    try:
+        start = cache.get(_start_key(conversation_id))
+        if start and start['message_id'] == first_message_id:
+            cache.delete(_start_key(conversation_id))
+    except Exception as e:
+        logger.warning(f"⚠️ Could not close burst for conversation {conversation_id}: {e}")
+
+
+def delay_for(intent, start):
+    """Window for this intent, capped by how long the burst has already waited"""
+    waited = time.time() - start['at']
+    return max(0, min(window_for(intent), BURST_MAX_WAIT_SECONDS - waited))
+
+
+# --- Scheduling ---
+
+_client = None
+_client_lock = threading.Lock()
+_unavailable = False
+
+
+def _redis():
+    """Shared raw Redis client, or None (in-process jobs only) without django-redis"""
+    global _client, _unavailable
+    if _client is None and not _unavailable:
+        with _client_lock:
+            if _client is None and not _unavailable:
+                try:
+                    from django_redis import get_redis_connection
+                    _client = get_redis_connection('default')
+                except Exception as e:
+                    _unavailable = True
+                    logger.warning(f"⚠️ Burst jobs kept in process (no Redis sorted sets): {e}")
+    return _client
+
+
+def _run(job):
+    conversation_id, seq = job['conversation_id'], job['seq']
+    try:
+        if not is_latest(conversation_id, seq):
+            logger.info(f"⏩ Burst {conversation_id}#{seq} superseded by a newer message")
+            return
+        import_string(job['callback'])(*job['args'])
+    except Exception as e:
+        logger.error(f"❌ Burst reply failed for conversation {conversation_id}: {e}", exc_info=True)
+    finally:
+        close_old_connections()
+
+
+class BurstScheduler(threading.Thread):
+    """
+    One per worker process: claims due jobs from Redis (and its own
+    in-process queue) and runs them on BURST_REPLY_WORKERS threads.
+    """
+
+    def __init__(self, workers=BURST_REPLY_WORKERS, poll=BURST_POLL_SECONDS):
+        super().__init__(name='burst-scheduler', daemon=True)
+        self.poll = poll
+        self._local = []  # heap of (due, tiebreak, job)
+        self._counter = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._durable_paused_until = 0.0
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='burst-reply')
+
+    def add_local(self, due, job):
+        with self._lock:
+            self._counter += 1
+            heapq.heappush(self._local, (due, self._counter, job))
+        self._wake.set()
+
+    def _local_due(self, now):
+        due = []
+        with self._lock:
+            while self._local and self._local[0][0] <= now:
+                due.append(heapq.heappop(self._local)[2])
+        return due
+
+    def _durable_due(self, now):
+        client = _redis()
+        if client is None:
+            return []
+        key = cache.make_key(DUE_KEY)
+        claimed = []
+        for member in client.zrangebyscore(key, '-inf', now, start=0, num=50):
+            if client.zrem(key, member):  # only one worker wins each job
+                claimed.append(json.loads(member))
+        return claimed
+
+    def run(self):
+        while True:
+            now = time.time()
+            jobs = self._local_due(now)
+            if now >= self._durable_paused_until:
+                try:
+                    jobs += self._durable_due(now)
+                except Exception as e:
+                    self._durable_paused_until = now + POLL_ERROR_BACKOFF_SECONDS
+                    logger.error(f"❌ Could not poll burst jobs, retrying in {POLL_ERROR_BACKOFF_SECONDS}s: {e}")
+            for job in jobs:
+                self._pool.submit(_run, job)
+            with self._lock:
+                wait = self.poll if not self._local else min(self.poll, max(0, self._local[0][0] - now))
+            self._wake.wait(wait)
+            self._wake.clear()
+
+
+_scheduler = None
+_scheduler_pid = None
+_scheduler_lock = threading.Lock()
+
+
+def ensure_scheduler():
+    """This process's scheduler, started on first use (and again after a fork)"""
+    global _scheduler, _scheduler_pid
+    if _scheduler is None or _scheduler_pid != os.getpid():
+        with _scheduler_lock:
+            if _scheduler is None or _scheduler_pid != os.getpid():
+                _scheduler = BurstScheduler()
+                _scheduler.start()
+                _scheduler_pid = os.getpid()
+    return _scheduler
+
+
+def _job(conversation_id, seq, callback, args):
+    return {
+        'callback': f'{callback.__module__}.{callback.__qualname__}',
+        'conversation_id': conversation_id, 'seq': seq, 'args': list(args),
+    }
+
+
+def schedule(conversation_id, seq, delay, callback, *args):
+    """
+    Run callback(*args) after delay unless a newer message arrives first.
+    callback must be a module-level function and args JSON values: any
+    worker may run the job.
+    """
+    scheduler = ensure_scheduler()
+    job = _job(conversation_id, seq, callback, args)
+    due = time.time() + delay
+    try:
+        client = _redis()
+        if client is None:
+            scheduler.add_local(due, job)
+        else:
+            client.zadd(cache.make_key(DUE_KEY), {json.dumps(job, separators=(',', ':')): due})
+    except Exception as e:
+        logger.error(f"❌ Could not schedule burst {conversation_id}#{seq}, replying now: {e}")
+        scheduler.add_local(0, job)
+        return
+    try:
+        # The burst start must last until the job has fired and answered
+        cache.touch(_start_key(conversation_id), timeout=math.ceil(delay + START_KEY_GRACE_SECONDS))
+    except Exception as e:
+        logger.warning(f"⚠️ Could not extend burst start for conversation {conversation_id}: {e}")
+
+
+def reply_now(conversation_id, callback, *args):
+    """Skip debouncing (the burst state is unavailable): answer on the scheduler's pool"""
+    ensure_scheduler().add_local(0, _job(conversation_id, None, callback, args))
@@ -0,0 +1,65 @@
+"""
+Per-table versions for the read-only catalog endpoints.
+
+A table's version is derived from its data (row count, highest id, latest
+updated_at), so writes by the crop-calendar app, which shares these tables
+and sends no signals here, move it too. The version is cached for
+VERSION_TTL_SECONDS: checking If-None-Match costs one cache round trip, plus
+one aggregate query per table at most that often. Writes made here
+(reply.signals, import_schedule) drop the cached version so they show at
+once. ETags are derived from the versions of the tables a response reads.
+"""
+import hashlib
+import logging
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'catalog_version'
+# How long a write by another app can go unnoticed
+VERSION_TTL_SECONDS = 10
+
+
+def _key(table):
+    return f'{KEY_PREFIX}:{table}'
+
+
+def _model(table):
+    for model in apps.get_models():
+        if model._meta.db_table == table:
+            return model
+    raise LookupError(f'No model for table {table}')
+
+
+def _fingerprint(table):
+    """Moves whenever a row is added, deleted or saved, by any app"""
+    stats = _model(table)._base_manager.aggregate(rows=Count('pk'), last_id=Max('pk'), changed=Max('updated_at'))
+    changed = stats['changed'].isoformat() if stats['changed'] else ''
+    return f"{stats['rows']}:{stats['last_id'] or 0}:{changed}"
+
+
+def versions(tables):
+    """{table: version} for these db tables"""
+    found = cache.get_many([_key(table) for table in tables])
+    missing = {table: _fingerprint(table) for table in tables if _key(table) not in found}
+    if missing:
+        cache.set_many({_key(table): version for table, version in missing.items()}, timeout=VERSION_TTL_SECONDS)
+    return {table: found.get(_key(table), missing.get(table)) for table in tables}
+
+
+def bump(*tables):
+    """Rows of these tables changed; the next read recomputes their versions"""
+    try:
+        cache.delete_many([_key(table) for table in tables])
+    except Exception as e:
+        logger.warning(f"⚠️ Catalog version for {', '.join(tables)} unavailable: {e}")
+
+
+def etag(tables, variant=''):
+    """Strong ETag for a response built from these tables (variant = query string etc.)"""
+    current = versions(tables)
+    source = '|'.join(f'{table}={current[table]}' for table in tables) + f'|{variant}'
+    return f'"{hashlib.sha1(source.encode("utf-8")).hexdigest()}"'
@@ -0,0 +1,112 @@
+"""
+Read-only crop calendar catalog endpoints.
+
+Every response carries a strong ETag: product documents hash their stored
+bytes, the list endpoints derive theirs from reply.catalog_versions table
+versions plus the query string. A client revalidating with If-None-Match
+gets a 304 without the page being built. Lists use cursor (keyset) pagination, so a page costs
+the same at any depth.
+"""
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_http_methods
+from rest_framework import generics
+from rest_framework.pagination import CursorPagination
+
+from . import catalog_versions, product_documents, product_search
+from .models import Crop, CropVariety, Product
+from .serializers import CropSerializer, ProductSerializer
+
+CATALOG_MAX_AGE_SECONDS = 300
+CATALOG_PAGE_SIZE = getattr(settings, 'CATALOG_PAGE_SIZE', 100)
+CATALOG_MAX_PAGE_SIZE = 500
+
+
+def _not_modified(request, etag):
+    """Does the client already hold this etag (If-None-Match)?"""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag in etags
+
+
+def _cached_response(request, etag, body):
+    if _not_modified(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = f'public, max-age={CATALOG_MAX_AGE_SECONDS}'
+    return response
+
+
+@require_http_methods(["GET", "HEAD"])
+def product_relationships_api(request, product_id):
+    """Where a product is used across the crop calendar (precomputed document)"""
+    document = product_documents.get_document(product_id)
+    if document is None:
+        return JsonResponse({'status': 'error', 'message': 'Product not found'}, status=404)
+    etag, body = document
+    return _cached_response(request, etag, body)
+
+
+@require_http_methods(["GET"])
+def product_autocomplete_api(request):
+    """?q=ईक्लोन / eclon max -> products, prefix matches first, then typo-tolerant ones"""
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(int(request.GET.get('limit', product_search.DEFAULT_LIMIT)), product_search.MAX_LIMIT)
+    except ValueError:
+        limit = product_search.DEFAULT_LIMIT
+    results = [
+        {**product, 'match': match, 'score': score}
+        for product, match, score in (product_search.search(query, limit) if query else [])
+    ]
+    return JsonResponse({'query': query, 'results': results}, json_dumps_params={'ensure_ascii': False})
+
+
+class CatalogCursorPagination(CursorPagination):
+    page_size = CATALOG_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = CATALOG_MAX_PAGE_SIZE
+    ordering = '-id'  # newest first
+
+
+class CropCursorPagination(CatalogCursorPagination):
+    ordering = 'id'
+
+
+class VersionedListView(generics.ListAPIView):
+    """Read-only list whose ETag comes from the versions of etag_tables"""
+    etag_tables = ()
+    pagination_class = CatalogCursorPagination
+
+    def get(self, request, *args, **kwargs):
+        # Checked before get_queryset(): a 304 never builds the page
+        etag = catalog_versions.etag(self.etag_tables, request.get_full_path())
+        if _not_modified(request, etag):
+            response = HttpResponseNotModified()
+        else:
+            response = self.list(request, *args, **kwargs)
+        response['ETag'] = etag
+        response['Cache-Control'] = f'public, max-age={CATALOG_MAX_AGE_SECONDS}'
+        return response
+
+
+class ProductReadOnlyList(VersionedListView):
+    serializer_class = ProductSerializer
+    queryset = Product.objects.all()
+    etag_tables = (Product._meta.db_table,)
+
+
+class CropList(VersionedListView):
+    serializer_class = CropSerializer
+    etag_tables = (Crop._meta.db_table, CropVariety._meta.db_table)
+    pagination_class = CropCursorPagination
+
+    def get_queryset(self):
+        # One query for the page of crops, one for all their varieties
+        return Crop.objects.prefetch_related(Prefetch('varieties', queryset=CropVariety.objects.order_by('id')))
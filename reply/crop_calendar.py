@@ -0,0 +1,430 @@
+"""
+Structured spray-schedule answers from the crop calendar tables.
+
+"ARD 36 45 दिवस फवारणी?" is a lookup, not a search: the calender_* tables
+already hold the day ranges and product doses per variety. An in-memory
+interval index of them (one per worker, products and activities pre-joined)
+answers these directly - no DB, no embed, no LLM - and generate_reply falls
+back to RAG only when nothing matches.
+
+The tables' schema is owned by the crop calendar app that shares this
+database (the models here are managed=False); their rows are written by
+that app and by this one's import_schedule command (reply.schedule_import),
+which invalidates the index on commit.
+
+Days are counted from pruning (negative = before pruning), as in the tables.
+"""
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .responses import SPRAY_DISCLAIMER
+from .slots import DATE_RE, MONTHS
+from .text_utils import LEFT_BOUNDARY, WORD_CHARS
+from .varieties import detect_variety, remove_varieties
+
+logger = logging.getLogger(__name__)
+
+CROP_CALENDAR_REFRESH_SECONDS = getattr(settings, 'CROP_CALENDAR_REFRESH_SECONDS', 600)
+# Bumped by invalidate() (reply.signals) whenever calendar rows are written here
+VERSION_KEY = 'crop_calendar_version'
+VERSION_CHECK_SECONDS = 5
+# No range on the asked day: answer with one this close instead ("45 days" is approximate)
+NEAREST_MAX_DAYS = 2
+MAX_DAY = 300
+
+MATCH_EXACT = 'exact'
+MATCH_NEAREST = 'nearest'
+
+# Matched against normalize()d text (lowercase, ASCII digits)
+_DAY_WORDS = r'(?:days?|din|divas|diwas|divsa|दिवस|दिवशी|दिन)'
+NUMBER_DAY_RE = re.compile(
+    r'(?<![\d.])(\d{1,3})\s*(?:st|nd|rd|th|va|vya|वा|व्या|वे|वां|वें)?\s*' + _DAY_WORDS + rf'[{WORD_CHARS}]*'
+)
+DAY_NUMBER_RE = re.compile(
+    LEFT_BOUNDARY + r'(?:day|दिवस)\s*(?:no\.?|number|नं\.?|क्रमांक)?\s*(\d{1,3})(?![\d.])'
+)
+PRUNING_RE = re.compile(
+    LEFT_BOUNDARY + r'(?:pruning|prunning|prune|pruned|chatani|chhatani|छाटणी|छाटनी|छंटाई|छटाई)'
+)
+BEFORE_PRUNING_RE = re.compile(r'before|purvi|aadhi|पूर्वी|आधी|पहले')
+# "next 14 days" / "पुढील 14 दिवस" is a time span, not a day after pruning
+SPAN_BEFORE_DAYS_RE = re.compile(
+    LEFT_BOUNDARY + r'(?:next|coming|upcoming|following|last|past|agle|agla|pudhil|pudhche|pudhchya|'
+    r'पुढील|पुढचे|पुढच्या|पुढे|अगले|अगला|गेल्या|मागील|पिछले)\s*$'
+)
+# Words that make a message a schedule question (the spray / fertilizer services count too)
+SCHEDULE_RE = re.compile(
+    LEFT_BOUNDARY + r'(?:schedule|spray|favar|fawar|फवार|फवारा|vel[ae]?patrak|वेळापत्रक|niyojan|नियोजन|'
+    r'dose|doses|डोस|aushadh|औषध|dava|दवा|khat|खत|fertili[sz]er|kay karu|kay karayche|काय करू|काय करायचे|'
+    r'what to (?:do|spray|apply|give))'
+)
+SCHEDULE_SERVICES = {'spray', 'fertilizer'}
+MONTH_ORDER = ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec')
+
+DOSAGE_UNITS_DEVANAGARI = {
+    'ml/liter': 'मिली/लिटर',
+    'gm/liter': 'ग्रॅम/लिटर',
+    'ml/acre': 'मिली/एकर',
+    'gm/acre': 'ग्रॅम/एकर',
+    'kg/acre': 'किलो/एकर',
+    'liter/acre': 'लिटर/एकर',
+    'ml/200liter': 'मिली/200 लिटर',
+}
+
+LABELS = {
+    'en': {
+        'after': "day {day} after pruning",
+        'before': "{day} days before pruning",
+        'nearest': "Nothing is scheduled for that exact day - closest:",
+    },
+    'hi': {
+        'after': "छंटाई के बाद {day}वां दिन",
+        'before': "छंटाई से {day} दिन पहले",
+        'nearest': "ठीक उसी दिन कुछ तय नहीं है - सबसे नज़दीकी:",
+    },
+    'mr': {
+        'after': "छाटणीनंतर {day} वा दिवस",
+        'before': "छाटणीपूर्वी {day} दिवस",
+        'nearest': "नेमक्या त्या दिवशी काही नियोजन नाही - जवळचे:",
+    },
+}
+
+
+class CalendarEntry:
+    """One day range with its activity and product doses"""
+    __slots__ = ('start_day', 'end_day', 'activity', 'activity_marathi', 'info', 'info_marathi', 'products')
+
+    def __init__(self, day_range):
+        self.start_day = day_range.start_day
+        self.end_day = day_range.end_day
+        self.activity = day_range.activity.name
+        self.activity_marathi = day_range.activity.name_marathi
+        self.info = (day_range.info or '').strip()
+        self.info_marathi = (day_range.info_marathi or '').strip()
+        # (name, name_marathi, dosage, unit)
+        self.products = [
+            (p.product.name, p.product.name_marathi, p.dosage, p.dosage_unit)
+            for p in day_range.products.all()
+        ]
+
+    def is_useful(self):
+        return bool(self.products or self.info or self.info_marathi)
+
+
+class VarietySchedule:
+    """
+    Interval index over one variety's day ranges.
+
+    Entries are sorted by start day; max_ends[i] is the largest end day among
+    entries[:i + 1], so a stabbing query bisects on the start and walks back
+    only while an earlier range can still reach the day. by_end serves the
+    "nearest before" side.
+    """
+    __slots__ = ('entries', 'starts', 'max_ends', 'by_end', 'ends')
+
+    def __init__(self, entries):
+        self.entries = sorted(entries, key=lambda e: (e.start_day, e.end_day))
+        self.starts = [e.start_day for e in self.entries]
+        self.max_ends = list(accumulate((e.end_day for e in self.entries), max))
+        self.by_end = sorted(self.entries, key=lambda e: (e.end_day, e.start_day))
+        self.ends = [e.end_day for e in self.by_end]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def between(self, first, last):
+        """Ranges overlapping days first..last, by start day"""
+        found = []
+        i = bisect_right(self.starts, last) - 1
+        while i >= 0 and self.max_ends[i] >= first:
+            if self.entries[i].end_day >= first:
+                found.append(self.entries[i])
+            i -= 1
+        found.reverse()
+        return found
+
+    def at(self, day):
+        """Ranges covering day"""
+        return self.between(day, day)
+
+    def before(self, day):
+        """The range(s) ending closest before day"""
+        i = bisect_left(self.ends, day)
+        if i == 0:
+            return []
+        end = self.ends[i - 1]
+        return self.by_end[bisect_left(self.ends, end):i]
+
+    def after(self, day):
+        """The range(s) starting closest after day"""
+        i = bisect_right(self.starts, day)
+        if i == len(self.starts):
+            return []
+        return self.entries[i:bisect_right(self.starts, self.starts[i])]
+
+
+class CalendarIndex:
+    """crop_variety_id -> VarietySchedule, plus the reply.varieties key for each"""
+
+    def __init__(self, schedules=None, variety_ids=None, variety_names=None, version=None, loaded_at=0.0):
+        self.schedules = schedules or {}
+        # variety key -> crop_variety_id / (name, name_marathi) as the calendar spells it
+        self.variety_ids = variety_ids or {}
+        self.variety_names = variety_names or {}
+        self.version = version
+        self.loaded_at = loaded_at
+
+    def __len__(self):
+        return sum(len(schedule) for schedule in self.schedules.values())
+
+    def schedule(self, variety):
+        """VarietySchedule by variety key ('36') or crop_variety_id"""
+        crop_variety_id = self.variety_ids.get(variety, variety)
+        return self.schedules.get(crop_variety_id) or EMPTY_SCHEDULE
+
+    def between(self, variety, first, last):
+        return self.schedule(variety).between(first, last)
+
+    def lookup(self, variety, day):
+        """(match_type, entries) for this day, or (None, [])"""
+        schedule = self.schedule(variety)
+        exact = schedule.at(day)
+        if exact:
+            return MATCH_EXACT, exact
+
+        before, after = schedule.before(day), schedule.after(day)
+        gap_before = day - before[0].end_day if before else None
+        gap_after = after[0].start_day - day if after else None
+        # Closest wins; on a tie the upcoming range
+        if gap_after is not None and gap_after <= NEAREST_MAX_DAYS and (gap_before is None or gap_after <= gap_before):
+            return MATCH_NEAREST, after
+        if gap_before is not None and gap_before <= NEAREST_MAX_DAYS:
+            return MATCH_NEAREST, before
+        return None, []
+
+
+EMPTY_SCHEDULE = VarietySchedule([])
+
+
+def load_index(version=None):
+    """Read every day range + product dose (3 queries) into a CalendarIndex"""
+    from .models import CropVariety, DayRange, DayRangeProduct
+
+    variety_ids = {}
+    variety_names = {}
+    for crop_variety in CropVariety.objects.all():
+        key = detect_variety(crop_variety.name) or detect_variety(crop_variety.name_marathi or '')
+        if key is None:
+            logger.warning(f"⚠️ Crop calendar variety '{crop_variety.name}' matches no known variety")
+            continue
+        variety_ids[key] = crop_variety.id
+        variety_names[key] = (crop_variety.name, crop_variety.name_marathi or crop_variety.name)
+
+    entries = {}
+    day_ranges = (
+        DayRange.objects
+        .select_related('activity')
+        .prefetch_related(Prefetch('products', queryset=DayRangeProduct.objects.select_related('product').order_by('id')))
+        .order_by('id')
+    )
+    for day_range in day_ranges:
+        entries.setdefault(day_range.crop_variety_id, []).append(CalendarEntry(day_range))
+
+    schedules = {crop_variety_id: VarietySchedule(items) for crop_variety_id, items in entries.items()}
+    return CalendarIndex(schedules, variety_ids, variety_names, version, loaded_at=time.monotonic())
+
+
+def _version():
+    try:
+        return cache.get(VERSION_KEY)
+    except Exception as e:
+        logger.warning(f"⚠️ Crop calendar version unavailable: {e}")
+        return None
+
+
+def invalidate():
+    """Calendar rows changed: every worker reloads on its next version check"""
+    global _checked_at
+    try:
+        cache.add(VERSION_KEY, 0, timeout=None)
+        cache.incr(VERSION_KEY)
+    except Exception as e:
+        logger.warning(f"⚠️ Crop calendar version unavailable: {e}")
+    _checked_at = 0.0
+
+
+_index = CalendarIndex()
+_index_lock = threading.Lock()
+_checked_at = 0.0
+
+
+def get_index():
+    """
+    The worker's index. Loaded once, then reloaded only when the shared
+    version moved (checked every VERSION_CHECK_SECONDS) or, for edits made
+    outside this app, after CROP_CALENDAR_REFRESH_SECONDS.
+    """
+    global _index, _checked_at
+    now = time.monotonic()
+    if _index.loaded_at and now - _checked_at < VERSION_CHECK_SECONDS:
+        return _index
+    with _index_lock:
+        if _index.loaded_at and now - _checked_at < VERSION_CHECK_SECONDS:
+            return _index
+        version = _version()
+        stale = now - _index.loaded_at >= CROP_CALENDAR_REFRESH_SECONDS
+        if not _index.loaded_at or version != _index.version or stale:
+            try:
+                _index = load_index(version)
+                logger.info(f"📅 Crop calendar loaded: {len(_index)} day ranges, varieties {sorted(_index.variety_ids)}")
+            except Exception as e:
+                logger.error(f"❌ Could not load crop calendar: {e}")
+                # Keep serving what we had; retry after the next refresh interval
+                _index = CalendarIndex(_index.schedules, _index.variety_ids, _index.variety_names,
+                                       version, loaded_at=time.monotonic())
+        _checked_at = now
+    return _index
+
+
+def days_since_pruning(text, today=None):
+    """Days since the pruning date in "छाटणी 5 oct ला केली" (normalize()d), or None"""
+    dates = DATE_RE.findall(text)
+    if not dates or not PRUNING_RE.search(text):
+        return None
+    day, month = dates[-1]
+    today = today or timezone.localdate()
+    try:
+        pruned = today.replace(month=MONTH_ORDER.index(MONTHS[month]) + 1, day=int(day))
+        if pruned > today:
+            pruned = pruned.replace(year=today.year - 1)
+    except ValueError:  # 31 feb
+        return None
+    return (today - pruned).days
+
+
+def asks_schedule(text, intent=None):
+    """The message itself asks what to spray / apply (not just a number of days)"""
+    if intent is not None and SCHEDULE_SERVICES & set(intent.services):
+        return True
+    return bool(SCHEDULE_RE.search(intent.text if intent is not None else text.lower()))
+
+
+def _day_match(text):
+    """First "N days" / "day N" that names a day, skipping spans ("next 14 days")"""
+    for regex in (NUMBER_DAY_RE, DAY_NUMBER_RE):
+        for match in regex.finditer(text):
+            if not SPAN_BEFORE_DAYS_RE.search(text[:match.start()]):
+                return match
+    return None
+
+
+def detect_day(text, today=None):
+    """Day after pruning the message asks about ("45 divsala", "day 45", a pruning date)"""
+    text = remove_varieties(text)
+    match = _day_match(text)
+    if match:
+        day = int(match.group(1))
+        if PRUNING_RE.search(text) and BEFORE_PRUNING_RE.search(text):
+            day = -day
+    elif NUMBER_DAY_RE.search(text) or DAY_NUMBER_RE.search(text):
+        return None  # only spans ("next 14 days"): a duration, not a day
+    else:
+        day = days_since_pruning(text, today)
+    if day is None or abs(day) > MAX_DAY:
+        return None
+    return day
+
+
+def _format_dosage(dosage, unit, language):
+    amount = f"{dosage.normalize():f}" if dosage is not None else ''
+    if language != 'en':
+        unit = DOSAGE_UNITS_DEVANAGARI.get(unit, unit)
+    return f"{amount} {unit}".strip()
+
+
+def _day_label(day, language):
+    labels = LABELS[language]
+    return labels['before'].format(day=-day) if day < 0 else labels['after'].format(day=day)
+
+
+def format_answer(variety_name, day, match_type, entries, language):
+    """WhatsApp-ready schedule answer; Marathi data for Devanagari chats"""
+    language = language if language in LABELS else 'en'
+    english = language == 'en'
+
+    lines = [f"🍇 *{variety_name}* - {_day_label(day, language)}"]
+    if match_type == MATCH_NEAREST:
+        lines.append(LABELS[language]['nearest'])
+
+    for entry in entries:
+        activity = entry.activity if english else (entry.activity_marathi or entry.activity)
+        heading = f"\n📅 *{activity}*"
+        if match_type == MATCH_NEAREST or entry.start_day != entry.end_day:
+            days = _day_label(entry.start_day, language)
+            if entry.start_day != entry.end_day:
+                days = f"{days} - {entry.end_day}"
+            heading += f" ({days})"
+        lines.append(heading)
+        for name, name_marathi, dosage, unit in entry.products:
+            product = name if english else (name_marathi or name)
+            lines.append(f"• {product} - {_format_dosage(dosage, unit, language)}")
+        info = entry.info if english else (entry.info_marathi or entry.info)
+        if info:
+            lines.append(f"ℹ️ {info}")
+
+    if any(entry.products for entry in entries):
+        lines.append(f"\n{SPRAY_DISCLAIMER}")
+    return '\n'.join(lines)
+
+
+def entry_summary(entry, language):
+    """One line per entry ("फवारणी: X 2 मिली/लिटर, Y ...") - template parameters can't hold newlines"""
+    language = language if language in LABELS else 'en'
+    english = language == 'en'
+    activity = entry.activity if english else (entry.activity_marathi or entry.activity)
+    products = ', '.join(
+        f"{name if english else (name_marathi or name)} {_format_dosage(dosage, unit, language)}"
+        for name, name_marathi, dosage, unit in entry.products
+    )
+    info = entry.info if english else (entry.info_marathi or entry.info)
+    return f"{activity}: {products or info}" if products or info else activity
+
+
+def schedule_answer(text, language, variety=None, intent=None, today=None):
+    """
+    Formatted schedule for the variety + day the message asks about, or None
+    (not a schedule question, no variety/day, or nothing in the calendar for it).
+    variety: reply.varieties key, e.g. from the earlier conversation.
+    """
+    # "45 दिवस झाले, पाने पिवळी" is a problem to diagnose and "10 मजूर फवारणीसाठी"
+    # a booking - neither is a schedule lookup; nor is "pani 3 divas zale nahi"
+    if intent is not None and {'disease', 'labor'} & set(intent.services):
+        return None
+    if not asks_schedule(text, intent):
+        return None
+    variety = variety or detect_variety(text)
+    if not variety:
+        return None
+    day = detect_day(text, today)
+    if day is None:
+        return None
+
+    index = get_index()
+    match_type, entries = index.lookup(variety, day)
+    entries = [entry for entry in entries if entry.is_useful()]
+    if not entries:
+        logger.info(f"📅 No calendar entry for variety {variety}, day {day}")
+        return None
+
+    name, name_marathi = index.variety_names[variety]
+    logger.info(f"📅 Calendar answer: variety {variety}, day {day} ({match_type}, {len(entries)} entries)")
+    return format_answer(name if language == 'en' else name_marathi, day, match_type, entries, language)
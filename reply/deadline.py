@@ -0,0 +1,117 @@
+"""
+Per-message time budget, passed down the reply pipeline.
+
+_generate_and_send starts a Deadline; every network call below it (quota
+wait, embed, LLM, WhatsApp send) takes its timeout from what is left, and
+generate_reply drops the optional work (RAG, long history) once the budget
+runs low. hedged() fires a duplicate request when the first one is slower
+than the model's usual p95.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+REPLY_BUDGET_SECONDS = getattr(settings, 'REPLY_BUDGET_SECONDS', 25)
+# Below this much budget skip RAG (embed + a longer prompt)
+RAG_MIN_SECONDS = getattr(settings, 'REPLY_RAG_MIN_SECONDS', 10)
+# Below this much budget send only the last couple of turns
+FULL_HISTORY_MIN_SECONDS = getattr(settings, 'REPLY_FULL_HISTORY_MIN_SECONDS', 6)
+SHORT_HISTORY_TURNS = 2
+# Sending the answer always gets at least this long, even past the budget
+MIN_SEND_SECONDS = 3
+
+HEDGE_WORKERS = 8
+PRIMARY_WORKERS = 32
+# Primaries and hedges use separate pools so slow losers never delay a new primary
+_primary_pool = ThreadPoolExecutor(max_workers=PRIMARY_WORKERS, thread_name_prefix='gemini-call')
+_hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix='gemini-hedge')
+# A hedge is only sent if it can start right away, not queue behind stuck ones
+_hedge_slots = threading.BoundedSemaphore(HEDGE_WORKERS)
+
+
+class DeadlineExceeded(Exception):
+    """The message's time budget ran out"""
+
+
+class Deadline:
+    def __init__(self, seconds=None, since=None):
+        """since: wall-clock time (time.time()) the budget started at, if not now"""
+        self.budget = seconds or REPLY_BUDGET_SECONDS
+        self.started = time.monotonic()
+        if since is not None:
+            self.started -= max(0.0, time.time() - since)
+        self.expires = self.started + self.budget
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, cap=None, floor=0.0):
+        """Timeout for one call: what's left, capped, but at least floor"""
+        seconds = self.remaining()
+        if cap is not None:
+            seconds = min(seconds, cap)
+        return max(seconds, floor)
+
+    def check(self, what='reply'):
+        if self.expired():
+            raise DeadlineExceeded(f"{what}: {self.budget}s budget used up")
+
+    def __repr__(self):
+        return f"<Deadline {self.remaining():.1f}s of {self.budget}s left>"
+
+
+def _submit_hedge(call):
+    """The hedge's future, or None when HEDGE_WORKERS hedges are already out"""
+    if not _hedge_slots.acquire(blocking=False):
+        return None
+    future = _hedge_pool.submit(call)
+    future.add_done_callback(lambda _: _hedge_slots.release())
+    return future
+
+
+def hedged(call, hedge_after, deadline, label=''):
+    """
+    Run call(); if it hasn't answered after hedge_after seconds, start a
+    second identical call and return whichever succeeds first. A loser that
+    has not started yet is cancelled; one already running finishes in the
+    background and is ignored.
+    """
+    if hedge_after is None or deadline.remaining() < hedge_after * 2:
+        return call()
+
+    futures = [_primary_pool.submit(call)]
+    done, _ = wait(futures, timeout=hedge_after)
+    if not done:
+        hedge = _submit_hedge(call)
+        if hedge is None:
+            logger.info(f"🏇 Not hedging {label}: {HEDGE_WORKERS} hedges already running")
+        else:
+            logger.info(f"🏇 Hedging {label} after {hedge_after:.1f}s")
+            futures.append(hedge)
+
+    first_error = None
+    pending = set(futures)
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded(f"{label}: no answer within the budget")
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                first_error = first_error or future.exception()
+        raise first_error
+    finally:
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,209 @@
+"""
+Escalation strikes and blocks.
+
+When Gemini answers [ESCALATE] the conversation gets a strike: the first
+one inside the decay window earns a polite redirect, the next one a 24h
+block. Strike timestamps live in a Redis sorted set per conversation,
+pruned, added to and counted in one MULTI/EXEC, so concurrent escalations
+never lose a strike. They are mirrored to Conversation.escalation_strikes /
+last_strike_at, which reseed the set if Redis lost it and count the strikes
+(atomically, in the DB) while the cache is unreachable. Without django-redis
+the plain cache API is used instead (read-modify-write, fine for a single
+process).
+
+A block is a cache key with a TTL, so expiry needs no write; the
+WhatsAppUser is_blocked / blocked_until fields are a mirror for the admin,
+for restoring a block Redis lost, and for checking blocks while the cache
+is down.
+"""
+import logging
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from . import identity
+from .models import Conversation, WhatsAppUser
+
+logger = logging.getLogger(__name__)
+
+# Strikes older than this no longer count
+ESCALATION_STRIKE_WINDOW_SECONDS = getattr(settings, 'ESCALATION_STRIKE_WINDOW_SECONDS', 3 * 24 * 3600)
+ESCALATION_BLOCK_SECONDS = getattr(settings, 'ESCALATION_BLOCK_SECONDS', 24 * 3600)
+STRIKES_BEFORE_BLOCK = 2
+
+_client = None
+_client_lock = threading.Lock()
+_unavailable = False
+
+
+def _redis():
+    """Shared raw Redis client, or None (plain cache API) without django-redis"""
+    global _client, _unavailable
+    if _client is None and not _unavailable:
+        with _client_lock:
+            if _client is None and not _unavailable:
+                try:
+                    from django_redis import get_redis_connection
+                    _client = get_redis_connection('default')
+                except Exception as e:
+                    _unavailable = True
+                    logger.warning(f"⚠️ Escalation strikes without Redis sorted sets: {e}")
+    return _client
+
+
+def _strikes_key(conversation_id):
+    return f'escalation_strikes:{conversation_id}'
+
+
+def _block_key(user_id):
+    return f'escalation_block:{user_id}'
+
+
+def _seed_strikes(conversation, now):
+    """Strikes from the DB mirror, for when the cache has none"""
+    if not conversation.last_strike_at or not conversation.escalation_strikes:
+        return []
+    at = conversation.last_strike_at.timestamp()
+    if now - at > ESCALATION_STRIKE_WINDOW_SECONDS:
+        return []
+    return [at] * conversation.escalation_strikes
+
+
+def _cached_strikes(conversation_id, now):
+    """Strike timestamps in the cache, or None if it has none"""
+    client = _redis()
+    if client is not None:
+        key = cache.make_key(_strikes_key(conversation_id))
+        found = client.zrangebyscore(key, now - ESCALATION_STRIKE_WINDOW_SECONDS, '+inf', withscores=True)
+        return [at for _, at in found] or None
+    return cache.get(_strikes_key(conversation_id))
+
+
+def strikes(conversation, now=None):
+    """Strike timestamps still inside the decay window"""
+    now = now or time.time()
+    try:
+        found = _cached_strikes(conversation.id, now)
+    except Exception as e:
+        logger.warning(f"⚠️ Strike cache unavailable, using the DB mirror: {e}")
+        found = None
+    if found is None:
+        found = _seed_strikes(conversation, now)
+    return [at for at in found if now - at <= ESCALATION_STRIKE_WINDOW_SECONDS]
+
+
+def _add_strike(conversation, now):
+    """Add a strike in the cache; returns how many are inside the window"""
+    client = _redis()
+    if client is None:
+        current = [at for at in (_cached_strikes(conversation.id, now) or _seed_strikes(conversation, now))
+                   if now - at <= ESCALATION_STRIKE_WINDOW_SECONDS] + [now]
+        cache.set(_strikes_key(conversation.id), current, timeout=ESCALATION_STRIKE_WINDOW_SECONDS)
+        return len(current)
+
+    key = cache.make_key(_strikes_key(conversation.id))
+    pipe = client.pipeline()  # MULTI / EXEC
+    pipe.zremrangebyscore(key, '-inf', now - ESCALATION_STRIKE_WINDOW_SECONDS)
+    pipe.zcard(key)
+    pipe.zadd(key, {f'{now}:{uuid.uuid4().hex[:8]}': now})
+    pipe.zcard(key)
+    pipe.expire(key, ESCALATION_STRIKE_WINDOW_SECONDS)
+    _, before, _, count, _ = pipe.execute()
+    if before == 0:
+        # A new set: put back the strikes the DB mirror says Redis lost
+        seeds = _seed_strikes(conversation, now)
+        if seeds:
+            client.zadd(key, {f'seed:{i}': at for i, at in enumerate(seeds)})
+            count += len(seeds)
+    return count
+
+
+def _record_strike_in_db(conversation):
+    """Count the strike on the DB mirror alone (one atomic UPDATE); returns the count"""
+    window_start = timezone.now() - timedelta(seconds=ESCALATION_STRIKE_WINDOW_SECONDS)
+    rows = Conversation.objects.filter(id=conversation.id)
+    rows.update(
+        escalation_strikes=Case(When(last_strike_at__gte=window_start, then=F('escalation_strikes') + 1),
+                                default=Value(1)),
+        last_strike_at=timezone.now(),
+    )
+    return rows.values_list('escalation_strikes', flat=True).first() or 1
+
+
+def record_strike(conversation):
+    """Add a strike; returns how many the conversation has inside the window"""
+    try:
+        count = _add_strike(conversation, time.time())
+    except Exception as e:
+        logger.warning(f"⚠️ Strike cache unavailable, counting in the DB: {e}")
+        count = _record_strike_in_db(conversation)
+    else:
+        Conversation.objects.filter(id=conversation.id).update(
+            escalation_strikes=count, last_strike_at=timezone.now(),
+        )
+    conversation.escalation_strikes = count
+    logger.info(f"⚠️ Escalation strike {count} for conversation {conversation.id}")
+    return count
+
+
+def clear_strikes(conversation):
+    try:
+        cache.delete(_strikes_key(conversation.id))  # same key for the raw client (make_key)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not clear the strikes of conversation {conversation.id}: {e}")
+    Conversation.objects.filter(id=conversation.id).update(escalation_strikes=0)
+    conversation.escalation_strikes = 0
+
+
+def should_block(strike_count):
+    return strike_count >= STRIKES_BEFORE_BLOCK
+
+
+def block(whatsapp_user, conversation, seconds=ESCALATION_BLOCK_SECONDS):
+    """Block for seconds; the strikes start over once it runs out"""
+    try:
+        cache.set(_block_key(whatsapp_user.id), 1, timeout=seconds)
+    except Exception as e:
+        logger.warning(f"⚠️ Block cache unavailable, the DB mirror holds the block: {e}")
+    blocked_until = timezone.now() + timedelta(seconds=seconds)
+    WhatsAppUser.objects.filter(id=whatsapp_user.id).update(is_blocked=True, blocked_until=blocked_until)
+    whatsapp_user.is_blocked, whatsapp_user.blocked_until = True, blocked_until
+    identity.invalidate(whatsapp_user.id, whatsapp_user.phone_number)
+    clear_strikes(conversation)
+    logger.warning(f"🚫 User {whatsapp_user.phone_number} blocked for {seconds // 3600}h")
+
+
+def _mirror_blocked(whatsapp_user):
+    """Blocked according to the is_blocked / blocked_until mirror"""
+    return bool(whatsapp_user.is_blocked and whatsapp_user.blocked_until
+                and whatsapp_user.blocked_until > timezone.now())
+
+
+def is_blocked(whatsapp_user):
+    """One cache read per message; the DB mirror is only consulted when it says blocked"""
+    try:
+        if cache.get(_block_key(whatsapp_user.id)):
+            return True
+    except Exception as e:
+        logger.warning(f"⚠️ Block cache unavailable, using the DB mirror: {e}")
+        return _mirror_blocked(whatsapp_user)
+    if not whatsapp_user.is_blocked:
+        return False
+    remaining = (whatsapp_user.blocked_until - timezone.now()).total_seconds() if whatsapp_user.blocked_until else 0
+    if remaining > 0:
+        # The cache lost the key: restore it for the time left
+        try:
+            cache.set(_block_key(whatsapp_user.id), 1, timeout=int(remaining) + 1)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not restore the block of {whatsapp_user.phone_number}: {e}")
+        return True
+    WhatsAppUser.objects.filter(id=whatsapp_user.id).update(is_blocked=False, blocked_until=None)
+    whatsapp_user.is_blocked, whatsapp_user.blocked_until = False, None
+    identity.invalidate(whatsapp_user.id, whatsapp_user.phone_number)
+    return False
@@ -1,13 +1,29 @@
 import google.generativeai as genai
 from django.conf import settings
 import logging
-import json
 import numpy as np
-import os
-import re
+import threading
+import time
+
+from . import quota, telemetry
+from .deadline import (FULL_HISTORY_MIN_SECONDS, RAG_MIN_SECONDS, SHORT_HISTORY_TURNS, Deadline,
+                       DeadlineExceeded, hedged)
+from .model_router import router as model_router
+from .intents import classify, mentions_product
+from .knowledge_store import EMPTY_INDEX, KnowledgeBaseWatcher, load_current_index
+from .crop_calendar import asks_schedule, schedule_answer
+from .responses import ACK, FOLLOW_UP_LABOR, GREETING, SPRAY_DISCLAIMER, canned_reply
+from .slots import is_labor_topic, slots_from_history
+from .varieties import detect_variety
 
 logger = logging.getLogger(__name__)
 
+EMBED_TIMEOUT_SECONDS = 5
+# A follow-up only gets the labor update if a labor message is this recent
+LABOR_FOLLOW_UP_TURNS = 4
+# Duplicate a live LLM request once it runs past the model's p95 (reply.deadline.hedged)
+HEDGE_REQUESTS = getattr(settings, 'GEMINI_HEDGE_REQUESTS', True)
+
 # --- FINAL System Prompt (v7: Natural, Business-Aware, Smart) ---
 SYSTEM_PROMPT = """
 You are a helpful WhatsApp assistant for an agriculture company. Talk naturally like a helpful friend.
@@ -168,214 +184,206 @@ Reply: "मैं सिर्फ खेती और मजूर की मद
 9. Keep it SHORT and helpful
 """
 
-# --- Keywords (Optimized) ---
-GREETING_WORDS = {
-    'hello', 'hi', 'hey', 'namaste', 'नमस्ते', 'namaskar', 'नमस्कार',
-    'good morning', 'good evening', 'सुप्रभात', 'शुभ संध्या'
-}
-
-ACK_WORDS = {
-    'ok', 'okay', 'okk', 'k', 'thanks', 'thank you', 'धन्यवाद', 'धन्यवाद',
-    'ठीक', 'ठीक आहे', 'accha', 'अच्छा', 'बरं', 'yes', 'ha', 'हा', 'ji', 'जी'
-}
-
-FOLLOW_UP_WORDS = {
-    'update', 'any update', 'status', 'kya hua', 'what happened',
-    'अपडेट', 'काय झालं', 'काय झाले', 'कोई खबर', 'koi khabar'
-}
-
-LABOR_KEYWORDS = {
-    'labor', 'labour', 'majur', 'mazdoor', 'kamgar', 'worker', 'workers',
-    'मजूर', 'मजदूर', 'कामगार', 'काम', 'chatni', 'चटणी',
-    'pruning', 'कटाई', 'harvesting', 'spraying', 'फवारणी'
-}
-    # ✅ More specific spam detection
-SPAM_KEYWORDS = {
-    'test123', 'testing', 'asdfgh', 'xyz123',  # Actual spam
-    'joke', 'song', 'video game', 'movie ticket',  # Entertainment
-    'cricket score', 'ipl', 'match',  # Sports
-    'paytm offer', 'bank loan', 'credit card'  # Finance spam
-}
-
-
 class GeminiService:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, watch_knowledge_base=True):
         self.api_key = api_key or settings.GEMINI_API_KEY
         genai.configure(api_key=self.api_key)
         
-        self.llm_model_name = "gemini-2.0-flash-exp"
         self.embedding_model_name = "text-embedding-004"
         
-        # ✅ Create ONE model instance - reuse for all chats
+        # ✅ ONE model instance per model name - reuse for all chats.
+        # Which model serves which path is decided by reply.model_router.
         # DON'T format system prompt here - we'll do it per-user
-        self.llm = genai.GenerativeModel(
-            self.llm_model_name,
-            system_instruction=SYSTEM_PROMPT  # Keep placeholder
-        )
+        self._models = {}
+        self._models_lock = threading.Lock()
         
-        self.db_chunks = []
-        self.db_vectors = None
+        # Swapped as a whole by KnowledgeBaseWatcher - never mutate in place
+        self.kb = EMPTY_INDEX
         self.load_vector_database()
+        
+        self.kb_watcher = None
+        if watch_knowledge_base:
+            self.kb_watcher = KnowledgeBaseWatcher(self)
+            self.kb_watcher.start()
 
     def load_vector_database(self):
-        """Loads vector database into memory"""
-        db_path = os.path.join(settings.BASE_DIR, 'vector_database.json')
+        """Loads the current knowledge base snapshot into memory"""
         try:
-            with open(db_path, 'r', encoding='utf-8') as f:
-                self.db_chunks = json.load(f)
-            
-            self.db_vectors = np.array([chunk['vector'] for chunk in self.db_chunks])
-            norms = np.linalg.norm(self.db_vectors, axis=1, keepdims=True)
-            self.db_vectors = self.db_vectors / norms
-            
-            logger.info(f"✅ Loaded {len(self.db_chunks)} vectors")
+            self.kb = load_current_index()
+            logger.info(
+                f"✅ Loaded {len(self.kb)} vectors, version {self.kb.version} "
+                f"({len(self.kb.partitions)} variety partitions)"
+            )
         except FileNotFoundError:
-            logger.error(f"❌ vector_database.json not found at {db_path}")
-            self.db_chunks = []
-            self.db_vectors = None
+            logger.error("❌ No knowledge base snapshot and no local vector_database.json")
+            self.kb = EMPTY_INDEX
         except Exception as e:
             logger.error(f"❌ Error loading vectors: {e}")
-            self.db_chunks = []
-            self.db_vectors = None
+            self.kb = EMPTY_INDEX
 
-    def _embed(self, text, task_type="RETRIEVAL_QUERY"):
+    def _embed(self, text, task_type="RETRIEVAL_QUERY", path=telemetry.PATH_RAG, user_id=None, deadline=None):
         """Helper to embed text"""
+        deadline = deadline or Deadline()
+        started = time.monotonic()
         try:
-            result = genai.embed_content(
-                model=self.embedding_model_name,
-                content=text,
-                task_type=task_type
+            result, waited = quota.limiter.run(
+                lambda: genai.embed_content(
+                    model=self.embedding_model_name,
+                    content=text,
+                    task_type=task_type,
+                    request_options={'timeout': deadline.timeout(cap=EMBED_TIMEOUT_SECONDS, floor=1)},
+                ),
+                priority=quota.priority_for(path),
+                estimated_tokens=quota.estimate_tokens(text, expected_output=0),
+                timeout=deadline.timeout(cap=quota.limiter.deadline_seconds, floor=0.1),
+                prompt=text,
             )
+            tokens_in, _ = telemetry.extract_usage(result, text)
+            telemetry.usage.record(path, self.embedding_model_name, (time.monotonic() - started - waited) * 1000,
+                                   tokens_in, 0, call_type='embed', user_id=user_id)
             return result['embedding']
         except Exception as e:
             logger.error(f"Embedding error: {e}")
+            telemetry.usage.record(path, self.embedding_model_name, (time.monotonic() - started) * 1000,
+                                   call_type='embed', user_id=user_id, error=True)
             return None
 
-    def search_knowledge_base(self, query, top_k=5):
-        """Semantic search in vector database"""
-        if self.db_vectors is None or len(self.db_vectors) == 0:
+    def _model(self, name):
+        """Shared GenerativeModel per model name"""
+        if name not in self._models:
+            with self._models_lock:
+                if name not in self._models:
+                    self._models[name] = genai.GenerativeModel(
+                        name,
+                        system_instruction=SYSTEM_PROMPT  # Keep placeholder
+                    )
+        return self._models[name]
+
+    def _call_model(self, model_name, prompt, path, user_id, failover, deadline, retry_rate_limited):
+        """One limiter-guarded round trip on one model; records telemetry + router stats"""
+        started = time.monotonic()
+        try:
+            response, waited = quota.limiter.run(
+                lambda: self._model(model_name).start_chat(history=[]).send_message(
+                    prompt, request_options={'timeout': deadline.timeout(floor=1)}
+                ),
+                priority=quota.priority_for(path),
+                estimated_tokens=quota.estimate_tokens(prompt),
+                timeout=deadline.timeout(cap=quota.limiter.deadline_seconds, floor=0.1),
+                retry_rate_limited=retry_rate_limited,
+                prompt=prompt,
+            )
+        except DeadlineExceeded:
+            raise
+        except Exception:
+            latency_ms = (time.monotonic() - started) * 1000
+            model_router.observe(model_name, latency_ms, error=True)
+            telemetry.usage.record(path, model_name, latency_ms, user_id=user_id, error=True, failover=failover)
+            raise
+        
+        # Model latency only - time spent queuing for a slot is logged by the limiter
+        latency_ms = (time.monotonic() - started - waited) * 1000
+        model_router.observe(model_name, latency_ms)
+        tokens_in, tokens_out = telemetry.extract_usage(response, prompt)
+        telemetry.usage.record(path, model_name, latency_ms, tokens_in, tokens_out,
+                               user_id=user_id, failover=failover)
+        logger.info(
+            f"📊 API Call: {path} | {model_name}{' (failover)' if failover else ''} | "
+            f"In: {tokens_in}t | Out: {tokens_out}t | {latency_ms:.0f}ms"
+        )
+        return response.text.strip()
+
+    def _generate(self, prompt, path, user_id=None, deadline=None):
+        """
+        One LLM answer on the model reply.model_router picks for this path,
+        through the cluster-wide limiter (reply.quota), within `deadline`.
+        Falls over to the next model on errors / 429s; live paths send a
+        hedged duplicate when the model is slower than its usual p95.
+        """
+        deadline = deadline or Deadline()
+        candidates = model_router.candidates(path)
+        
+        for attempt, (model_name, failover) in enumerate(candidates):
+            last = attempt == len(candidates) - 1
+            deadline.check(path)
+            
+            # Bound now: a hedge loser may still run after the loop moved on
+            def call(model_name=model_name, failover=failover, last=last):
+                return self._call_model(model_name, prompt, path, user_id, failover, deadline, last)
+            
+            hedge_after = None
+            if HEDGE_REQUESTS and quota.priority_for(path) == quota.PRIORITY_LIVE:
+                hedge_after = model_router.hedge_delay(model_name)
+            try:
+                return hedged(call, hedge_after, deadline, label=f"{path}/{model_name}")
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                if quota.is_rate_limit_error(e):
+                    model_router.mark_rate_limited(model_name)
+                if last:
+                    raise
+                logger.warning(f"🔀 {path}: {model_name} failed ({e}), trying {candidates[attempt + 1][0]}")
+
+    def search_knowledge_base(self, query, top_k=5, variety=None, user_id=None, deadline=None):
+        """
+        Semantic search in vector database.
+        If the query (or caller) names a grape variety, only that variety's
+        chunks + shared chunks are scored.
+        """
+        kb = self.kb  # one reference for the whole search (hot reload safe)
+        if len(kb) == 0:
             return ""
 
-        query_vector = self._embed(query, task_type="RETRIEVAL_QUERY")
+        query_vector = self._embed(query, task_type="RETRIEVAL_QUERY", user_id=user_id, deadline=deadline)
         if query_vector is None:
             return ""
 
-        query_vector = np.array(query_vector)
+        query_vector = np.array(query_vector, dtype=np.float32)
         query_vector = query_vector / np.linalg.norm(query_vector)
 
-        # Cosine similarity
-        scores = np.dot(self.db_vectors, query_vector)
-        top_k_indices = np.argsort(scores)[-top_k:][::-1]
+        variety = variety or detect_variety(query)
+        if variety in kb.partitions:
+            indices, vectors = kb.partitions[variety]
+        else:
+            indices, vectors = None, kb.vectors
+
+        # Cosine similarity - argpartition avoids sorting the whole corpus
+        scores = np.dot(vectors, query_vector)
+        top_k = min(top_k, len(scores))
+        best = np.argpartition(scores, -top_k)[-top_k:]
+        best = best[np.argsort(scores[best])[::-1]]
+        if indices is not None:
+            best = indices[best]
 
         context = ""
-        for i in top_k_indices:
-            chunk = self.db_chunks[i]
+        for i in best:
+            chunk = kb.chunks[i]
             context += f"📄 {chunk['source']} ({chunk['type']}): {chunk['content']}\n---\n"
         
-        logger.info(f"🔍 RAG: Found {top_k} chunks for query: '{query[:50]}...'")
+        logger.info(f"🔍 RAG: Found {top_k} chunks (variety: {variety or 'all'}) for query: '{query[:50]}...'")
         return context
 
-    # --- Helper Functions ---
-    def _is_match(self, text, word_set):
-        """Check if text matches any word in set"""
-        lowered = text.strip().lower()
-        
-        # Direct match
-        if lowered in word_set:
-            return True
-        
-        # Partial match for multi-word phrases
-        for word in word_set:
-            if ' ' in word and word in lowered:
-                return True
-        
-        return False
-
-
-
-    def _is_spam(self, text):
-        """Improved spam detection - avoids false positives"""
-        lowered = text.strip().lower()
-        
-        # Updated spam keywords (more specific)
-        SPECIFIC_SPAM = {
-            'test123', 'testing123', 'asdfgh', 'qwerty', 'xyz123',
-            'joke', 'funny', 'meme', 'song lyrics', 'video game',
-            'cricket score', 'ipl', 'match prediction',
-            'movie ticket', 'film', 'entertainment',
-            'paytm offer', 'bank loan', 'credit card offer',
-            'win prize', 'lottery', 'free gift'
-        }
-        
-        # Check spam keywords
-        for spam_word in SPECIFIC_SPAM:
-            if spam_word in lowered:
-                return True
-        
-        # Too short (but allow common words)
-        if len(lowered) < 2 and lowered not in ['hi', 'ok', 'no', 'ha', 'ji']:
+    def _detect_conversation_variety(self, user_message, history):
+        """Variety named in this message, else the latest one the user named"""
+        variety = detect_variety(user_message)
+        if variety:
+            return variety
+        for msg in reversed(history[-6:]):
+            if msg['role'] == 'user':
+                variety = detect_variety(msg['parts'][0])
+                if variety:
+                    return variety
+        return None
+
+    def _recent_labor(self, intent, history):
+        """Labor talk in this message or one of the user's last few turns"""
+        if is_labor_topic(intent):
             return True
-        
-        # Gibberish detection (no vowels in long words)
-        if len(lowered) > 6:
-            vowels = sum(1 for c in lowered if c in 'aeiouआएइईउऊओऔ')
-            if vowels == 0:
-                return True
-        
-        # Random characters (no alphabets)
-        if len(lowered) > 3:
-            alpha_chars = sum(1 for c in lowered if c.isalpha())
-            if alpha_chars == 0:
-                return True
-        
-        return False
-    def _is_labor_request(self, text):
-        """Check if message is labor-related"""
-        for keyword in LABOR_KEYWORDS:
-            if re.search(r'\b' + re.escape(keyword) + r'\b', text, re.IGNORECASE):
-                return True
-        return False
-    
-    def _extract_labor_info(self, history):
-        """Extract already-provided labor details from history"""
-        info = {
-            'task': None,
-            'count': None,
-            'date': None,
-            'location': None
-        }
-        
-        # Look through history for these details
-        full_conversation = " ".join([msg['parts'][0] for msg in history if msg['role'] == 'user'])
-        
-        # Task detection
-        tasks = ['pruning', 'कटाई', 'spraying', 'फवारणी', 'harvesting', 'चटणी', 'chatni']
-        for task in tasks:
-            if task.lower() in full_conversation.lower():
-                info['task'] = task
-                break
-        
-        # Number detection
-        numbers = re.findall(r'\b(\d+)\s*(worker|labour|labor|majur|मजूर)', full_conversation, re.IGNORECASE)
-        if numbers:
-            info['count'] = numbers[-1][0]  # Last mentioned number
-        
-        # Location detection
-        locations = ['satara', 'सातारा', 'pune', 'पुणे', 'nashik', 'नाशिक']
-        for loc in locations:
-            if loc.lower() in full_conversation.lower():
-                info['location'] = loc
-                break
-        
-        # Date detection (simple patterns)
-        dates = re.findall(r'\b(\d{1,2})\s*(dec|december|दिसंबर|jan|january)', full_conversation, re.IGNORECASE)
-        if dates:
-            info['date'] = f"{dates[-1][0]} {dates[-1][1]}"
-        
-        return info
-    
+        user_turns = [msg['parts'][0] for msg in history if msg['role'] == 'user']
+        return any(is_labor_topic(classify(text)) for text in user_turns[-LABOR_FOLLOW_UP_TURNS:])
 
-    def _get_simple_reply(self, history, user_message, user_lang, user_name):
+    def _get_simple_reply(self, history, user_message, user_lang, user_name, user_id=None, deadline=None):
         """Get simple reply without RAG - OPTIMIZED"""
         try:
             # Build minimal prompt
@@ -390,84 +398,90 @@ class GeminiService:
 
     Reply:"""
             
-            # Use pre-initialized model
-            chat = self.llm.start_chat(history=[])
-            response = chat.send_message(prompt)
-            reply = response.text.strip()
-            
-            # Log API usage
-            self._log_api_usage("Greeting", len(prompt.split()) * 1.3, len(reply.split()) * 1.3)
-            
-            return reply
+            return self._generate(prompt, telemetry.PATH_GREETING, user_id, deadline)
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"Simple reply error: {str(e)}")
             return "[ESCALATE]"
         
 
-    def generate_reply(self, history, user_message, user_lang, user_name):
+    def generate_reply(self, history, user_message, user_lang, user_name, user_id=None, summary='',
+                       intent=None, slots=None, deadline=None):
         """
         Main reply generation - OPTIMIZED VERSION
+        history: turns not yet covered by `summary` (see reply.memory)
+        intent: classify(user_message), if the caller already ran it
+        slots: the conversation's labor slots incl. this message (see reply.slots)
+        deadline: the message's time budget (see reply.deadline)
         """
-        lowered_message = user_message.strip().lower()
+        intent = intent or classify(user_message)
+        deadline = deadline or Deadline()
 
         # --- SPAM FILTER ---
-        if self._is_spam(lowered_message):
+        if intent.spam:
             logger.info(f"🗑️ SPAM detected: '{user_message}'")
             return "[IGNORE]"
 
-        # --- 1. GREETINGS (Simple Reply) ---
-        if self._is_match(lowered_message, GREETING_WORDS):
+        # --- 1. GREETINGS (catalog, NO API CALL unless enabled) ---
+        if intent.greeting:
             logger.info(f"👋 Greeting detected")
-            return self._get_simple_reply(history, user_message, user_lang, user_name)
+            if getattr(settings, 'GEMINI_LLM_GREETINGS', False):
+                return self._get_simple_reply(history, user_message, user_lang, user_name, user_id, deadline)
+            return canned_reply(GREETING, user_lang, user_name, user_id)
 
         # --- 2. ACKNOWLEDGMENTS (NO API CALL) ---
-        if self._is_match(lowered_message, ACK_WORDS):
+        if intent.ack:
             logger.info(f"✅ Acknowledgment detected")
-            
-            # Very short responses - NO API CALL
-            if user_lang == 'hi':
-                responses = ["स्वागत है! 🙏", "ठीक है! 👍", "बिल्कुल ✅"]
-            elif user_lang == 'mr':
-                responses = ["स्वागत आहे! 🙏", "ठीक आहे! 👍", "नक्की ✅"]
-            else:
-                responses = ["Welcome! 🙏", "Sure! 👍", "Great! ✅"]
-            
-            import random
-            return random.choice(responses)
+            return canned_reply(ACK, user_lang, user_name, user_id)
         
+        if slots is None:
+            slots = slots_from_history(history + [{"role": "user", "parts": [user_message]}])
+
+        # Running low on budget: keep the prompt small
+        if deadline.remaining() < FULL_HISTORY_MIN_SECONDS and len(history) > SHORT_HISTORY_TURNS:
+            logger.info(f"⏱️ {deadline!r} - trimming history to {SHORT_HISTORY_TURNS} turns")
+            history = history[-SHORT_HISTORY_TURNS:]
+
         # --- 3. FOLLOW-UPS (SMART CHECK) ---
-        if self._is_match(lowered_message, FOLLOW_UP_WORDS):
+        if intent.follow_up:
             logger.info(f"🔄 Follow-up detected")
             
-            # Check if this is about labor
-            labor_info = self._extract_labor_info(history)
-            
-            # If we have labor context, give specific update
-            if any(labor_info.values()):
-                if user_lang == 'hi':
-                    return "मैं आपके मजूर की request पर काम कर रहा हूँ। जल्द ही update मिलेगा 👍"
-                elif user_lang == 'mr':
-                    return "मी तुमच्या मजूर request वर काम करत आहे। लवकरच update मिळेल 👍"
-                else:
-                    return "I'm working on your labor request. Will update soon 👍"
+            # Only a recent labor request gets the labor update
+            if self._recent_labor(intent, history):
+                return canned_reply(FOLLOW_UP_LABOR, user_lang, user_name, user_id)
             
             # Otherwise, treat as normal query (fall through to RAG)
 
-        # --- 4. LABOR REQUESTS (OPTIMIZED) ---
-        if self._is_labor_request(lowered_message):
+        # --- 4. SCHEDULE LOOKUPS (crop calendar, NO API CALL) ---
+        # "variety X, day N - what to spray?" comes straight from the calendar tables.
+        # Checked before labor: "फवारणी" is also a labor task word.
+        # Only when THIS message asks what to spray; the variety may come from earlier turns
+        variety = None
+        if asks_schedule(user_message, intent):
+            variety = intent.variety or self._detect_conversation_variety(user_message, history)
+        if variety:
+            try:
+                answer = schedule_answer(user_message, user_lang, variety, intent)
+            except Exception as e:
+                logger.error(f"Crop calendar error: {e}", exc_info=True)
+                answer = None
+            if answer:
+                return answer
+
+        # --- 5. LABOR REQUESTS (OPTIMIZED) ---
+        if intent.labor:
             logger.info(f"👨‍🌾 Labor request detected")
             
-            # Extract what we already know
-            labor_info = self._extract_labor_info(history + [{"role": "user", "parts": [user_message]}])
-            
             # Build conversation history
-            history_formatted = self._format_history(history[-5:])
+            history_formatted = self._format_history(history, summary)
             
             # Build labor details text
-            labor_details = f"""- Task: {labor_info['task'] or 'Not mentioned'}
-    - Workers: {labor_info['count'] or 'Not mentioned'}
-    - Date: {labor_info['date'] or 'Not mentioned'}
-    - Location: {labor_info['location'] or 'Not mentioned'}"""
+            labor_details = f"""- Task: {slots['task'] or 'Not mentioned'}
+    - Workers: {slots['count'] or 'Not mentioned'}
+    - Date: {slots['date'] or 'Not mentioned'}
+    - Location: {slots['location'] or 'Not mentioned'}
+    - Farm size: {slots['farm_size'] or 'Not mentioned'}"""
             
             # Build MINIMAL prompt (no system instruction duplication)
             prompt = f"""Conversation:
@@ -480,7 +494,7 @@ class GeminiService:
 
     Instructions:
     - Reply in {user_lang}
-    - If all 4 details known: Confirm you're arranging it
+    - If task, workers, date and location are known: Confirm you're arranging it
     - If any missing: Ask ONLY for missing info (1 question max)
     - Keep SHORT (2 sentences max)
     - Use emojis: 👨‍🌾 📅 ✅
@@ -489,41 +503,32 @@ class GeminiService:
     Reply:"""
             
             try:
-                # Use pre-initialized model
-                chat = self.llm.start_chat(history=[])
-                response = chat.send_message(prompt)
-                reply = response.text.strip()
-                
-                # Log API usage
-                self._log_api_usage("Labor Query", len(prompt.split()) * 1.3, len(reply.split()) * 1.3)
-                
-                return reply
+                return self._generate(prompt, telemetry.PATH_LABOR, user_id, deadline)
+            except DeadlineExceeded:
+                raise
             except Exception as e:
                 logger.error(f"Labor flow error: {e}")
                 return "[ESCALATE]"
 
-        # --- 5. FARM/CROP QUERIES (OPTIMIZED RAG) ---
+        # --- 6. FARM/CROP QUERIES (OPTIMIZED RAG) ---
         logger.info(f"🌾 Farm query - Running RAG")
         
-        # Check if query is ACTUALLY about crops/sprays
-        crop_keywords = [
-            'spray', 'फवारणी', 'crop', 'फसल', 'फसलं', 'fertilizer', 'खाद', 
-            'pest', 'कीट', 'disease', 'रोग', 'बीमारी', 'product', 'उत्पाद',
-            'grape', 'अंगूर', 'द्राक्ष', 'powder', 'पावडर', 'chemical', 'रसायन'
-        ]
-        
-        is_crop_query = any(keyword in lowered_message for keyword in crop_keywords)
+        is_crop_query = intent.crop
         
-        # Only do RAG search if crop-related
-        if is_crop_query:
-            retrieved_context = self.search_knowledge_base(user_message, top_k=3)
+        # Only do RAG search if crop-related (and there's time for an embed + bigger prompt)
+        if is_crop_query and deadline.remaining() < RAG_MIN_SECONDS:
+            retrieved_context = ""
+            logger.info(f"⏭️ Skipping RAG: {deadline!r}")
+        elif is_crop_query:
+            retrieved_context = self.search_knowledge_base(user_message, top_k=3, variety=variety,
+                                                           user_id=user_id, deadline=deadline)
             logger.info("🔍 RAG Search: Found context for crop query")
         else:
             retrieved_context = ""
             logger.info("⏭️ Skipping RAG: Not a crop query")
         
         # Build conversation history
-        history_formatted = self._format_history(history[-15:])
+        history_formatted = self._format_history(history, summary)
         
         # Build knowledge base section
         kb_section = ""
@@ -531,7 +536,7 @@ class GeminiService:
             kb_section = f"\nKnowledge base:\n{retrieved_context}"
         
         # Build MINIMAL prompt
-        disclaimer_text = "(कृपया फवारणी करण्यापूर्वी तुमच्या प्लॉटची परिस्थिती आणि हवामान तपासून घ्या.)"
+        disclaimer_text = SPRAY_DISCLAIMER
         
         prompt = f"""Recent conversation:
     {history_formatted}
@@ -556,10 +561,7 @@ class GeminiService:
     Reply:"""
 
         try:
-            # Use pre-initialized model
-            chat = self.llm.start_chat(history=[])
-            response = chat.send_message(prompt)
-            reply = response.text.strip()
+            reply = self._generate(prompt, telemetry.PATH_RAG, user_id, deadline)
             
             # SAFETY CHECK: Remove disclaimer if not crop-related
             if not is_crop_query and disclaimer_text in reply:
@@ -567,40 +569,32 @@ class GeminiService:
                 logger.info("🧹 Removed incorrect disclaimer from non-crop query")
             
             # Also check if disclaimer is added without product name
-            product_names = [
-                'ranman', 'profiler', 'emamectin', 'score', 'ridomil', 
-                'mancozeb', 'carbendazim', 'imidacloprid', 'copper', 'sulphur'
-            ]
-            has_product = any(prod in reply.lower() for prod in product_names)
+            has_product = mentions_product(reply)
             
             if disclaimer_text in reply and not has_product:
                 reply = reply.replace(disclaimer_text, "").strip()
                 logger.info("🧹 Removed disclaimer - no product name mentioned")
             
-            # Log API usage
-            self._log_api_usage("RAG Query", len(prompt.split()) * 1.3, len(reply.split()) * 1.3)
-            
             logger.info(f"✅ RAG Reply: {reply[:100]}...")
             return reply
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"RAG error: {str(e)}", exc_info=True)
             return "[ESCALATE]"
         
-    def _format_history(self, messages):
-        """Format conversation history concisely"""
-        if not messages:
+    def _format_history(self, messages, summary=''):
+        """Format conversation history concisely: rolling summary + recent turns"""
+        if not messages and not summary:
             return "No previous conversation"
         
         formatted = []
+        if summary:
+            formatted.append(f"Summary of earlier chat: {summary}")
         for msg in messages:
             role = "User" if msg['role'] == 'user' else "Bot"
             content = msg['parts'][0][:100]
             formatted.append(f"{role}: {content}")
         
         return "\n".join(formatted)
-
-    def _log_api_usage(self, call_type, input_tokens, output_tokens):
-        """Track API usage for monitoring"""
-        total = int(input_tokens + output_tokens)
-        logger.info(f"📊 API Call: {call_type} | In: {int(input_tokens)}t | Out: {int(output_tokens)}t | Total: {total}t")
\ No newline at end of file
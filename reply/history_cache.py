@@ -0,0 +1,174 @@
+"""
+Recent-turn ring buffer per conversation.
+
+Every Message created (reply.signals) is appended, once its transaction
+commits, to a capped Redis list holding the conversation's last
+HISTORY_CACHE_TURNS turns as compact JSON ([epoch, direction, type, text]).
+The reply pipeline reads its prompt history from there; Postgres is only
+queried on a cold miss (buffer expired or never built), which rebuilds the
+buffer from the DB.
+
+Appends use RPUSHX, so they never create a buffer: a partial one would look
+like a short chat. Without django-redis the plain cache API is used instead
+(read-modify-write, fine for a single process).
+"""
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .memory import recent_history_queryset
+
+logger = logging.getLogger(__name__)
+
+# Enough for the unsummarized turns before a burst plus the burst itself
+HISTORY_CACHE_TURNS = getattr(settings, 'HISTORY_CACHE_TURNS', 24)
+HISTORY_CACHE_SECONDS = getattr(settings, 'HISTORY_CACHE_SECONDS', 2 * 24 * 3600)
+MAX_TEXT_CHARS = 2000
+# Turns that never go into a prompt
+SKIPPED_TYPES = ('document',)
+
+_client = None
+_client_lock = threading.Lock()
+_unavailable = False
+
+
+def _redis():
+    """Shared raw Redis client, or None (plain cache API) without django-redis"""
+    global _client, _unavailable
+    if _client is None and not _unavailable:
+        with _client_lock:
+            if _client is None and not _unavailable:
+                try:
+                    from django_redis import get_redis_connection
+                    _client = get_redis_connection('default')
+                except Exception as e:
+                    _unavailable = True
+                    logger.warning(f"⚠️ History cache without Redis lists: {e}")
+    return _client
+
+
+def _key(conversation_id):
+    return f'history:{conversation_id}'
+
+
+def _encode(message):
+    text = message.text_content or message.caption or f'[{message.message_type}]'
+    return json.dumps(
+        [message.timestamp.timestamp(), message.direction[0], message.message_type, text[:MAX_TEXT_CHARS]],
+        ensure_ascii=False, separators=(',', ':'),
+    )
+
+
+def _decode(raw):
+    if isinstance(raw, bytes):
+        raw = raw.decode('utf-8')
+    at, direction, message_type, text = json.loads(raw)
+    return at, direction, message_type, text
+
+
+def append(message):
+    """Add a new message to its conversation's buffer, if the buffer is warm"""
+    try:
+        _append(message)
+    except Exception as e:
+        # A buffer missing a turn would feed the LLM a wrong history: drop it
+        logger.warning(f"⚠️ History cache append failed, dropping buffer: {e}")
+        invalidate(message.conversation_id)
+
+
+def _append(message):
+    encoded = _encode(message)
+    client = _redis()
+    if client is not None:
+        key = cache.make_key(_key(message.conversation_id))
+        pipe = client.pipeline()
+        pipe.rpushx(key, encoded)
+        pipe.ltrim(key, -HISTORY_CACHE_TURNS, -1)
+        pipe.expire(key, HISTORY_CACHE_SECONDS)
+        pipe.execute()
+        return
+    turns = cache.get(_key(message.conversation_id))
+    if turns is not None:
+        cache.set(_key(message.conversation_id), (turns + [encoded])[-HISTORY_CACHE_TURNS:],
+                  timeout=HISTORY_CACHE_SECONDS)
+
+
+def invalidate(conversation_id):
+    try:
+        cache.delete(_key(conversation_id))  # same key for the raw client (make_key)
+    except Exception as e:
+        logger.error(f"❌ Could not drop history buffer {conversation_id}: {e}")
+
+
+def _read(conversation_id):
+    """Buffered turns oldest first, or None on a cold miss"""
+    client = _redis()
+    if client is not None:
+        raw = client.lrange(cache.make_key(_key(conversation_id)), 0, -1)
+        return [_decode(item) for item in raw] if raw else None
+    turns = cache.get(_key(conversation_id))
+    return [_decode(item) for item in turns] if turns else None
+
+
+def backfill(conversation):
+    """Rebuild the buffer from the DB (one query); returns the turns oldest first"""
+    messages = list(
+        conversation.messages.order_by('-timestamp')
+        .only('conversation_id', 'direction', 'text_content', 'caption', 'message_type', 'timestamp')
+        [:HISTORY_CACHE_TURNS]
+    )
+    encoded = [_encode(message) for message in reversed(messages)]
+    if encoded:
+        client = _redis()
+        if client is not None:
+            key = cache.make_key(_key(conversation.id))
+            pipe = client.pipeline()
+            pipe.delete(key)
+            pipe.rpush(key, *encoded)
+            pipe.expire(key, HISTORY_CACHE_SECONDS)
+            pipe.execute()
+        else:
+            cache.set(_key(conversation.id), encoded, timeout=HISTORY_CACHE_SECONDS)
+    return [_decode(item) for item in encoded]
+
+
+def _as_history(turns):
+    return [
+        {"role": 'user' if direction == 'i' else 'model', "parts": [text]}
+        for _, direction, message_type, text in turns
+        if message_type not in SKIPPED_TYPES
+    ]
+
+
+def recent_history(conversation, before, limit):
+    """
+    Gemini history ({"role", "parts"} dicts, oldest first) for the last `limit`
+    turns before `before` that the rolling summary doesn't cover yet.
+    """
+    turns = _read(conversation.id)
+    if turns is None:
+        logger.info(f"🧊 History cache miss for conversation {conversation.id}, backfilling")
+        turns = backfill(conversation)
+
+    before_at = before.timestamp()
+    since_at = conversation.summary_until.timestamp() if conversation.summary_until else None
+    # Out-of-order arrivals (WhatsApp timestamps vs our send time) are sorted here
+    turns.sort(key=lambda turn: turn[0])
+    wanted = [turn for turn in turns if turn[0] < before_at and (since_at is None or turn[0] > since_at)]
+
+    # Enough turns, or the buffer reaches back past everything wanted
+    complete = (
+        len(wanted) >= limit
+        or len(turns) < HISTORY_CACHE_TURNS
+        or (since_at is not None and turns[0][0] <= since_at)
+    )
+    if complete:
+        return _as_history(wanted[-limit:])
+
+    # Buffer too short for this window (a long burst): read the DB
+    messages = reversed(recent_history_queryset(conversation, before)[:limit])
+    return _as_history((m.timestamp.timestamp(), m.direction[0], m.message_type,
+                        m.text_content or m.caption or f'[{m.message_type}]') for m in messages)
@@ -0,0 +1,183 @@
+"""
+Phone number -> (WhatsAppUser, Conversation) identity cache.
+
+Every inbound message needs the sender's user and conversation before any
+real work starts. Their ids, name and block state are cached under the phone
+number (and under the user id, for the dashboard's send API) in two tiers:
+
+  - a small in-process LRU, entries kept IDENTITY_LOCAL_SECONDS, so a chatty
+    farmer costs no network round trip at all,
+  - the shared cache (Redis), entries kept IDENTITY_CACHE_SECONDS.
+
+Only a miss in both reads (or creates) the rows, and fills both tiers.
+reply.signals invalidates on user saves / deletes and conversation deletes
+(a deleted conversation must never be handed out); another worker's LRU may
+lag by up to IDENTITY_LOCAL_SECONDS, which is harmless for a name, and
+blocks are enforced by reply.escalation's own cache key anyway.
+
+The instances handed out are built from the cached fields only (the rest
+are deferred), so a save() on them writes just those fields; the hot path
+uses queryset updates instead.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+
+from .models import Conversation, WhatsAppUser
+
+logger = logging.getLogger(__name__)
+
+IDENTITY_CACHE_SECONDS = getattr(settings, 'IDENTITY_CACHE_SECONDS', 24 * 3600)
+IDENTITY_LOCAL_SECONDS = getattr(settings, 'IDENTITY_LOCAL_SECONDS', 30)
+IDENTITY_LRU_SIZE = getattr(settings, 'IDENTITY_LRU_SIZE', 10000)
+
+USER_FIELDS = ('id', 'phone_number', 'name', 'is_blocked', 'blocked_until')
+
+
+class LocalLRU:
+    """Thread-safe LRU whose entries also expire after ttl seconds"""
+
+    def __init__(self, maxsize=IDENTITY_LRU_SIZE, ttl=IDENTITY_LOCAL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (stored at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_local = LocalLRU()
+
+
+def _phone_key(phone_number):
+    return f'identity:phone:{phone_number}'
+
+
+def _user_key(user_id):
+    return f'identity:user:{user_id}'
+
+
+def _record(whatsapp_user, conversation):
+    record = {field: getattr(whatsapp_user, field) for field in USER_FIELDS}
+    record['conversation_id'] = conversation.id
+    return record
+
+
+def _instance(model, values):
+    """Model instance with only these attnames loaded (save() writes just them)"""
+    names = [f.attname for f in model._meta.concrete_fields if f.attname in values]
+    return model.from_db(router.db_for_read(model), names, [values[name] for name in names])
+
+
+def _build(record):
+    whatsapp_user = _instance(WhatsAppUser, {field: record[field] for field in USER_FIELDS})
+    conversation = _instance(Conversation, {'id': record['conversation_id'], 'whatsapp_user_id': record['id']})
+    conversation.whatsapp_user = whatsapp_user
+    return whatsapp_user, conversation
+
+
+def _get(key):
+    record = _local.get(key)
+    if record is not None:
+        return record
+    try:
+        record = cache.get(key)
+    except Exception as e:
+        logger.warning(f"⚠️ Identity cache unavailable: {e}")
+        return None
+    if record is not None:
+        _local.set(key, record)
+    return record
+
+
+def remember(whatsapp_user, conversation):
+    """Fill both tiers for this user / conversation pair"""
+    record = _record(whatsapp_user, conversation)
+    keys = (_phone_key(record['phone_number']), _user_key(record['id']))
+    for key in keys:
+        _local.set(key, record)
+    try:
+        cache.set_many({key: record for key in keys}, timeout=IDENTITY_CACHE_SECONDS)
+    except Exception as e:
+        logger.warning(f"⚠️ Identity cache unavailable: {e}")
+    return record
+
+
+def invalidate(user_id=None, phone_number=None):
+    """Forget a user (by id, phone or both; a cached record also names its old phone)"""
+    keys = set()
+    if phone_number:
+        keys.add(_phone_key(phone_number))
+    if user_id:
+        keys.add(_user_key(user_id))
+        record = _get(_user_key(user_id))
+        if record is not None:
+            keys.add(_phone_key(record['phone_number']))
+    for key in keys:
+        _local.delete(key)
+    try:
+        cache.delete_many(list(keys))
+    except Exception as e:
+        logger.error(f"❌ Could not drop identity {user_id or phone_number}: {e}")
+
+
+def resolve(phone_number, profile_name):
+    """(WhatsAppUser, Conversation) for a sender, created on first contact"""
+    record = _get(_phone_key(phone_number))
+    if record is not None:
+        return _build(record)
+
+    whatsapp_user, _ = WhatsAppUser.objects.get_or_create(
+        phone_number=phone_number,
+        defaults={'name': profile_name}
+    )
+    conversation, _ = Conversation.objects.get_or_create(whatsapp_user=whatsapp_user)
+    remember(whatsapp_user, conversation)
+    return whatsapp_user, conversation
+
+
+def for_user_id(user_id):
+    """(WhatsAppUser, Conversation) by user id, or None if either is missing"""
+    record = _get(_user_key(user_id))
+    if record is not None:
+        return _build(record)
+
+    conversation = (
+        Conversation.objects.select_related('whatsapp_user').filter(whatsapp_user_id=user_id).first()
+    )
+    if conversation is None:
+        return None
+    remember(conversation.whatsapp_user, conversation)
+    return conversation.whatsapp_user, conversation
@@ -0,0 +1,285 @@
+"""
+Single-pass intent engine.
+
+All keyword lists (greetings, labor, crop, spam, services, urgency, tasks,
+locations, variety aliases) are compiled ONCE at import into a single regex.
+classify() runs one finditer over the message and returns every flag,
+service category and entity at once.
+
+Boundaries are Devanagari-aware (see text_utils). A Devanagari term also
+matches with a trailing suffix ("फवारणीसाठी", "मजूरांना") and an English term
+with a plural "s"/"es", but never in the middle of another word.
+"""
+import re
+
+from .text_utils import LEFT_BOUNDARY, RIGHT_BOUNDARY, normalize, term_pattern
+from .varieties import GRAPE_VARIETIES, variety_key
+
+# --- Keywords (Optimized) ---
+GREETING_WORDS = {
+    'hello', 'hi', 'hey', 'namaste', 'नमस्ते', 'namaskar', 'नमस्कार',
+    'good morning', 'good evening', 'सुप्रभात', 'शुभ संध्या'
+}
+
+ACK_WORDS = {
+    'ok', 'okay', 'okk', 'k', 'thanks', 'thank you', 'धन्यवाद', 'धन्यवाद',
+    'ठीक', 'ठीक आहे', 'accha', 'अच्छा', 'बरं', 'yes', 'ha', 'हा', 'ji', 'जी'
+}
+
+FOLLOW_UP_WORDS = {
+    'update', 'any update', 'status', 'kya hua', 'what happened',
+    'अपडेट', 'काय झालं', 'काय झाले', 'कोई खबर', 'koi khabar'
+}
+
+LABOR_KEYWORDS = {
+    'labor', 'labour', 'majur', 'mazdoor', 'kamgar', 'worker', 'workers',
+    'मजूर', 'मजदूर', 'कामगार', 'काम', 'chatni', 'चटणी',
+    'pruning', 'कटाई', 'harvesting', 'spraying', 'फवारणी'
+}
+
+CROP_KEYWORDS = {
+    'spray', 'फवारणी', 'crop', 'फसल', 'फसलं', 'fertilizer', 'खाद',
+    'pest', 'pesticide', 'कीट', 'disease', 'रोग', 'बीमारी', 'product', 'उत्पाद',
+    'grape', 'अंगूर', 'द्राक्ष', 'powder', 'पावडर', 'chemical', 'रसायन'
+}
+
+# Keyboard mashing: matched anywhere, "asdfghjkl" is as much spam as "asdfgh"
+KEYBOARD_MASH = {'test123', 'testing123', 'asdfgh', 'qwerty', 'xyz123'}
+
+SPAM_KEYWORDS = KEYBOARD_MASH | {
+    'joke', 'funny', 'meme', 'song lyrics', 'video game',
+    'cricket score', 'ipl', 'match prediction',
+    'movie ticket', 'film', 'entertainment',
+    'paytm offer', 'bank loan', 'credit card offer',
+    'win prize', 'lottery', 'free gift'
+}
+
+# Ordered: ServiceInquiry.service_type lists them in this order
+SERVICE_KEYWORDS = {
+    'labor': ['labor', 'labour', 'majur', 'मजूर', 'मजदूर', 'kamgar', 'कामगार', 'worker', 'काम'],
+    'spray': ['spray', 'फवारणी', 'spraying', 'छिडकाव'],
+    'fertilizer': ['fertilizer', 'खाद', 'खत'],
+    'disease': ['disease', 'रोग', 'बीमारी', 'problem'],
+    'equipment': ['equipment', 'machine', 'यंत्र', 'मशीन'],
+    'transport': ['transport', 'वाहतूक', 'vehicle'],
+    'storage': ['storage', 'साठवण', 'भंडारण'],
+    'price': ['price', 'rate', 'किंमत', 'दर', 'cost'],
+}
+
+URGENT_KEYWORDS = {'urgent', 'तुरंत', 'आज', 'today', 'अभी', 'now', 'जल्दी', 'emergency'}
+
+PRICE_KEYWORDS = {'price', 'rate', 'किंमत', 'दर', 'रेट', 'cost'}
+
+# Entities: term -> canonical value
+TASKS = {
+    'pruning': 'pruning', 'कटाई': 'कटाई', 'spraying': 'spraying', 'फवारणी': 'फवारणी',
+    'harvesting': 'harvesting', 'चटणी': 'चटणी', 'chatni': 'chatni',
+}
+
+LOCATIONS = {
+    'satara': 'satara', 'सातारा': 'सातारा', 'pune': 'pune', 'पुणे': 'पुणे',
+    'mumbai': 'mumbai', 'मुंबई': 'मुंबई', 'nashik': 'nashik', 'नाशिक': 'नाशिक',
+}
+
+# Categories that only count when they ARE the message (or a multi-word
+# phrase inside it) - "hi" alone is a greeting, "hi I need 20 workers" isn't.
+WHOLE_MESSAGE_CATEGORIES = ('greeting', 'ack', 'follow_up')
+
+# Short Devanagari words ("दर", "हा", "जी") would otherwise match as
+# prefixes of unrelated words ("दररोज"), so they need a full boundary.
+MIN_SUFFIXABLE_LEN = 3
+
+_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+_VOICED_RE = re.compile(r'[aeiou\u0900-\u097F]')
+_ALPHA_RE = re.compile(r'[^\W\d_]')
+_MASH_RE = re.compile('|'.join(re.escape(term) for term in sorted(KEYBOARD_MASH)))
+
+
+def _is_devanagari(term):
+    return any('\u0900' <= ch <= '\u097f' for ch in term)
+
+
+def _tail(term):
+    """Regex source for what may follow a term (its allowed suffix + boundary)"""
+    if not _is_devanagari(term):
+        return r'(?:e?s)?' + RIGHT_BOUNDARY
+    if len(term) >= MIN_SUFFIXABLE_LEN:
+        return r'[\u0900-\u097F]*'
+    return RIGHT_BOUNDARY
+
+
+def _alternative(term):
+    """Regex source for one term incl. its allowed suffix"""
+    return term_pattern(term) + _tail(term)
+
+
+def _trie_pattern(terms):
+    """
+    Prefix-factored alternation: 'spray'/'spraying' share 'spray' instead of
+    re-scanning it per branch. Each term ends in an empty marker group
+    (?P<tN>), so match.lastgroup names the term that matched.
+    """
+    trie = {}
+    for index, term in enumerate(terms):
+        node = trie
+        for part in re.findall(r' |[^ ]', term):
+            node = node.setdefault(part, {})
+        node[''] = index
+
+    def build(node):
+        branches = []
+        # Longer continuations first so the longest term wins
+        for part in sorted((k for k in node if k), key=lambda k: -_depth(node[k])):
+            branches.append((r'\s*' if part == ' ' else re.escape(part)) + build(node[part]))
+        if '' in node:
+            index = node['']
+            branches.append(f'(?P<t{index}>){_tail(terms[index])}')
+        return branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+
+    return build(trie)
+
+
+def _depth(node):
+    return max((1 + _depth(child) for key, child in node.items() if key), default=0)
+
+
+def _build_term_table():
+    """term -> set of tags such as 'greeting', 'service:spray', 'task:कटाई'"""
+    table = {}
+
+    def add(terms, tag):
+        for term in terms:
+            table.setdefault(normalize(term), set()).add(tag)
+
+    add(GREETING_WORDS, 'greeting')
+    add(ACK_WORDS, 'ack')
+    add(FOLLOW_UP_WORDS, 'follow_up')
+    add(LABOR_KEYWORDS, 'labor')
+    add(CROP_KEYWORDS, 'crop')
+    add(SPAM_KEYWORDS, 'spam')
+    add(URGENT_KEYWORDS, 'urgent')
+    add(PRICE_KEYWORDS, 'price')
+    for service, keywords in SERVICE_KEYWORDS.items():
+        add(keywords, f'service:{service}')
+    for term, value in TASKS.items():
+        add([term], f'task:{value}')
+    for term, value in LOCATIONS.items():
+        add([term], f'location:{value}')
+    for variety in GRAPE_VARIETIES:
+        aliases = variety['aliases'] + [variety['name'].split(' / ')[0]]
+        aliases = [a for a in aliases if not normalize(a).isdigit()]
+        add(aliases, f'variety:{variety_key(variety)}')
+    return table
+
+
+def _compile(table):
+    """One trie-shaped regex over all terms, plus tags per marker group"""
+    ordered = sorted(table, key=len, reverse=True)
+    pattern = re.compile(LEFT_BOUNDARY + _trie_pattern(ordered))
+    # A long term swallows any shorter term it contains ("any update" ->
+    # "update"), so give it the tags of everything matching inside it.
+    singles = {t: re.compile(LEFT_BOUNDARY + _alternative(t)) for t in ordered}
+    tags_by_index = []
+    for term in ordered:
+        tags = set(table[term])
+        for other, regex in singles.items():
+            if other != term and len(other) < len(term) and regex.search(term):
+                tags |= {tag for tag in table[other] if tag not in WHOLE_MESSAGE_CATEGORIES}
+        tags_by_index.append((term, frozenset(tags)))
+    return pattern, tags_by_index
+
+
+_TERM_TABLE = _build_term_table()
+_INTENT_RE, _TAGS_BY_INDEX = _compile(_TERM_TABLE)
+
+
+class Intent:
+    """Everything classify() found in one message"""
+
+    __slots__ = ('text', 'greeting', 'ack', 'follow_up', 'labor', 'crop', 'spam',
+                 'urgent', 'price', 'services', 'tasks', 'locations', 'varieties',
+                 'numbers', 'matches')
+
+    def __init__(self, text):
+        self.text = text
+        self.greeting = self.ack = self.follow_up = False
+        self.labor = self.crop = self.spam = self.urgent = self.price = False
+        self.services = []
+        self.tasks = []
+        self.locations = []
+        self.varieties = []
+        self.numbers = []
+        self.matches = []
+
+    @property
+    def variety(self):
+        """The variety key if exactly one variety is mentioned"""
+        return self.varieties[0] if len(self.varieties) == 1 else None
+
+    def __repr__(self):
+        flags = [name for name in ('greeting', 'ack', 'follow_up', 'labor', 'crop', 'spam', 'urgent', 'price')
+                 if getattr(self, name)]
+        return (f"<Intent {flags} services={self.services} tasks={self.tasks} "
+                f"locations={self.locations} varieties={self.varieties}>")
+
+
+def classify(message):
+    """Run the compiled engine once over message"""
+    text = normalize(message)
+    intent = Intent(text)
+    services = set()
+
+    for match in _INTENT_RE.finditer(text):
+        term, tags = _TAGS_BY_INDEX[int(match.lastgroup[1:])]
+        whole = match.start() == 0 and match.end() == len(text)
+        intent.matches.append(term)
+
+        for tag in tags:
+            if tag in WHOLE_MESSAGE_CATEGORIES:
+                # Whole message, or a multi-word phrase anywhere
+                if whole or ' ' in term:
+                    setattr(intent, tag, True)
+            elif tag.startswith('service:'):
+                services.add(tag[8:])
+            elif tag.startswith('task:'):
+                if tag[5:] not in intent.tasks:
+                    intent.tasks.append(tag[5:])
+            elif tag.startswith('location:'):
+                if tag[9:] not in intent.locations:
+                    intent.locations.append(tag[9:])
+            elif tag.startswith('variety:'):
+                if tag[8:] not in intent.varieties:
+                    intent.varieties.append(tag[8:])
+            else:
+                setattr(intent, tag, True)
+
+    intent.services = [service for service in SERVICE_KEYWORDS if service in services]
+    intent.numbers = _NUMBER_RE.findall(text)
+    intent.spam = intent.spam or _looks_like_junk(text)
+    return intent
+
+
+def _looks_like_junk(text):
+    """Too short, keyboard mashing, no vowels (gibberish) or no letters at all"""
+    if len(text) < 2:
+        return True
+    if _MASH_RE.search(text):
+        return True
+    # Devanagari letters carry an inherent vowel, so any of them counts
+    if len(text) > 6 and not _VOICED_RE.search(text):
+        return True
+    if len(text) > 3 and not _ALPHA_RE.search(text):
+        return True
+    return False
+
+
+# Product names in a *reply* decide whether the spray disclaimer stays
+PRODUCT_MENTION_NAMES = [
+    'ranman', 'profiler', 'emamectin', 'score', 'ridomil',
+    'mancozeb', 'carbendazim', 'imidacloprid', 'copper', 'sulphur'
+]
+_PRODUCT_MENTION_RE = re.compile('|'.join(re.escape(name) for name in PRODUCT_MENTION_NAMES))
+
+
+def mentions_product(text):
+    return _PRODUCT_MENTION_RE.search(text.lower()) is not None
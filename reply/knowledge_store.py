@@ -0,0 +1,250 @@
+"""
+Versioned vector-store snapshots with an atomic "current" pointer.
+
+Layout in the media storage backend (S3 in production):
+
+    knowledge_base/snapshots/<version>/chunks.json   chunk metadata (no vectors)
+    knowledge_base/snapshots/<version>/vectors.npy   normalized float32 matrix
+    knowledge_base/pointers/<activated at>_<version>   one empty object per activation
+
+The Redis version key is the source of truth: workers poll it cheaply and
+swap indexes in the background (see KnowledgeBaseWatcher). The pointer
+objects are its durable copy: activating writes a new one (the newest wins)
+before touching Redis, so there is never a moment without a current version.
+"""
+import io
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .varieties import VARIETY_KEYS, source_variety
+
+logger = logging.getLogger(__name__)
+
+KB_ROOT = 'knowledge_base'
+KB_SNAPSHOT_DIR = f'{KB_ROOT}/snapshots'
+KB_POINTER_DIR = f'{KB_ROOT}/pointers'
+# Single-object pointer written before pointers/ existed; read as a last resort
+KB_LEGACY_POINTER_PATH = f'{KB_ROOT}/CURRENT'
+KB_POINTERS_KEPT = 10
+KB_VERSION_CACHE_KEY = 'kb:current_version'
+LOCAL_VERSION = 'local'
+
+
+class KnowledgeIndex:
+    """
+    Immutable in-memory index. Searches grab a reference once, so swapping
+    GeminiService.kb never disturbs an in-flight search.
+    """
+
+    def __init__(self, version, chunks, vectors):
+        self.version = version
+        self.chunks = chunks
+        self.vectors = vectors
+        self.partitions = self._build_partitions(chunks, vectors)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    @staticmethod
+    def _build_partitions(chunks, vectors):
+        """
+        Precompute one sub-matrix per grape variety: that variety's chunks +
+        the shared ones (company info, aliases, generic product sheets).
+        Returns {variety_key: (chunk_indices, sub_matrix)}
+        """
+        chunk_varieties = [source_variety(chunk['source']) for chunk in chunks]
+        shared = [i for i, key in enumerate(chunk_varieties) if key is None]
+
+        partitions = {}
+        for key in VARIETY_KEYS:
+            own = [i for i, chunk_key in enumerate(chunk_varieties) if chunk_key == key]
+            if not own:
+                continue
+            indices = np.array(sorted(shared + own))
+            partitions[key] = (indices, np.ascontiguousarray(vectors[indices]))
+        return partitions
+
+    @classmethod
+    def from_vector_database(cls, embedded_chunks, version=LOCAL_VERSION):
+        """Build from vector.py output (chunks with a 'vector' key)"""
+        # float32 halves memory and is plenty for cosine ranking
+        vectors = np.array([chunk['vector'] for chunk in embedded_chunks], dtype=np.float32)
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        chunks = [{k: v for k, v in chunk.items() if k != 'vector'} for chunk in embedded_chunks]
+        return cls(version, chunks, vectors)
+
+
+EMPTY_INDEX = KnowledgeIndex(None, [], np.zeros((0, 0), dtype=np.float32))
+
+
+# --- Snapshot storage ---
+
+def _snapshot_path(version, name):
+    return f'{KB_SNAPSHOT_DIR}/{version}/{name}'
+
+
+def list_versions():
+    """Published versions, oldest first (versions sort chronologically)"""
+    try:
+        dirs, _ = default_storage.listdir(KB_SNAPSHOT_DIR)
+    except (FileNotFoundError, OSError):
+        return []
+    return sorted(dirs)
+
+
+def _pointer_names():
+    try:
+        _, files = default_storage.listdir(KB_POINTER_DIR)
+    except (FileNotFoundError, OSError):
+        return []
+    return sorted(name for name in files if '_' in name)
+
+
+def _read_pointer():
+    """Version named by the newest pointer object (or the legacy CURRENT file)"""
+    names = _pointer_names()
+    if names:
+        return names[-1].split('_', 1)[1]
+    try:
+        with default_storage.open(KB_LEGACY_POINTER_PATH, 'rb') as f:
+            return f.read().decode('utf-8').strip() or None
+    except (FileNotFoundError, OSError):
+        return None
+
+
+def get_current_version():
+    """
+    Current version from Redis, reseeded from the newest pointer if Redis
+    lost it. With Redis down the pointer objects answer on their own.
+    """
+    try:
+        version = cache.get(KB_VERSION_CACHE_KEY)
+    except Exception as e:
+        logger.warning(f"⚠️ Knowledge base version key unreadable, using the pointer: {e}")
+        return _read_pointer()
+    if version:
+        return version
+    version = _read_pointer()
+    if version:
+        try:
+            cache.set(KB_VERSION_CACHE_KEY, version, timeout=None)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not reseed the knowledge base version key: {e}")
+    return version
+
+
+def set_current_version(version):
+    """Repoint to version: new pointer object first, then the Redis key, then prune old pointers"""
+    if version not in list_versions():
+        raise ValueError(f"Unknown knowledge base version: {version}")
+    activated_at = timezone.now().strftime('%Y%m%dT%H%M%S%f')
+    default_storage.save(f'{KB_POINTER_DIR}/{activated_at}_{version}', ContentFile(b''))
+    cache.set(KB_VERSION_CACHE_KEY, version, timeout=None)
+    for name in _pointer_names()[:-KB_POINTERS_KEPT]:
+        try:
+            default_storage.delete(f'{KB_POINTER_DIR}/{name}')
+        except Exception as e:
+            logger.warning(f"⚠️ Could not prune knowledge base pointer {name}: {e}")
+    logger.info(f"📌 Knowledge base pointer -> {version}")
+
+
+def publish_snapshot(vector_db_path, activate=True):
+    """Write vector.py output as a new immutable snapshot. Returns the version."""
+    with open(vector_db_path, 'r', encoding='utf-8') as f:
+        index = KnowledgeIndex.from_vector_database(json.load(f))
+
+    version = timezone.now().strftime('%Y%m%dT%H%M%S')
+    if version in list_versions():
+        raise ValueError(f"Knowledge base version {version} already exists, retry in a second")
+    buffer = io.BytesIO()
+    np.save(buffer, index.vectors)
+    default_storage.save(_snapshot_path(version, 'vectors.npy'), ContentFile(buffer.getvalue()))
+    default_storage.save(
+        _snapshot_path(version, 'chunks.json'),
+        ContentFile(json.dumps(index.chunks, ensure_ascii=False).encode('utf-8'))
+    )
+    logger.info(f"📦 Published knowledge base {version} ({len(index)} chunks)")
+
+    if activate:
+        set_current_version(version)
+    return version
+
+
+def load_snapshot(version):
+    """Load a published snapshot into a KnowledgeIndex"""
+    with default_storage.open(_snapshot_path(version, 'chunks.json'), 'rb') as f:
+        chunks = json.loads(f.read().decode('utf-8'))
+    with default_storage.open(_snapshot_path(version, 'vectors.npy'), 'rb') as f:
+        vectors = np.load(io.BytesIO(f.read()))
+    return KnowledgeIndex(version, chunks, vectors)
+
+
+def load_local_index():
+    """Unversioned fallback: vector_database.json next to manage.py"""
+    db_path = os.path.join(settings.BASE_DIR, 'vector_database.json')
+    with open(db_path, 'r', encoding='utf-8') as f:
+        return KnowledgeIndex.from_vector_database(json.load(f))
+
+
+def load_current_index():
+    """Current published snapshot, or the local file if none can be found or loaded"""
+    try:
+        version = get_current_version()
+    except Exception as e:
+        logger.error(f"❌ Could not look up the current knowledge base: {e}")
+        version = None
+    if version:
+        try:
+            return load_snapshot(version)
+        except Exception as e:
+            logger.error(f"❌ Could not load knowledge base {version}: {e}")
+    return load_local_index()
+
+
+class KnowledgeBaseWatcher(threading.Thread):
+    """
+    Polls the version key and hot-swaps the owner's index in the background.
+    The new index is fully built before the swap, and the old one is dropped
+    right after, so the two only coexist for the duration of one load.
+    """
+
+    def __init__(self, owner, interval=None):
+        super().__init__(name='kb-watcher', daemon=True)
+        self.owner = owner
+        self.interval = interval or getattr(settings, 'KB_POLL_SECONDS', 30)
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.check_once()
+            except Exception as e:
+                logger.error(f"❌ Knowledge base reload failed: {e}")
+
+    def check_once(self):
+        if self.owner.kb.version is None:
+            # Started with nothing at all: keep retrying, local file included
+            self.owner.kb = load_current_index()
+            logger.info(f"✅ Knowledge base {self.owner.kb.version} live ({len(self.owner.kb)} chunks)")
+            return True
+        version = get_current_version()
+        if not version or version == self.owner.kb.version:
+            return False
+        logger.info(f"🔄 Knowledge base {self.owner.kb.version} -> {version}, loading...")
+        new_index = load_snapshot(version)
+        self.owner.kb = new_index  # atomic reference swap
+        del new_index
+        logger.info(f"✅ Knowledge base {version} live ({len(self.owner.kb)} chunks)")
+        return True
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from reply.telemetry import ROLLUP_FIELDS, usage, usage_rollup
+
+
+class Command(BaseCommand):
+    help = 'Gemini usage rollups (calls, tokens, latency) per day / path / model / user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--by', choices=sorted(ROLLUP_FIELDS), default='day')
+        parser.add_argument('--days', type=int, default=7)
+        parser.add_argument('--limit', type=int, default=50)
+
+    def handle(self, *args, **options):
+        # Include whatever this process still holds in memory
+        usage.flush()
+
+        rows = list(usage_rollup(by=options['by'], days=options['days']))
+        if options['by'] == 'user':
+            rows.sort(key=lambda r: r['input_tokens'] + r['output_tokens'], reverse=True)
+        rows = rows[:options['limit']]
+
+        if not rows:
+            self.stdout.write('No usage recorded in this period.')
+            return
+
+        group = ROLLUP_FIELDS[options['by']]
+        self.stdout.write(f"{' / '.join(group):<40} {'calls':>8} {'errors':>7} {'failover':>8} {'tok in':>10} {'tok out':>10} {'avg ms':>8}")
+        total_in = total_out = 0
+        for row in rows:
+            label = ' / '.join(str(row[field]) for field in group)
+            avg_ms = row['total_latency_ms'] // row['calls'] if row['calls'] else 0
+            self.stdout.write(
+                f"{label[:40]:<40} {row['calls']:>8} {row['errors']:>7} {row['failovers']:>8} "
+                f"{row['input_tokens']:>10} {row['output_tokens']:>10} {avg_ms:>8}"
+            )
+            total_in += row['input_tokens']
+            total_out += row['output_tokens']
+
+        self.stdout.write(self.style.SUCCESS(f'\nTotal tokens: {total_in} in / {total_out} out'))
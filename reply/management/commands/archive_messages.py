@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from reply.archive import ARCHIVE_AFTER_DAYS, ARCHIVE_DELETE_CHUNK, archive_messages, archive_webhook_logs
+
+
+class Command(BaseCommand):
+    help = 'Move old messages and webhook logs into gzipped JSONL archives in the media storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS, help='Archive rows older than this')
+        parser.add_argument('--chunk-size', type=int, default=ARCHIVE_DELETE_CHUNK,
+                            help='Rows deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0.05, help='Seconds to sleep between delete chunks')
+        parser.add_argument('--skip-webhook-logs', action='store_true', help='Only archive messages')
+        parser.add_argument('--dry-run', action='store_true', help='Count what would be archived, change nothing')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        dry_run = options['dry_run']
+        kwargs = {'chunk_size': options['chunk_size'], 'pause': options['pause'], 'dry_run': dry_run}
+        verb = 'Would archive' if dry_run else 'Archived'
+
+        def written(stats):
+            if dry_run:
+                return ''
+            finished = f"; finished deleting {stats['finished']} already archived" if stats['finished'] else ''
+            return f" into {stats['files']} file(s), {stats['bytes'] // 1024} KiB{finished}"
+
+        stats = archive_messages(cutoff, **kwargs)
+        self.stdout.write(f"{verb} {stats['rows']} message(s) of {stats['conversations']} conversation(s) "
+                          f"older than {cutoff:%Y-%m-%d}{written(stats)}")
+        if not options['skip_webhook_logs']:
+            stats = archive_webhook_logs(cutoff, **kwargs)
+            self.stdout.write(f"{verb} {stats['rows']} webhook log(s){written(stats)}")
@@ -0,0 +1,75 @@
+import re
+import time
+
+from django.core.management.base import BaseCommand
+
+from reply import intents
+from reply.intents import classify
+from reply.models import Message
+
+SAMPLE_MESSAGES = [
+    'hi', 'नमस्कार', 'ok', 'thank you', 'any update', 'काय झालं',
+    'मला 20 मजूर पाहिजेत उद्या सातारा', 'I need 15 workers for pruning in Nashik urgent',
+    'मुझे 20 labour चाहिए for कटाई', 'ard 35 la 45 divsala konti फवारणी karaychi',
+    'crimson var downy aala aahe kay spray karu', 'द्राक्ष बागेत रोग आला आहे, उपाय सांगा',
+    'what is the rate of fertilizer per bag', 'transport vehicle pahije pune la',
+    'cricket score kya hai', 'asdfghjkl', '12345', 'thompson chya ghadala pivli pane',
+]
+
+
+def legacy_classify(message):
+    """The per-keyword loops classify() replaced, kept only as a baseline"""
+    lowered = message.strip().lower()
+    flags = {}
+    for name, words in (('greeting', intents.GREETING_WORDS), ('ack', intents.ACK_WORDS),
+                        ('follow_up', intents.FOLLOW_UP_WORDS)):
+        flags[name] = lowered in words or any(' ' in w and w in lowered for w in words)
+    flags['spam'] = any(w in lowered for w in intents.SPAM_KEYWORDS)
+    flags['labor'] = any(re.search(r'\b' + re.escape(k) + r'\b', lowered, re.IGNORECASE)
+                         for k in intents.LABOR_KEYWORDS)
+    flags['crop'] = any(k in lowered for k in intents.CROP_KEYWORDS)
+    flags['services'] = [s for s, kws in intents.SERVICE_KEYWORDS.items() if any(k in lowered for k in kws)]
+    flags['urgent'] = any(k in lowered for k in intents.URGENT_KEYWORDS)
+    flags['location'] = next((l for l in intents.LOCATIONS if l in lowered), None)
+    flags['price'] = any(k in lowered for k in intents.PRICE_KEYWORDS)
+    flags['numbers'] = re.findall(r'\d+', message)
+    return flags
+
+
+class Command(BaseCommand):
+    help = 'Microbenchmark: compiled intent engine vs. the old keyword loops'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000)
+        parser.add_argument('--from-db', type=int, default=0,
+                            help='Also use the N latest inbound text messages')
+        parser.add_argument('--show', action='store_true', help='Print what classify() found per message')
+
+    def handle(self, *args, **options):
+        messages = list(SAMPLE_MESSAGES)
+        if options['from_db']:
+            messages += list(
+                Message.objects.filter(direction='inbound', message_type='text')
+                .exclude(text_content__isnull=True)
+                .order_by('-timestamp')
+                .values_list('text_content', flat=True)[:options['from_db']]
+            )
+
+        if options['show']:
+            for message in messages:
+                self.stdout.write(f"{message[:50]:<50} {classify(message)!r}")
+            self.stdout.write('')
+
+        iterations = options['iterations']
+        results = {}
+        for name, func in (('legacy loops', legacy_classify), ('compiled engine', classify)):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                for message in messages:
+                    func(message)
+            elapsed = time.perf_counter() - start
+            results[name] = elapsed / (iterations * len(messages)) * 1e6
+            self.stdout.write(f"{name:<16} {results[name]:8.2f} µs/message")
+
+        speedup = results['legacy loops'] / results['compiled engine']
+        self.stdout.write(self.style.SUCCESS(f'\n{len(messages)} messages x {iterations}: {speedup:.1f}x faster'))
@@ -0,0 +1,77 @@
+import re
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.utils import timezone
+
+from reply.models import Conversation, DayRangeProduct, Message, WhatsAppUser
+
+# Plan lines that mean a full table read
+SEQ_SCAN_RE = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (\w+)\s*$', re.MULTILINE),
+}
+
+
+def hot_queries(conversation, user, product_id):
+    """(label, queryset) for the queries every reply / dashboard page runs"""
+    now = timezone.now()
+    queries = [
+        ('recent history', conversation.messages.filter(timestamp__lt=now).order_by('-timestamp')[:10]),
+        ('burst collection', conversation.messages.filter(direction='inbound', message_type='text', id__gte=0)
+         .order_by('id')[:10]),
+        ('undelivered messages', Message.objects.filter(status__in=['pending', 'failed']).order_by('timestamp')[:50]),
+        ('duplicate webhook check', Message.objects.filter(whatsapp_message_id='wamid.explain')),
+        ('chat list', Conversation.objects.select_related('whatsapp_user').order_by('-updated_at')[:50]),
+        ('user by phone', WhatsAppUser.objects.filter(phone_number=user.phone_number)),
+    ]
+    if product_id:
+        queries.append(('product relationships', DayRangeProduct.objects.filter(product_id=product_id)
+                        .select_related('day_range__crop_variety__crop', 'day_range__activity')))
+    return queries
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN (ANALYZE on PostgreSQL) the hot queries and flag sequential scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conversation', type=int, help='Conversation id to use (default: the busiest)')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan in full')
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if options['conversation']:
+            conversation = Conversation.objects.select_related('whatsapp_user').get(id=options['conversation'])
+        else:
+            conversation = (
+                Conversation.objects.select_related('whatsapp_user')
+                .annotate(message_count=Count('messages')).order_by('-message_count').first()
+            )
+        if conversation is None:
+            self.stdout.write('No conversations to explain against.')
+            return
+        try:
+            product_id = DayRangeProduct.objects.values_list('product_id', flat=True).first()
+        except Exception:
+            product_id = None  # calender_* tables not in this database
+
+        explain_options = {'analyze': True} if vendor == 'postgresql' else {}
+        seq_scan_re = SEQ_SCAN_RE.get(vendor)
+        queries = hot_queries(conversation, conversation.whatsapp_user, product_id)
+        flagged = 0
+        for label, queryset in queries:
+            plan = queryset.explain(**explain_options)
+            scans = sorted(set(seq_scan_re.findall(plan))) if seq_scan_re else []
+            if scans:
+                flagged += 1
+                self.stdout.write(self.style.WARNING(f"⚠️  {label}: sequential scan on {', '.join(scans)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"✅ {label}"))
+            if scans or options['verbose_plans']:
+                self.stdout.write('    ' + plan.replace('\n', '\n    '))
+
+        summary = f"\n{flagged} of {len(queries)} queries scan a whole table"
+        if vendor == 'postgresql':
+            summary += ' (small tables are often seq-scanned by choice; re-check once they grow)'
+        self.stdout.write(summary)
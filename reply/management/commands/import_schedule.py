@@ -0,0 +1,88 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reply.schedule_import import DEFAULT_PRODUCT_TYPE, import_schedule
+from reply.schedule_sheets import FOLIAR_LAYOUT, SheetLayout, parse_workbook
+
+
+def _columns(value):
+    return [int(col) for col in value.split(',') if col.strip()]
+
+
+class Command(BaseCommand):
+    help = 'Import (or re-sync) one variety\'s crop schedule into the calender_* tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', nargs='?',
+                            help='JSON: {"crop", "variety", "crop_marathi", "variety_marathi", "entries": [...]}')
+        parser.add_argument('--xlsx', help='Parse entries from this workbook instead of a JSON file')
+        parser.add_argument('--sheet', action='append', default=[],
+                            help='Sheet to parse (repeatable; default: Foliar Application)')
+        parser.add_argument('--first-row', type=int, default=FOLIAR_LAYOUT.first_row)
+        parser.add_argument('--group-col', type=int, default=FOLIAR_LAYOUT.group_col,
+                            help='Serial-number column; -1 = a filled day cell starts an entry')
+        parser.add_argument('--activity-col', type=int, default=FOLIAR_LAYOUT.activity_col)
+        parser.add_argument('--day-col', type=int, default=FOLIAR_LAYOUT.day_col)
+        parser.add_argument('--product-cols', type=_columns, default=FOLIAR_LAYOUT.product_cols,
+                            help='Comma-separated product columns, e.g. 3,4')
+        parser.add_argument('--crop', help='Crop name (overrides the file)')
+        parser.add_argument('--crop-marathi', default='')
+        parser.add_argument('--variety', help='Variety name (overrides the file)')
+        parser.add_argument('--variety-marathi', default='')
+        parser.add_argument('--product-type', default=DEFAULT_PRODUCT_TYPE, help='product_type for new products')
+        parser.add_argument('--dry-run', action='store_true', help='Show the diff without writing')
+
+    def handle(self, *args, **options):
+        if options['xlsx']:
+            data = self._from_workbook(options)
+        else:
+            if not options['file'] or not os.path.exists(options['file']):
+                raise CommandError(f"File not found: {options['file']}")
+            with open(options['file'], encoding='utf-8') as f:
+                data = json.load(f)
+
+        crop = options['crop'] or data.get('crop')
+        variety = options['variety'] or data.get('variety')
+        if not crop or not variety:
+            raise CommandError('Crop and variety are required (--crop/--variety or in the file)')
+
+        result = import_schedule(
+            crop, variety, data['entries'],
+            crop_name_marathi=options['crop_marathi'] or data.get('crop_marathi', ''),
+            variety_name_marathi=options['variety_marathi'] or data.get('variety_marathi', ''),
+            product_type=options['product_type'],
+            dry_run=options['dry_run'],
+        )
+
+        for line in result.diff:
+            self.stdout.write(f'  {line}')
+        prefix = 'Would import' if result.dry_run else '✓ Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix} {crop} / {variety}: {result.created} new, {result.updated} changed, '
+            f'{result.deleted} removed, {result.unchanged} unchanged day ranges; '
+            f'{result.activities_created} new activities, {result.products_created} new products'
+        ))
+        if result.skipped_products:
+            self.stdout.write(self.style.WARNING(f'  Skipped {result.skipped_products} product lines without a usable dosage/unit'))
+
+    def _from_workbook(self, options):
+        if not os.path.exists(options['xlsx']):
+            raise CommandError(f"File not found: {options['xlsx']}")
+        layout = SheetLayout(
+            day_col=options['day_col'],
+            activity_col=options['activity_col'],
+            product_cols=options['product_cols'],
+            group_col=None if options['group_col'] < 0 else options['group_col'],
+            first_row=options['first_row'],
+        )
+        sheets = options['sheet'] or ['Foliar Application']
+        try:
+            entries, timings = parse_workbook(options['xlsx'], {name: layout for name in sheets})
+        except ValueError as e:  # unknown sheet name
+            raise CommandError(str(e))
+
+        for name, (count, seconds) in timings.items():
+            self.stdout.write(f'  {name}: {count} {"sheets" if name == "<read>" else "entries"} in {seconds * 1000:.0f}ms')
+        return {'entries': entries}
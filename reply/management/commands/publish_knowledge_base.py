@@ -0,0 +1,36 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from reply.knowledge_store import get_current_version, publish_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Publish vector_database.json as a new knowledge base version (workers hot-reload it)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            default=os.path.join(settings.BASE_DIR, 'vector_database.json'),
+            help='vector.py output to publish'
+        )
+        parser.add_argument(
+            '--no-activate',
+            action='store_true',
+            help='Upload the snapshot without pointing workers at it'
+        )
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['file']):
+            raise CommandError(f"File not found: {options['file']}")
+
+        previous = get_current_version()
+        version = publish_snapshot(options['file'], activate=not options['no_activate'])
+
+        self.stdout.write(self.style.SUCCESS(f'✓ Published knowledge base version {version}'))
+        if options['no_activate']:
+            self.stdout.write(f'  Not activated. Current version is still {previous}')
+        else:
+            self.stdout.write(f'  Previous version: {previous or "none"}')
+            self.stdout.write('  Workers will pick it up on their next poll.')
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from reply.knowledge_store import get_current_version, list_versions, set_current_version
+
+
+class Command(BaseCommand):
+    help = 'Point workers back at an earlier knowledge base version'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--to', dest='version', help='Version to activate (default: the one before current)')
+        parser.add_argument('--list', action='store_true', help='List published versions and exit')
+
+    def handle(self, *args, **options):
+        versions = list_versions()
+        current = get_current_version()
+
+        if options['list']:
+            for version in versions:
+                marker = ' (current)' if version == current else ''
+                self.stdout.write(f'{version}{marker}')
+            return
+
+        target = options['version']
+        if not target:
+            if current not in versions:
+                raise CommandError('Current version unknown - use --to VERSION')
+            position = versions.index(current)
+            if position == 0:
+                raise CommandError(f'{current} is the oldest version, nothing to roll back to')
+            target = versions[position - 1]
+
+        try:
+            set_current_version(target)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f'✓ Rolled back knowledge base {current} -> {target}'))
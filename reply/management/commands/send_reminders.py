@@ -0,0 +1,39 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from reply.reminders import REMINDER_TEMPLATE, send_reminders
+
+
+class Command(BaseCommand):
+    help = "Send today's crop calendar reminders to farmers with a crop profile (run once a day)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Pretend today is YYYY-MM-DD')
+        parser.add_argument('--dry-run', action='store_true', help='Compute and list, send nothing')
+        parser.add_argument('--limit', type=int, help='Send at most this many')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        if options['date']:
+            try:
+                today = datetime.date.fromisoformat(options['date'])
+            except ValueError as e:
+                raise CommandError(f"Bad --date: {e}")
+
+        stats = send_reminders(today, dry_run=options['dry_run'], limit=options['limit'])
+        self.stdout.write(
+            f"{today}: {stats['due']} due of {stats['profiles']} profiles "
+            f"(load {stats['load_seconds']:.2f}s, compute {stats['compute_seconds']:.2f}s)"
+        )
+        if options['dry_run']:
+            for reminder in stats['reminders'][:50]:
+                activities = ', '.join(entry.activity for entry in reminder.entries)
+                self.stdout.write(f"  user {reminder.user_id} variety {reminder.variety_id} day {reminder.day}: {activities}")
+            return
+        if stats['due']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Sent {stats['sent']} '{REMINDER_TEMPLATE}' template(s), {stats['failed']} failed "
+                f"in {stats['send_seconds']:.1f}s"
+            ))
@@ -0,0 +1,105 @@
+"""
+Rolling per-conversation summaries.
+
+Every SUMMARY_EVERY_N_TURNS turns a background job folds everything except
+the last KEEP_RECENT_TURNS into Conversation.summary. Prompts then carry
+summary + the few turns it doesn't cover yet, so their size stays roughly
+constant however long the chat runs.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from . import telemetry
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_EVERY_N_TURNS = getattr(settings, 'SUMMARY_EVERY_N_TURNS', 4)
+KEEP_RECENT_TURNS = 3
+SUMMARY_MAX_CHARS = 1000
+SUMMARY_LOCK_SECONDS = 120
+
+# Largest number of unsummarized turns a prompt can carry
+MAX_UNSUMMARIZED_TURNS = SUMMARY_EVERY_N_TURNS + KEEP_RECENT_TURNS
+
+SUMMARY_PROMPT = """Update the running summary of a WhatsApp chat between a farmer and our farm-services bot.
+
+Current summary:
+{summary}
+
+New messages:
+{turns}
+
+Instructions:
+- Write the updated summary in English, max 80 words
+- Keep: user's name, crop & variety, location, farm size, labor needs (task, workers, date), products/sprays discussed, open questions
+- Drop greetings and small talk
+- Plain sentences, no bullet points
+
+Summary:"""
+
+
+def recent_history_queryset(conversation, before):
+    """Messages not yet covered by the summary, newest first"""
+    qs = conversation.messages.filter(timestamp__lt=before)
+    if conversation.summary_until:
+        qs = qs.filter(timestamp__gt=conversation.summary_until)
+    return qs.order_by('-timestamp')
+
+
+def summary_due(unsummarized_turns):
+    """True once enough turns piled up beyond the ones we always keep verbatim"""
+    return unsummarized_turns >= MAX_UNSUMMARIZED_TURNS
+
+
+def schedule_summary(conversation, gemini, user_id=None):
+    """Run summarize_conversation in the background (at most one per chat)"""
+    lock_key = f'summary_lock:{conversation.id}'
+    if not cache.add(lock_key, 1, timeout=SUMMARY_LOCK_SECONDS):
+        return False
+
+    def run():
+        try:
+            summarize_conversation(conversation.id, gemini, user_id)
+        except Exception as e:
+            logger.error(f"❌ Summary job failed for conversation {conversation.id}: {e}")
+        finally:
+            cache.delete(lock_key)
+            close_old_connections()
+
+    threading.Thread(target=run, name='conversation-summary', daemon=True).start()
+    return True
+
+
+def summarize_conversation(conversation_id, gemini, user_id=None):
+    """Fold all but the last KEEP_RECENT_TURNS unsummarized turns into the summary"""
+    from .models import Conversation
+
+    conversation = Conversation.objects.get(id=conversation_id)
+    qs = conversation.messages.exclude(message_type='document').order_by('timestamp')
+    if conversation.summary_until:
+        qs = qs.filter(timestamp__gt=conversation.summary_until)
+    messages = list(qs.only('direction', 'text_content', 'caption', 'message_type', 'timestamp'))
+
+    to_fold = messages[:-KEEP_RECENT_TURNS]
+    if not to_fold:
+        return None
+
+    turns = "\n".join(
+        f"{'User' if m.direction == 'inbound' else 'Bot'}: {(m.text_content or m.caption or f'[{m.message_type}]')[:300]}"
+        for m in to_fold
+    )
+    prompt = SUMMARY_PROMPT.format(summary=conversation.summary or "(none yet)", turns=turns)
+    summary = gemini._generate(prompt, telemetry.PATH_SUMMARY, user_id)[:SUMMARY_MAX_CHARS]
+
+    # Only apply if nobody else moved the summary forward meanwhile
+    updated = Conversation.objects.filter(
+        id=conversation_id, summary_until=conversation.summary_until
+    ).update(summary=summary, summary_until=to_fold[-1].timestamp)
+
+    if updated:
+        logger.info(f"🧠 Summarized {len(to_fold)} turns for conversation {conversation_id}")
+    return summary
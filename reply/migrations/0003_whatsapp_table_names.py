@@ -0,0 +1,161 @@
+"""
+Brings the migration state in line with Meta.db_table.
+
+0001 was generated before the models got their whatsapp_* table names, so the
+state still had Django's reply_* defaults (and no ChatSession, UnknownQuery,
+ServiceInquiry or WhatsAppUser.blocked_until), while production already has
+the whatsapp_* tables. The state is corrected here, ahead of every migration
+that touches these tables; the database side only renames / creates what is
+missing, so production is left alone and a database built from scratch ends
+up with the same tables.
+"""
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Parents first: renamed / created in this order
+MODELS = [
+    'WhatsAppUser', 'Conversation', 'Message', 'MediaFile', 'WhatsAppTemplate', 'WebhookLog',
+    'ChatSession', 'UnknownQuery', 'ServiceInquiry',
+]
+
+
+def sync_tables(apps, schema_editor):
+    connection = schema_editor.connection
+    existing = set(connection.introspection.table_names())
+    for name in MODELS:
+        model = apps.get_model('reply', name)
+        table = model._meta.db_table
+        legacy = f'reply_{name.lower()}'
+        if table in existing:
+            continue
+        if legacy in existing:
+            schema_editor.alter_db_table(model, legacy, table)
+        else:
+            schema_editor.create_model(model)
+
+    user = apps.get_model('reply', 'WhatsAppUser')
+    with connection.cursor() as cursor:
+        columns = {c.name for c in connection.introspection.get_table_description(cursor, user._meta.db_table)}
+    if 'blocked_until' not in columns:
+        schema_editor.add_field(user, user._meta.get_field('blocked_until'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reply', '0002_auto_20251031_1129'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterModelTable(
+                    name='conversation',
+                    table='whatsapp_conversation',
+                ),
+                migrations.AlterModelTable(
+                    name='mediafile',
+                    table='whatsapp_mediafile',
+                ),
+                migrations.AlterModelTable(
+                    name='message',
+                    table='whatsapp_message',
+                ),
+                migrations.AlterModelTable(
+                    name='webhooklog',
+                    table='whatsapp_webhooklog',
+                ),
+                migrations.AlterModelTable(
+                    name='whatsapptemplate',
+                    table='whatsapp_whatsapptemplate',
+                ),
+                migrations.AlterModelTable(
+                    name='whatsappuser',
+                    table='whatsapp_whatsappuser',
+                ),
+                migrations.AddField(
+                    model_name='whatsappuser',
+                    name='blocked_until',
+                    field=models.DateTimeField(blank=True, default=None, null=True),
+                ),
+                migrations.CreateModel(
+                    name='ChatSession',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('session_start', models.DateTimeField(auto_now_add=True)),
+                        ('session_end', models.DateTimeField(blank=True, null=True)),
+                        ('messages_exchanged', models.IntegerField(default=0)),
+                        ('primary_language', models.CharField(default='mixed', max_length=20)),
+                        ('had_inquiry', models.BooleanField(default=False)),
+                        ('inquiry_types', models.JSONField(default=list, help_text="['labor', 'spray', 'price', etc.]")),
+                        ('session_outcome', models.CharField(choices=[('ongoing', 'Still Active'), ('completed', 'Query Resolved'), ('escalated', 'Sent to Team'), ('abandoned', 'User Left')], default='ongoing', max_length=50)),
+                        ('last_user_message_at', models.DateTimeField(blank=True, null=True)),
+                        ('response_time_avg_seconds', models.IntegerField(default=0)),
+                        ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sessions', to='reply.conversation')),
+                    ],
+                    options={
+                        'db_table': 'whatsapp_chatsession',
+                        'ordering': ['-session_start'],
+                    },
+                ),
+                migrations.CreateModel(
+                    name='UnknownQuery',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('query_text', models.TextField()),
+                        ('query_language', models.CharField(max_length=20)),
+                        ('reason', models.CharField(choices=[('unknown_service', 'Unknown Service Type'), ('unknown_area', 'Area Not Covered'), ('unclear_request', 'Could Not Understand'), ('language_issue', 'Translation Problem')], max_length=100)),
+                        ('potential_service', models.CharField(blank=True, help_text='What service they might be asking for', max_length=200, null=True)),
+                        ('reviewed_by_admin', models.BooleanField(default=False)),
+                        ('admin_interpretation', models.TextField(blank=True, null=True)),
+                        ('similar_queries_count', models.IntegerField(default=1)),
+                        ('created_at', models.DateTimeField(auto_now_add=True)),
+                        ('whatsapp_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unknown_queries', to='reply.whatsappuser')),
+                    ],
+                    options={
+                        'db_table': 'whatsapp_unknownquery',
+                        'ordering': ['-created_at'],
+                    },
+                ),
+                migrations.CreateModel(
+                    name='ServiceInquiry',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('customer_name_in_chat', models.CharField(blank=True, help_text='Name they mentioned (कृष्णा, Kishan, etc.)', max_length=255, null=True)),
+                        ('service_type', models.CharField(help_text='Labor/Spray/Equipment/Transport/Storage/Processing/ANY', max_length=200)),
+                        ('service_description', models.TextField(help_text='Full description of what they asked for in their language')),
+                        ('service_language', models.CharField(choices=[('english', 'English'), ('hindi', 'Hindi'), ('marathi', 'Marathi'), ('hinglish', 'Hinglish'), ('mixed', 'Mixed Languages')], default='mixed', max_length=20)),
+                        ('quantity_needed', models.CharField(blank=True, help_text='35 workers, 50 tons, 10 acres, etc.', max_length=100, null=True)),
+                        ('location_mentioned', models.TextField(blank=True, help_text='Satara, Mumbai, Pune, Village name, ANY location', null=True)),
+                        ('is_serviceable_area', models.BooleanField(default=None, help_text='True if we operate here, False if not', null=True)),
+                        ('farm_size', models.CharField(blank=True, help_text='35 acre, 2 हेक्टर, etc.', max_length=100, null=True)),
+                        ('crop_type', models.CharField(blank=True, help_text='द्राक्ष, Grapes, Pomegranate, etc.', max_length=100, null=True)),
+                        ('crop_variety', models.CharField(blank=True, help_text='ARD 35, Thompson, etc.', max_length=100, null=True)),
+                        ('requested_date', models.CharField(blank=True, help_text='5 Dec, आज, कल, next week', max_length=100, null=True)),
+                        ('duration', models.CharField(blank=True, help_text='5 days, 1 week, 2 महिने', max_length=100, null=True)),
+                        ('status', models.CharField(choices=[('new', 'New Inquiry'), ('reviewing', 'Under Review'), ('serviceable', 'We Can Provide'), ('not_serviceable', 'Currently Not Available'), ('quoted', 'Price Quoted'), ('converted', 'Booking Confirmed'), ('lost', 'Customer Not Interested')], default='new', max_length=30)),
+                        ('urgency', models.CharField(choices=[('low', 'Normal'), ('medium', 'Interested'), ('high', 'Urgent'), ('critical', 'Emergency')], default='medium', max_length=20)),
+                        ('requested_price_info', models.BooleanField(default=False)),
+                        ('quoted_price', models.CharField(blank=True, help_text="Price or 'Will contact within 24hrs'", max_length=200, null=True)),
+                        ('original_query', models.TextField(help_text='Exact message from user')),
+                        ('ai_response', models.TextField(blank=True, help_text='What bot replied', null=True)),
+                        ('needs_human_review', models.BooleanField(default=False, help_text='True if unknown service/area')),
+                        ('admin_notes', models.TextField(blank=True, null=True)),
+                        ('converted_to_booking', models.BooleanField(default=False)),
+                        ('conversion_timestamp', models.DateTimeField(blank=True, null=True)),
+                        ('created_at', models.DateTimeField(auto_now_add=True)),
+                        ('updated_at', models.DateTimeField(auto_now=True)),
+                        ('followup_scheduled', models.DateTimeField(blank=True, null=True)),
+                        ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='service_inquiries', to='reply.conversation')),
+                        ('whatsapp_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='service_inquiries', to='reply.whatsappuser')),
+                    ],
+                    options={
+                        'db_table': 'whatsapp_serviceinquiry',
+                        'ordering': ['-created_at'],
+                        'indexes': [models.Index(fields=['status', 'urgency'], name='whatsapp_se_status_145b81_idx'), models.Index(fields=['service_type'], name='whatsapp_se_service_7f6b70_idx'), models.Index(fields=['needs_human_review'], name='whatsapp_se_needs_h_a8e10c_idx')],
+                    },
+                ),
+            ],
+        ),
+        migrations.RunPython(sync_tables, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reply', '0003_whatsapp_table_names'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True)),
+                ('path', models.CharField(help_text='greeting / labor / rag / ...', max_length=30)),
+                ('model', models.CharField(max_length=100)),
+                ('call_type', models.CharField(choices=[('generate', 'Generate'), ('embed', 'Embed')], default='generate', max_length=20)),
+                ('calls', models.IntegerField(default=0)),
+                ('errors', models.IntegerField(default=0)),
+                ('input_tokens', models.BigIntegerField(default=0)),
+                ('output_tokens', models.BigIntegerField(default=0)),
+                ('total_latency_ms', models.BigIntegerField(default=0)),
+                ('max_latency_ms', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('whatsapp_user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='api_usage', to='reply.whatsappuser')),
+            ],
+            options={
+                'db_table': 'whatsapp_apiusage',
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['date', 'path'], name='whatsapp_ap_date_ee71b0_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'path', 'model', 'call_type', 'whatsapp_user'), name='whatsapp_apiusage_bucket', nulls_distinct=False)],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reply', '0005_conversation_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='labor_slots',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
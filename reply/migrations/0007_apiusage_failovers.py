@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reply', '0006_conversation_labor_slots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apiusage',
+            name='failovers',
+            field=models.IntegerField(default=0, help_text='Calls served by a fallback model (reply.model_router)'),
+        ),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reply', '0007_apiusage_failovers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Activity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('name_marathi', models.CharField(blank=True, max_length=200, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'calender_activity',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Crop',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('name_marathi', models.CharField(blank=True, max_length=200, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'calender_crop',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='CropVariety',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('name_marathi', models.CharField(blank=True, max_length=200, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'calender_cropvariety',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='DayRange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_day', models.IntegerField()),
+                ('end_day', models.IntegerField()),
+                ('info', models.TextField(blank=True)),
+                ('info_marathi', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'calender_dayrange',
+                'ordering': ['crop_variety', 'start_day'],
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='DayRangeProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dosage', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('dosage_unit', models.CharField(blank=True, choices=[('ml/liter', 'Milliliter per Liter'), ('gm/liter', 'Gram per Liter'), ('ml/acre', 'Milliliter per Acre'), ('gm/acre', 'Gram per Acre'), ('kg/acre', 'Kilogram per Acre'), ('liter/acre', 'Liter per Acre'), ('ml/200liter', 'Milliliter per 200 Liter')], max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'calender_dayrangeproduct',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('name_marathi', models.CharField(blank=True, max_length=200, null=True)),
+                ('product_type', models.CharField(blank=True, help_text='Fungicide, Fertilizer, ...', max_length=100, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'calender_product',
+                'managed': False,
+            },
+        ),
+    ]
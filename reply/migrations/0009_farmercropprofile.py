@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reply', '0008_crop_calendar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FarmerCropProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pruning_date', models.DateField()),
+                ('language', models.CharField(choices=[('mr', 'Marathi'), ('hi', 'Hindi'), ('en', 'English')], default='mr', max_length=10)),
+                ('reminders_enabled', models.BooleanField(default=True)),
+                ('last_reminded_on', models.DateField(blank=True, help_text='Last day a reminder was sent (catch-up starts after it)', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('crop_variety', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='farmer_profiles', to='reply.cropvariety')),
+                ('whatsapp_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='crop_profiles', to='reply.whatsappuser')),
+            ],
+            options={
+                'db_table': 'whatsapp_farmercropprofile',
+                'indexes': [models.Index(fields=['reminders_enabled', 'crop_variety'], name='whatsapp_fa_reminde_22160b_idx')],
+                'unique_together': {('whatsapp_user', 'crop_variety', 'pruning_date')},
+            },
+        ),
+    ]
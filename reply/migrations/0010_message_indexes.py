@@ -0,0 +1,58 @@
+"""
+Composite / partial indexes on whatsapp_message, built without locking it.
+
+CREATE INDEX CONCURRENTLY cannot run in a transaction (atomic = False) and is
+PostgreSQL-only, so the SQL is issued per vendor; the migration state gets
+the matching Meta.indexes through AddIndex.
+"""
+from django.db import migrations, models
+
+INDEXES = [
+    ('whatsapp_msg_conv_ts_desc', '(conversation_id, timestamp DESC)', ''),
+    ('whatsapp_msg_conv_dir_ts', '(conversation_id, direction, timestamp)', ''),
+    ('whatsapp_msg_open_status', '(status, timestamp)', "WHERE status IN ('pending', 'failed')"),
+]
+
+
+def create_indexes(apps, schema_editor):
+    concurrently = 'CONCURRENTLY ' if schema_editor.connection.vendor == 'postgresql' else ''
+    table = apps.get_model('reply', 'Message')._meta.db_table
+    for name, columns, where in INDEXES:
+        schema_editor.execute(f'CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table} {columns} {where}'.strip())
+
+
+def drop_indexes(apps, schema_editor):
+    concurrently = 'CONCURRENTLY ' if schema_editor.connection.vendor == 'postgresql' else ''
+    for name, _, _ in INDEXES:
+        schema_editor.execute(f'DROP INDEX {concurrently}IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('reply', '0009_farmercropprofile'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_indexes, drop_indexes),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='message',
+                    index=models.Index(fields=['conversation', '-timestamp'], name='whatsapp_msg_conv_ts_desc'),
+                ),
+                migrations.AddIndex(
+                    model_name='message',
+                    index=models.Index(fields=['conversation', 'direction', 'timestamp'], name='whatsapp_msg_conv_dir_ts'),
+                ),
+                migrations.AddIndex(
+                    model_name='message',
+                    index=models.Index(condition=models.Q(('status__in', ['pending', 'failed'])), fields=['status', 'timestamp'], name='whatsapp_msg_open_status'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reply', '0010_message_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='escalation_strikes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_strike_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
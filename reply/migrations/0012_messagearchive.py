@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 08:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reply', '0011_conversation_escalation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('message', 'Messages'), ('webhooklog', 'Webhook logs')], default='message', max_length=20)),
+                ('path', models.CharField(help_text='Name in the default storage', max_length=500)),
+                ('first_at', models.DateTimeField()),
+                ('last_at', models.DateTimeField()),
+                ('row_count', models.IntegerField()),
+                ('size_bytes', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('conversation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archives', to='reply.conversation')),
+            ],
+            options={
+                'db_table': 'whatsapp_messagearchive',
+                'ordering': ['first_at'],
+                'indexes': [models.Index(fields=['conversation', 'first_at'], name='whatsapp_me_convers_7ce99e_idx')],
+            },
+        ),
+    ]
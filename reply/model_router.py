@@ -0,0 +1,146 @@
+"""
+Per-path model tiering with latency-aware failover.
+
+GEMINI_MODEL_ROUTES maps each generate_reply path to an ordered model list:
+the first is the primary, the rest are fallbacks. The router keeps rolling
+latency / error stats per model (per worker) and a cluster-wide cooldown
+after a 429, and hands GeminiService the models to try, healthy ones first.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import telemetry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_ROUTES = {
+    telemetry.PATH_GREETING: ['gemini-2.0-flash-lite', 'gemini-2.0-flash-exp'],
+    telemetry.PATH_LABOR: ['gemini-2.0-flash-lite', 'gemini-2.0-flash-exp'],
+    telemetry.PATH_RAG: ['gemini-2.0-flash-exp', 'gemini-2.0-flash-lite'],
+    telemetry.PATH_SUMMARY: ['gemini-2.0-flash-lite', 'gemini-2.0-flash-exp'],
+    'default': ['gemini-2.0-flash-exp'],
+}
+MODEL_ROUTES = {**DEFAULT_MODEL_ROUTES, **getattr(settings, 'GEMINI_MODEL_ROUTES', {})}
+
+# A model is "slow" once its rolling p95 passes this
+SLOW_P95_MS = getattr(settings, 'GEMINI_SLOW_P95_MS', 8000)
+MAX_ERROR_RATE = 0.5
+MIN_SAMPLES = 5
+WINDOW_CALLS = 100
+WINDOW_SECONDS = 300
+RATE_LIMIT_COOLDOWN_SECONDS = 30
+# Never hedge sooner than this, even if the model is usually very fast
+MIN_HEDGE_MS = 1500
+
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class ModelStats:
+    """Rolling window of (time, latency_ms, error) for one model"""
+
+    def __init__(self):
+        self.samples = deque(maxlen=WINDOW_CALLS)
+
+    def add(self, latency_ms, error):
+        self.samples.append((time.monotonic(), latency_ms, error))
+
+    def snapshot(self):
+        cutoff = time.monotonic() - WINDOW_SECONDS
+        recent = [(latency, error) for at, latency, error in self.samples if at >= cutoff]
+        if not recent:
+            return {'samples': 0, 'p50': None, 'p95': None, 'error_rate': 0.0}
+        latencies = sorted(latency for latency, error in recent if not error) or [0]
+        return {
+            'samples': len(recent),
+            'p50': _percentile(latencies, 0.50),
+            'p95': _percentile(latencies, 0.95),
+            'error_rate': sum(1 for _, error in recent if error) / len(recent),
+        }
+
+
+class ModelRouter:
+    def __init__(self, routes=None, slow_p95_ms=SLOW_P95_MS):
+        self.routes = routes or MODEL_ROUTES
+        self.slow_p95_ms = slow_p95_ms
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def models_for(self, path):
+        return self.routes.get(path) or self.routes['default']
+
+    def _stats_for(self, model):
+        with self._lock:
+            return self._stats.setdefault(model, ModelStats())
+
+    def observe(self, model, latency_ms, error=False):
+        stats = self._stats_for(model)
+        with self._lock:
+            stats.add(latency_ms, error)
+
+    def stats(self, model):
+        stats = self._stats_for(model)
+        with self._lock:
+            return stats.snapshot()
+
+    def hedge_delay(self, model):
+        """Seconds after which a duplicate request is worth it (the model's p95)"""
+        stats = self.stats(model)
+        if stats['samples'] < MIN_SAMPLES or not stats['p95']:
+            return None
+        return max(stats['p95'], MIN_HEDGE_MS) / 1000
+
+    def mark_rate_limited(self, model, seconds=RATE_LIMIT_COOLDOWN_SECONDS):
+        try:
+            cache.set(f'model_cooldown:{model}', 1, timeout=seconds)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not record the cooldown of {model}: {e}")
+
+    def _cooling_down(self, model):
+        """Rate limited recently; an unreachable cache counts as not"""
+        try:
+            return bool(cache.get(f'model_cooldown:{model}'))
+        except Exception as e:
+            logger.warning(f"⚠️ Model cooldown of {model} unavailable: {e}")
+            return False
+
+    def unhealthy_reason(self, model):
+        """Why this model should be skipped right now, or None"""
+        if self._cooling_down(model):
+            return 'rate_limited'
+        stats = self.stats(model)
+        if stats['samples'] < MIN_SAMPLES:
+            return None
+        if stats['error_rate'] > MAX_ERROR_RATE:
+            return f"errors {stats['error_rate']:.0%}"
+        if stats['p95'] > self.slow_p95_ms:
+            return f"p95 {stats['p95']:.0f}ms"
+        return None
+
+    def candidates(self, path):
+        """
+        [(model, is_failover), ...] to try in order: healthy models in their
+        configured order, then the unhealthy ones as a last resort.
+        """
+        models = self.models_for(path)
+        primary = models[0]
+        healthy, unhealthy = [], []
+        for model in models:
+            reason = self.unhealthy_reason(model)
+            if reason:
+                unhealthy.append(model)
+                if model == primary and len(models) > 1:
+                    logger.info(f"🔀 {path}: skipping {model} ({reason})")
+            else:
+                healthy.append(model)
+        return [(model, model != primary) for model in healthy + unhealthy]
+
+
+router = ModelRouter()
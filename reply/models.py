@@ -27,6 +27,16 @@ class Conversation(models.Model):
     last_message_preview = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    
+    # Rolling memory (reply.memory) - older turns compressed for the LLM prompt
+    summary = models.TextField(blank=True, default='')
+    summary_until = models.DateTimeField(null=True, blank=True,
+                                         help_text="Timestamp of the last message folded into summary")
+    # Labor booking slots (reply.slots) - Redis is the live copy, this the snapshot
+    labor_slots = models.JSONField(default=dict, blank=True)
+    # Escalation strikes (reply.escalation) - the cache is the live copy, this the mirror
+    escalation_strikes = models.IntegerField(default=0)
+    last_strike_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         ordering = ['-updated_at']
@@ -83,11 +93,50 @@ class Message(models.Model):
     class Meta:
         ordering = ['timestamp']
         db_table = 'whatsapp_message'
+        # Created CONCURRENTLY by migration 0010_message_indexes (see explain_hot_queries)
+        indexes = [
+            # Recent history for every reply (reply.memory.recent_history_queryset)
+            models.Index(fields=['conversation', '-timestamp'], name='whatsapp_msg_conv_ts_desc'),
+            # Burst collection / escalation counts filter on direction
+            models.Index(fields=['conversation', 'direction', 'timestamp'], name='whatsapp_msg_conv_dir_ts'),
+            # Only the few undelivered messages are indexed
+            models.Index(fields=['status', 'timestamp'], name='whatsapp_msg_open_status',
+                         condition=models.Q(status__in=['pending', 'failed'])),
+        ]
 
     def __str__(self):
         return f"{self.direction} - {self.message_type} - {self.timestamp}"
 
 
+class MessageArchive(models.Model):
+    """Tombstone for a gzipped JSONL file of rows moved out of the DB (reply.archive)"""
+    KIND_CHOICES = [
+        ('message', 'Messages'),
+        ('webhooklog', 'Webhook logs'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='message')
+    # Messages are archived per conversation; webhook logs have none
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='archives',
+                                     null=True, blank=True)
+    path = models.CharField(max_length=500, help_text="Name in the default storage")
+    first_at = models.DateTimeField()
+    last_at = models.DateTimeField()
+    row_count = models.IntegerField()
+    size_bytes = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['first_at']
+        db_table = 'whatsapp_messagearchive'
+        indexes = [
+            models.Index(fields=['conversation', 'first_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.row_count} {self.kind} rows {self.first_at:%Y-%m-%d}..{self.last_at:%Y-%m-%d}"
+
+
 class MediaFile(models.Model):
     message = models.OneToOneField(Message, on_delete=models.CASCADE, related_name='media_file')
     file = models.FileField(upload_to='whatsapp_media/%Y/%m/%d/')
@@ -331,4 +380,192 @@ class UnknownQuery(models.Model):
     
     class Meta:
         db_table = 'whatsapp_unknownquery'
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+
+
+class ApiUsage(models.Model):
+    """
+    Gemini usage rolled up per day / path / model / user.
+    Rows are upserted in batches by reply.telemetry.UsageRecorder.
+    """
+    CALL_TYPES = [
+        ('generate', 'Generate'),
+        ('embed', 'Embed'),
+    ]
+
+    date = models.DateField(db_index=True)
+    path = models.CharField(max_length=30, help_text="greeting / labor / rag / ...")
+    model = models.CharField(max_length=100)
+    call_type = models.CharField(max_length=20, choices=CALL_TYPES, default='generate')
+    whatsapp_user = models.ForeignKey(WhatsAppUser, on_delete=models.SET_NULL, null=True, blank=True,
+                                      related_name='api_usage')
+
+    calls = models.IntegerField(default=0)
+    errors = models.IntegerField(default=0)
+    input_tokens = models.BigIntegerField(default=0)
+    output_tokens = models.BigIntegerField(default=0)
+    total_latency_ms = models.BigIntegerField(default=0)
+    max_latency_ms = models.IntegerField(default=0)
+    failovers = models.IntegerField(default=0, help_text="Calls served by a fallback model (reply.model_router)")
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'whatsapp_apiusage'
+        ordering = ['-date']
+        constraints = [
+            # Rows without a user are upserted too, so NULL must match NULL
+            models.UniqueConstraint(
+                fields=['date', 'path', 'model', 'call_type', 'whatsapp_user'],
+                name='whatsapp_apiusage_bucket', nulls_distinct=False,
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['date', 'path']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.path} {self.model} ({self.calls} calls)"
+
+
+
+# --- Crop calendar (shared tables) ---
+# The calender_* schema belongs to the crop calendar app that shares this
+# database: its migrations create and alter these tables, so managed=False
+# here and field changes must land there first. This app reads them
+# (reply.crop_calendar, reply.product_search) and writes their rows only
+# through the import_schedule command (reply.schedule_import).
+
+class Crop(models.Model):
+    name = models.CharField(max_length=200)
+    name_marathi = models.CharField(max_length=200, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        managed = False
+        db_table = 'calender_crop'
+
+    def __str__(self):
+        return self.name
+
+
+class CropVariety(models.Model):
+    name = models.CharField(max_length=200)
+    name_marathi = models.CharField(max_length=200, blank=True, null=True)
+    crop = models.ForeignKey(Crop, on_delete=models.CASCADE, related_name='varieties')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        managed = False
+        db_table = 'calender_cropvariety'
+
+    def __str__(self):
+        return self.name
+
+
+class Activity(models.Model):
+    name = models.CharField(max_length=200)
+    name_marathi = models.CharField(max_length=200, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        managed = False
+        db_table = 'calender_activity'
+
+    def __str__(self):
+        return self.name
+
+
+class Product(models.Model):
+    name = models.CharField(max_length=200)
+    name_marathi = models.CharField(max_length=200, blank=True, null=True)
+    product_type = models.CharField(max_length=100, blank=True, null=True, help_text="Fungicide, Fertilizer, ...")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        managed = False
+        db_table = 'calender_product'
+
+    def __str__(self):
+        return self.name
+
+
+class DayRange(models.Model):
+    """Days start_day..end_day after pruning (negative = before) for one variety"""
+    start_day = models.IntegerField()
+    end_day = models.IntegerField()
+    info = models.TextField(blank=True)
+    info_marathi = models.TextField(blank=True, null=True)
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name='day_ranges')
+    crop_variety = models.ForeignKey(CropVariety, on_delete=models.CASCADE, related_name='day_ranges')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        managed = False
+        db_table = 'calender_dayrange'
+        ordering = ['crop_variety', 'start_day']
+
+    def __str__(self):
+        return f"{self.crop_variety} day {self.start_day}-{self.end_day}: {self.activity}"
+
+
+class DayRangeProduct(models.Model):
+    DOSAGE_UNIT_CHOICES = [
+        ('ml/liter', 'Milliliter per Liter'),
+        ('gm/liter', 'Gram per Liter'),
+        ('ml/acre', 'Milliliter per Acre'),
+        ('gm/acre', 'Gram per Acre'),
+        ('kg/acre', 'Kilogram per Acre'),
+        ('liter/acre', 'Liter per Acre'),
+        ('ml/200liter', 'Milliliter per 200 Liter'),
+    ]
+
+    dosage = models.DecimalField(max_digits=10, decimal_places=2)
+    dosage_unit = models.CharField(max_length=20, choices=DOSAGE_UNIT_CHOICES, blank=True)
+    day_range = models.ForeignKey(DayRange, on_delete=models.CASCADE, related_name='products')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='day_range_products')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        managed = False
+        db_table = 'calender_dayrangeproduct'
+
+    def __str__(self):
+        return f"{self.product} {self.dosage} {self.dosage_unit}"
+
+
+class FarmerCropProfile(models.Model):
+    """A farmer's plot: which variety, when it was pruned - drives reply.reminders"""
+    LANGUAGE_CHOICES = [
+        ('mr', 'Marathi'),
+        ('hi', 'Hindi'),
+        ('en', 'English'),
+    ]
+
+    whatsapp_user = models.ForeignKey(WhatsAppUser, on_delete=models.CASCADE, related_name='crop_profiles')
+    # calender_* belongs to the crop calendar app: no DB constraint across apps
+    crop_variety = models.ForeignKey(CropVariety, on_delete=models.DO_NOTHING, db_constraint=False,
+                                     related_name='farmer_profiles')
+    pruning_date = models.DateField()
+    language = models.CharField(max_length=10, choices=LANGUAGE_CHOICES, default='mr')
+    reminders_enabled = models.BooleanField(default=True)
+    last_reminded_on = models.DateField(null=True, blank=True,
+                                        help_text="Last day a reminder was sent (catch-up starts after it)")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'whatsapp_farmercropprofile'
+        unique_together = [('whatsapp_user', 'crop_variety', 'pruning_date')]
+        indexes = [
+            models.Index(fields=['reminders_enabled', 'crop_variety']),
+        ]
+
+    def __str__(self):
+        return f"{self.whatsapp_user} - {self.crop_variety_id} pruned {self.pruning_date}"
@@ -0,0 +1,214 @@
+"""
+Precomputed product-relationship documents.
+
+GET api/product-relationships/<id>/ returns a product with every place the
+crop calendar uses it (crop -> variety -> activity -> day ranges, plus a
+flat all_relationships list). Building that walks five tables, so each
+product's document is built once, serialized to UTF-8 JSON and kept in the
+cache as (etag, bytes); the view serves the bytes as they are.
+
+Documents are rebuilt incrementally: the signals in reply.signals (and
+import_schedule, whose bulk writes send none) name the products a write
+touched, and only those are rebuilt once the transaction commits (one
+batched callback per transaction / savepoint, so a rollback drops its ids
+with it). Renaming a crop, variety or activity drops the cached documents
+instead; they are rebuilt on their next read. The crop-calendar app writes
+these tables too and sends no signals here, so documents also expire after
+DOCUMENT_TTL_SECONDS.
+"""
+import hashlib
+import json
+import logging
+import threading
+import weakref
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import DayRangeProduct, Product
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'product_doc'
+GENERATION_KEY = 'product_doc_generation'
+# Writes made here rebuild documents at once; the TTL bounds how stale one
+# can get after a write by the crop-calendar app (same as the clients' max-age)
+DOCUMENT_TTL_SECONDS = 300
+
+
+def _key(product_id, generation):
+    return f'{KEY_PREFIX}:{generation}:{product_id}'
+
+
+def _generation():
+    """Bumped by invalidate_all(); old documents are simply never read again"""
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, 1, timeout=None)
+        generation = cache.get(GENERATION_KEY, 1)
+    return generation
+
+
+def _named(obj):
+    return {'id': obj.id, 'name': obj.name, 'name_marathi': obj.name_marathi}
+
+
+def _day_range(day_range):
+    return {
+        'id': day_range.id,
+        'start_day': day_range.start_day,
+        'end_day': day_range.end_day,
+        'info': day_range.info,
+        'info_marathi': day_range.info_marathi,
+    }
+
+
+def build_documents(product_ids):
+    """{product_id: document dict} for the products that exist; 2 queries"""
+    products = {p.id: p for p in Product.objects.filter(id__in=product_ids)}
+    documents = {}
+    for product in products.values():
+        documents[product.id] = {
+            'product': {**_named(product), 'product_type': product.product_type},
+            'total_uses': 0,
+            'grouped_by_crop': [],
+            'all_relationships': [],
+        }
+    if not documents:
+        return documents
+
+    lines = (
+        DayRangeProduct.objects.filter(product_id__in=documents)
+        .select_related('day_range__crop_variety__crop', 'day_range__activity')
+        .order_by('day_range__crop_variety__crop_id', 'day_range__crop_variety_id',
+                  'day_range__start_day', 'day_range_id', 'id')
+    )
+    # product -> crop -> variety -> activity -> [uses], in calendar order
+    groups = {}
+    for line in lines:
+        day_range = line.day_range
+        variety = day_range.crop_variety
+        crop, activity = variety.crop, day_range.activity
+        use = {
+            'day_range_product_id': line.id,
+            'day_range': _day_range(day_range),
+            'dosage': float(line.dosage),
+            'dosage_unit': line.dosage_unit,
+            'dosage_unit_display': line.get_dosage_unit_display(),
+        }
+        document = documents[line.product_id]
+        document['all_relationships'].append({
+            **use,
+            'activity': _named(activity),
+            'variety': _named(variety),
+            'crop': _named(crop),
+        })
+        crops = groups.setdefault(line.product_id, {})
+        crop_group = crops.setdefault(crop.id, {'crop': _named(crop), 'varieties': {}})
+        variety_group = crop_group['varieties'].setdefault(variety.id, {'variety': _named(variety), 'activities': {}})
+        activity_group = variety_group['activities'].setdefault(
+            activity.id, {'activity': _named(activity), 'day_ranges': []})
+        activity_group['day_ranges'].append(use)
+
+    for product_id, crops in groups.items():
+        document = documents[product_id]
+        document['total_uses'] = len(document['all_relationships'])
+        document['grouped_by_crop'] = [
+            {
+                'crop': crop_group['crop'],
+                'varieties': [
+                    {'variety': variety_group['variety'], 'activities': list(variety_group['activities'].values())}
+                    for variety_group in crop_group['varieties'].values()
+                ],
+            }
+            for crop_group in crops.values()
+        ]
+    return documents
+
+
+def serialize(document):
+    """(strong etag, UTF-8 JSON bytes)"""
+    body = json.dumps(document, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return f'"{hashlib.sha1(body).hexdigest()}"', body
+
+
+def rebuild(product_ids):
+    """Rebuild and store the documents of these products; deleted products are dropped"""
+    product_ids = set(product_ids)
+    if not product_ids:
+        return {}
+    generation = _generation()
+    stored = {product_id: serialize(document) for product_id, document in build_documents(product_ids).items()}
+    cache.set_many({_key(product_id, generation): value for product_id, value in stored.items()},
+                    timeout=DOCUMENT_TTL_SECONDS)
+    cache.delete_many([_key(product_id, generation) for product_id in product_ids - set(stored)])
+    logger.info(f"📦 Rebuilt {len(stored)} product document(s)")
+    return stored
+
+
+def get_document(product_id):
+    """(etag, bytes) for one product, built on a cache miss; None if no such product"""
+    document = cache.get(_key(product_id, _generation()))
+    if document is None:
+        document = rebuild([product_id]).get(product_id)
+    return document
+
+
+def _flush(product_ids):
+    try:
+        rebuild(product_ids)
+    except Exception as e:
+        # Stale documents are dropped so readers rebuild them
+        logger.error(f"❌ Product document rebuild failed: {e}")
+        cache.delete_many([_key(product_id, _generation()) for product_id in product_ids])
+
+
+class _RebuildBatch:
+    """The on_commit callback of one atomic block; collects the ids to rebuild"""
+
+    def __init__(self):
+        self.product_ids = set()
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        _flush(self.product_ids)
+
+
+# (db alias, savepoint ids) -> the batch queued for that atomic block. Only
+# the on_commit queue holds a batch strongly: once Django runs it, or drops
+# it with a rolled-back block, its entry disappears from here too.
+_batches = threading.local()
+
+
+def _open_batches():
+    if not hasattr(_batches, 'by_block'):
+        _batches.by_block = weakref.WeakValueDictionary()
+    return _batches.by_block
+
+
+def schedule_rebuild(product_ids):
+    """Rebuild these products' documents once the current transaction commits (batched)"""
+    product_ids = {product_id for product_id in product_ids if product_id}
+    if not product_ids:
+        return
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        _flush(product_ids)
+        return
+    # The batch lives in the on_commit callback, so a rollback discards it too
+    block = (connection.alias, tuple(connection.savepoint_ids))
+    batch = _open_batches().get(block)
+    if batch is None or batch.done:
+        batch = _RebuildBatch()
+        _open_batches()[block] = batch
+        transaction.on_commit(batch)
+    batch.product_ids.update(product_ids)
+
+
+def invalidate_all():
+    """Drop every document (crop / variety / activity renamed)"""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, 1, timeout=None)
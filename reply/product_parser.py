@@ -0,0 +1,228 @@
+"""
+Product-line parser for crop schedule sheets (ported from ban.py).
+
+"कमाब-२६ - ३ मिली + ईमिडा - ०.५ मिली प्रति लिटर पाणी" ->
+[('कमाब-२६', 'Kamab 26', '3', 'ml/liter'), ('ईमिडा', 'Imida', '0.5', 'ml/liter')]
+
+Patterns are compiled once, digits go through one translate table and units
+are found with a small trie. Product names resolve through canonical_key():
+spelling variants that differ only in spaces, hyphens, nukta or long/short
+vowel signs ("रॅलीगोल्ड" / "रॅली गोल्ड", "इकलोनमॅक्स" / "ईक-लोन-मॅक्स") share
+one key, so they map to one Product without listing every variant.
+"""
+import re
+
+from .text_utils import DEVANAGARI_DIGITS
+
+# Marathi spelling -> English product name (from ban.py)
+PRODUCT_TRANS = {
+    # Fungicides & Bactericides
+    'कॉपर': 'Copper Oxychloride', 'स्ट्रेप्टोमायसीन': 'Streptomycin',
+    'रॅलीगोल्ड': 'Rallygold', 'रॅली गोल्ड': 'Rallygold', 'क्षीरवॅम': 'Shirvam',
+    'शीरवॅम': 'Shirvam', 'शीर वॅम': 'Shirvam', 'साफ': 'Saaf', 'स्कोर': 'Score',
+    'कवच': 'Kavach', 'अट्राकॉल': 'Antracol', 'अॅन्ट्राकॉल': 'Antracol',
+    'टिल्ट': 'Tilt', 'अमिस्टर टॉप': 'Amistar Top', 'अमिस्टार': 'Amistar',
+    'ताकत': 'Takat', 'कोणीका': 'Konica', 'कोनिका': 'Konica',
+    'व्यालीडामायसीन': 'Validamycin', 'वॅलीडामायसीन': 'Validamycin',
+    
+    # Insecticides
+    'डेंटासू': 'Dentasu', 'प्रोक्लेम': 'Proclaim', 'अॅक्ट्रा': 'Actara',
+    'अक्टरा': 'Actara', 'रिजेंट': 'Regent', 'क्लोरोपायरिफोस': 'Chloropyrifos',
+    'सायपरमेथ्रिन': 'Cypermethrin', 'मेटाडोर': 'Metador', 'डेसिस १००': 'Decis 100',
+    'ट्रेसर': 'Tracer', 'रिलोन': 'Rilon', 'कोंटाफ': 'Contaf', 'कॉनटाफ': 'Contaf',
+    'टाटा माणिक': 'Tata Manik', 'टाटा मिडा': 'Tata Mida', 'इमिडा': 'Imida',
+    'ईमिडा': 'Imida', 'कॉन्फिडॉर': 'Confidor',
+    
+    # Bio-products & Growth Promoters
+    'व्हिटाफ्लोरा': 'Vitaflora', 'व्हीटाफ्लोरा': 'Vitaflora',
+    'ईक-लोन-मॅक्स': 'Eclonmax', 'ईक-लोनमॅक्स': 'Eclonmax', 'इकलोनमॅक्स': 'Eclonmax',
+    'इक-लोनमॅक्स': 'Eclonmax', 'बॅटालॉंन': 'Batalon', 'बॅटोलोन': 'Batalon',
+    'आद्रा': 'Ardra', 'जेष्ठा': 'Jeshtha', 'कमाब': 'Kamab', 'कमाब २६': 'Kamab 26',
+    'बम्बार्डिअर': 'Bombardier', 'बंबार्डीयर': 'Bombardier',
+    
+    # Fertilizers - NPK
+    'सह्याद्री१९:१९:१९': 'Sahyadri 19:19:19', 'सह्याद्री १९:१९:१९': 'Sahyadri 19:19:19',
+    'सह्याद्री१२:११:१८': 'Sahyadri 12:11:18', 'सह्याद्री १२:११:१८': 'Sahyadri 12:11:18',
+    'Ngooo १२:११:१८': 'Ngooo 12:11:18', 'सह्याद्री १३:००:४५': 'Sahyadri 13:00:45',
+    'सह्याद्री ००: ५२: ३४': 'Sahyadri 00:52:34', 'सह्याद्री ००:५२:३४': 'Sahyadri 00:52:34',
+    
+    # Fertilizers - Single nutrients
+    'कॅल्शियम नायट्रेट': 'Calcium Nitrate', 'कॅल्शियम थायोसल्फेट': 'Calcium Thiosulfate',
+    'सिंगल सुपर फॉस्फेट': 'Single Super Phosphate', 'SSP': 'SSP',
+    
+    # Micronutrients
+    'झीनोक्स': 'Zinox', 'झिंकमोर': 'Zincmore', 'सोलूबोर': 'Solubor',
+    'झेड ७८': 'Z-78', 'Z-७८': 'Z-78', 'Z -७८': 'Z-78',
+    'क्रॉप सिंक': 'Crop Zinc', 'क्रॉपसींक': 'Crop Zinc',
+    'रॅली गोल्ड दाणेदार': 'Rallygold Granules',
+    'मिक्स मायक्रोन्युट्रीयंट': 'Mix Micronutrient',
+    
+    # Organic & Bio fertilizers
+    'सेंद्रिय खत': 'Organic Manure', 'शेनखत': 'Farm Yard Manure',
+    'निम पेंड': 'Neem Cake', 'निम पावडर': 'Neem Powder',
+    'सल्फोप्रिल': 'Sulfopril', 'सफ्लोप्रील': 'Sulfopril',
+    'NTS पोटॅशियम ह्युमेट': 'NTS Potassium Humate', 'पोटॅशियम ह्युमेट': 'Potassium Humate',
+    
+    # Specialty products
+    'सॅलीसिओ': 'Saliceo', 'सॅलीसीओ': 'Saliceo', 'सरप्लस': 'Surplus',
+    'धनिष्ठा': 'Dhanishtha',
+}
+
+
+BRAND_PREFIX_RE = re.compile(r'^सह्याद्री\s*')
+
+# "name - 3 मिली ..." after digit translation. Greedy name: the dose is the
+# LAST "- number unit" ("कमाब-२६ - ३ मिली")
+DOSE_RE = re.compile(r'^(.*\S)\s*[-–]\s*(\d+(?:\.\d+)?)\s*([^\d\-–]+)$')
+
+# Spelling folds for canonical_key(): nukta and virama dropped, long vowels -> short,
+# candra/anusvara variants -> one form, separators dropped
+KEY_FOLD = str.maketrans({
+    '\u093c': None,  # nukta
+    '\u094d': None,  # virama: 'ईक्लोन' == 'इकलोन', 'मॅक्स' == 'मॅकस'
+    'ी': 'ि', 'ू': 'ु',  # long i / u matra -> short
+    'ई': 'इ', 'ऊ': 'उ',  # long i / u vowel -> short
+    'ॅ': 'े', 'ॉ': 'ो',  # candra e / o matra -> e / o
+    'ऍ': 'ए', 'ऑ': 'ओ',  # candra e / o vowel -> e / o
+    'ँ': 'ं',                # candrabindu -> anusvara
+    ' ': None, '\t': None, '\n': None, '-': None, '–': None, '.': None, '_': None,
+    **{ord(digit): str(value) for value, digit in enumerate('०१२३४५६७८९')},
+})
+
+# Unit spellings -> unit; matched leftmost-longest through UNIT_TRIE
+UNIT_WORDS = {
+    'ग्रॅम': 'gm', 'ग्राम': 'gm', 'gm': 'gm', 'gram': 'gm',
+    'किलो': 'kg', 'kg': 'kg',
+    'मिली': 'ml', 'मिलि': 'ml', 'मीली': 'ml', 'ml': 'ml',
+    'लिटर': 'liter', 'ली': 'liter', 'लीटर': 'liter', 'liter': 'liter', 'litre': 'liter', 'ltr': 'liter',
+    'ट्रक': 'truck',
+    'टन': 'ton',
+}
+DEFAULT_UNIT = 'ml'
+
+# What the dose is per, first match wins
+PER_PATTERNS = [
+    (re.compile(r'एकर|acre', re.IGNORECASE), 'acre'),
+    (re.compile(r'प्रती लिटर|per liter', re.IGNORECASE), 'liter'),
+    (re.compile(r'प्रती रोप'), 'plant'),
+    (re.compile(r'प्रती पोंगा'), 'pseudostem'),
+]
+DEFAULT_PER = 'liter'  # sprays
+
+# Segments that are instructions, not products
+INSTRUCTION_RE = re.compile(r'हेतु|प्रती रोप')
+
+
+def canonical_key(name):
+    """Spelling-insensitive product key: 'रॅली गोल्ड' == 'रॅलीगोल्ड', 'Z -७८' == 'z-78'"""
+    if not name:
+        return ''
+    return BRAND_PREFIX_RE.sub('', str(name).strip()).lower().translate(KEY_FOLD)
+
+
+class UnitTrie:
+    """Character trie over UNIT_WORDS; find() returns the leftmost, longest unit"""
+
+    __slots__ = ('root',)
+    END = None  # key of the unit stored at a node
+
+    def __init__(self, words):
+        self.root = {}
+        for word, unit in words.items():
+            node = self.root
+            for char in word.lower():
+                node = node.setdefault(char, {})
+            node[self.END] = unit
+
+    def find(self, text, default=DEFAULT_UNIT):
+        text = text.lower()
+        for start in range(len(text)):
+            node, found = self.root, None
+            for char in text[start:]:
+                node = node.get(char)
+                if node is None:
+                    break
+                found = node.get(self.END, found)
+            if found:
+                return found
+        return default
+
+
+UNIT_TRIE = UnitTrie(UNIT_WORDS)
+
+
+class ProductNameIndex:
+    """canonical_key(spelling) -> canonical English product name"""
+
+    __slots__ = ('names',)
+
+    def __init__(self, translations=None):
+        self.names = {}
+        for spelling, name in (translations or {}).items():
+            self.add(spelling, name)
+            self.add(name, name)
+
+    def add(self, spelling, name):
+        """First name registered for a key wins"""
+        key = canonical_key(spelling)
+        if key:
+            self.names.setdefault(key, name)
+
+    def resolve(self, spelling, default=None):
+        return self.names.get(canonical_key(spelling), default)
+
+    def __len__(self):
+        return len(self.names)
+
+
+PRODUCT_INDEX = ProductNameIndex(PRODUCT_TRANS)
+
+
+def translate_product(marathi_name, index=PRODUCT_INDEX):
+    """English name for a Marathi product spelling (brand prefix dropped)"""
+    marathi_name = BRAND_PREFIX_RE.sub('', marathi_name.strip())
+    return index.resolve(marathi_name, marathi_name)
+
+
+def _unit(unit_text):
+    return UNIT_TRIE.find(unit_text)
+
+
+def _per(line):
+    """What the dose is per, from anywhere in the line"""
+    for pattern, per in PER_PATTERNS:
+        if pattern.search(line):
+            return per
+    return DEFAULT_PER
+
+
+def parse_product_lines(product_col, index=PRODUCT_INDEX):
+    """[(name_marathi, name, dosage, dosage_unit), ...]; dosage None when the line has none"""
+    if not isinstance(product_col, str):
+        return []
+    product_col = product_col.strip()
+    if not product_col:
+        return []
+
+    per = _per(product_col)
+    results = []
+    for part in (p.strip() for p in product_col.split('+')):
+        if not part or INSTRUCTION_RE.search(part):
+            continue
+
+        match = DOSE_RE.search(part.translate(DEVANAGARI_DIGITS))
+        if match:
+            # Digit translation is 1:1, so slice the name from the original spelling
+            names = BRAND_PREFIX_RE.sub('', part[:match.end(1)].strip())
+            dosage, dosage_unit = match.group(2), f"{_unit(match.group(3))}/{per}"
+        else:
+            names = BRAND_PREFIX_RE.sub('', part)
+            dosage = dosage_unit = None
+
+        # "A/B - 2 ml": either product
+        for name_marathi in (n.strip() for n in names.split('/')):
+            if dosage is None and len(name_marathi) <= 2:
+                continue  # junk
+            if name_marathi:
+                results.append((name_marathi, translate_product(name_marathi, index), dosage, dosage_unit))
+    return results
@@ -0,0 +1,180 @@
+"""
+In-memory product search over calender_product.
+
+Every product is indexed under its English name, its Marathi name and the
+PRODUCT_TRANS spellings that translate to it, all folded with
+product_parser.canonical_key() (so "eclon max", "Eclon Max" and "ईक्लोन
+मॅक्स" compare equal to their stored forms). Two structures answer queries:
+
+  - a character trie whose nodes keep their best few product ids, so prefix
+    autocomplete is one walk down the query's characters,
+  - a character-trigram inverted index for typo-tolerant matches
+    ("इक्लोन मॅक्स", "eclonmaks"), scored by Dice similarity.
+
+The index is rebuilt per worker when the calender_product version
+(reply.catalog_versions) moves; the full catalogue answers in well under a
+millisecond.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from . import catalog_versions
+from .models import Product
+from .product_parser import PRODUCT_TRANS, canonical_key
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_SEARCH_REFRESH_SECONDS = getattr(settings, 'PRODUCT_SEARCH_REFRESH_SECONDS', 600)
+VERSION_CHECK_SECONDS = 5
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# Dice similarity a fuzzy match needs (share of trigrams in common)
+MIN_SIMILARITY = 0.4
+
+MATCH_PREFIX = 'prefix'
+MATCH_FUZZY = 'fuzzy'
+
+
+def trigrams(key):
+    """Character trigrams of a folded key, padded so short keys still have some"""
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrieNode:
+    __slots__ = ('children', 'ids')
+
+    def __init__(self):
+        self.children = {}
+        self.ids = []  # best product ids under this prefix, best first
+
+
+class ProductSearchIndex:
+    def __init__(self, products=(), aliases=None, version=None, max_per_node=MAX_LIMIT):
+        """
+        products: (id, name, name_marathi, product_type) rows
+        aliases: {spelling: English name} (PRODUCT_TRANS) resolved to products by name
+        """
+        self.products = {}
+        self.root = TrieNode()
+        self.keys = []          # term id -> folded key
+        self.term_products = []  # term id -> product id
+        self.grams = defaultdict(list)  # trigram -> [term id]
+        self.version = version
+        self.loaded_at = time.monotonic() if version is not None else 0.0
+
+        terms = {}  # folded key -> product id (first product wins)
+        by_name = {}
+        for product_id, name, name_marathi, product_type in products:
+            self.products[product_id] = {'id': product_id, 'name': name, 'name_marathi': name_marathi,
+                                         'product_type': product_type}
+            for spelling in (name, name_marathi):
+                key = canonical_key(spelling)
+                if key:
+                    terms.setdefault(key, product_id)
+                    by_name.setdefault(key, product_id)
+        for spelling, name in (aliases or {}).items():
+            product_id = by_name.get(canonical_key(name))
+            key = canonical_key(spelling)
+            if product_id and key:
+                terms.setdefault(key, product_id)
+
+        # Shorter names rank first under a prefix ("Imida" before "Imidacloprid 70")
+        rank = {product_id: (len(p['name']), p['name'], product_id) for product_id, p in self.products.items()}
+        for key, product_id in sorted(terms.items(), key=lambda item: rank[item[1]]):
+            term_id = len(self.keys)
+            self.keys.append(key)
+            self.term_products.append(product_id)
+            for gram in trigrams(key):
+                self.grams[gram].append(term_id)
+            node = self.root
+            for char in key:
+                node = node.children.setdefault(char, TrieNode())
+                if product_id not in node.ids and len(node.ids) < max_per_node:
+                    node.ids.append(product_id)
+
+    def __len__(self):
+        return len(self.products)
+
+    def prefix(self, query, limit=DEFAULT_LIMIT):
+        """Product ids whose names start with the query, best first"""
+        key = canonical_key(query)
+        if not key:
+            return []
+        node = self.root
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return node.ids[:limit]
+
+    def fuzzy(self, query, limit=DEFAULT_LIMIT, min_similarity=MIN_SIMILARITY):
+        """[(product id, similarity), ...] by trigram overlap, best first"""
+        key = canonical_key(query)
+        if not key:
+            return []
+        query_grams = trigrams(key)
+        shared = defaultdict(int)
+        for gram in query_grams:
+            for term_id in self.grams.get(gram, ()):
+                shared[term_id] += 1
+
+        best = {}
+        for term_id, count in shared.items():
+            score = 2 * count / (len(query_grams) + len(self.keys[term_id]) + 1)
+            product_id = self.term_products[term_id]
+            if score >= min_similarity and score > best.get(product_id, 0):
+                best[product_id] = score
+        return sorted(best.items(), key=lambda item: -item[1])[:limit]
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """[(product dict, match type, score), ...]: prefix matches, then fuzzy ones"""
+        results = [(product_id, MATCH_PREFIX, 1.0) for product_id in self.prefix(query, limit)]
+        if len(results) < limit:
+            seen = {product_id for product_id, _, _ in results}
+            results.extend(
+                (product_id, MATCH_FUZZY, round(score, 3))
+                for product_id, score in self.fuzzy(query, limit)
+                if product_id not in seen
+            )
+        return [(self.products[product_id], match, score) for product_id, match, score in results[:limit]]
+
+
+def load_index(version=None):
+    rows = Product.objects.values_list('id', 'name', 'name_marathi', 'product_type')
+    return ProductSearchIndex(rows, PRODUCT_TRANS, version)
+
+
+_index = ProductSearchIndex()
+_index_lock = threading.Lock()
+_checked_at = 0.0
+
+
+def get_index():
+    """The worker's index, reloaded when calender_product's version moves"""
+    global _index, _checked_at
+    now = time.monotonic()
+    if _index.loaded_at and now - _checked_at < VERSION_CHECK_SECONDS:
+        return _index
+    with _index_lock:
+        if _index.loaded_at and now - _checked_at < VERSION_CHECK_SECONDS:
+            return _index
+        table = Product._meta.db_table
+        version = catalog_versions.versions([table])[table]
+        stale = now - _index.loaded_at >= PRODUCT_SEARCH_REFRESH_SECONDS
+        if not _index.loaded_at or version != _index.version or stale:
+            try:
+                _index = load_index(version)
+                logger.info(f"🔎 Product search index loaded: {len(_index)} products, {len(_index.keys)} names")
+            except Exception as e:
+                logger.error(f"❌ Could not load product search index: {e}")
+        _checked_at = now
+    return _index
+
+
+def search(query, limit=DEFAULT_LIMIT):
+    return get_index().search(query, limit)
@@ -0,0 +1,286 @@
+"""
+Cluster-wide Gemini limiter.
+
+All workers share, in Redis:
+  - an RPM and a TPM token bucket (refilled continuously)
+  - a concurrency semaphore (leases that expire if a worker dies)
+  - a priority queue of waiting requests (live chat > summaries)
+
+A request takes a slot only when it is at the head of the queue AND the
+semaphore and both buckets allow it; all of that is checked and taken in one
+Lua script, so workers never race each other. Waiters poll until their
+deadline; a Gemini 429 puts everyone on a short cooldown and the request
+queues again (without Redis the cooldown only pauses this process). Only a missed deadline raises QuotaDeadlineExceeded. If Redis
+stops answering, calls go through unlimited and the limiter re-probes it
+after REDIS_RETRY_SECONDS instead of failing every request.
+"""
+import logging
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import telemetry
+from .deadline import DeadlineExceeded
+
+try:
+    from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+    REDIS_ERRORS = (RedisConnectionError, RedisTimeoutError)
+except ImportError:
+    REDIS_ERRORS = ()
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_LIVE = 0
+PRIORITY_SUMMARY = 1
+
+PATH_PRIORITIES = {
+    telemetry.PATH_SUMMARY: PRIORITY_SUMMARY,
+}
+
+GEMINI_RPM = getattr(settings, 'GEMINI_RPM', 60)
+GEMINI_TPM = getattr(settings, 'GEMINI_TPM', 1_000_000)
+GEMINI_MAX_CONCURRENCY = getattr(settings, 'GEMINI_MAX_CONCURRENCY', 4)
+GEMINI_QUEUE_DEADLINE_SECONDS = getattr(settings, 'GEMINI_QUEUE_DEADLINE_SECONDS', 20)
+
+LEASE_SECONDS = 60          # a crashed worker's slot frees itself after this
+HEARTBEAT_SECONDS = 5       # waiters that stop polling drop out of the queue
+RATE_LIMIT_COOLDOWN_SECONDS = 5
+EXPECTED_OUTPUT_TOKENS = 300
+POLL_MIN_SECONDS = 0.05
+POLL_MAX_SECONDS = 0.5
+REDIS_RETRY_SECONDS = 30    # how long to run unlimited after Redis went away
+
+
+class QuotaDeadlineExceeded(DeadlineExceeded):
+    """No Gemini slot became available before the request's deadline"""
+
+
+# KEYS: queue, heartbeats, leases, rpm bucket, tpm bucket, cooldown
+# ARGV: ticket, rpm, tpm, cost, max concurrency, lease seconds, heartbeat seconds
+ACQUIRE_SCRIPT = """
+local queue, hb, leases, rpm_key, tpm_key, cooldown = KEYS[1], KEYS[2], KEYS[3], KEYS[4], KEYS[5], KEYS[6]
+local ticket = ARGV[1]
+local rpm, tpm, cost = tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local max_conc, lease_ttl, hb_ttl = tonumber(ARGV[5]), tonumber(ARGV[6]), tonumber(ARGV[7])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+redis.call('ZADD', hb, now + hb_ttl, ticket)
+local dead = redis.call('ZRANGEBYSCORE', hb, '-inf', now)
+for _, member in ipairs(dead) do
+  redis.call('ZREM', queue, member)
+  redis.call('ZREM', hb, member)
+end
+redis.call('ZREMRANGEBYSCORE', leases, '-inf', now)
+
+if redis.call('ZRANGE', queue, 0, 0)[1] ~= ticket then return 'queued' end
+if redis.call('EXISTS', cooldown) == 1 then return 'cooldown' end
+if redis.call('ZCARD', leases) >= max_conc then return 'concurrency' end
+
+local function level(key, capacity)
+  local b = redis.call('HMGET', key, 'tokens', 'ts')
+  local tokens = tonumber(b[1]) or capacity
+  local ts = tonumber(b[2]) or now
+  return math.min(capacity, tokens + (now - ts) * capacity / 60)
+end
+local rpm_tokens = level(rpm_key, rpm)
+local tpm_tokens = level(tpm_key, tpm)
+if rpm_tokens < 1 then return 'rpm' end
+if tpm_tokens < math.min(cost, tpm) then return 'tpm' end
+
+redis.call('HSET', rpm_key, 'tokens', tostring(rpm_tokens - 1), 'ts', tostring(now))
+redis.call('HSET', tpm_key, 'tokens', tostring(tpm_tokens - cost), 'ts', tostring(now))
+redis.call('EXPIRE', rpm_key, 120)
+redis.call('EXPIRE', tpm_key, 120)
+redis.call('ZADD', leases, now + lease_ttl, ticket)
+redis.call('ZREM', queue, ticket)
+redis.call('ZREM', hb, ticket)
+return 'ok'
+"""
+
+
+def priority_for(path):
+    return PATH_PRIORITIES.get(path, PRIORITY_LIVE)
+
+
+def estimate_tokens(text, expected_output=EXPECTED_OUTPUT_TOKENS):
+    """Rough pre-call estimate: the prompt plus the expected answer"""
+    return telemetry.estimate_tokens(text) + expected_output
+
+
+def is_rate_limit_error(error):
+    text = str(error)
+    return '429' in text or 'quota' in text.lower() or type(error).__name__ == 'ResourceExhausted'
+
+
+class Lease:
+    """A held slot; set used_tokens so the TPM bucket is corrected afterwards"""
+
+    def __init__(self, ticket, estimated_tokens, waited):
+        self.ticket = ticket
+        self.estimated_tokens = estimated_tokens
+        self.used_tokens = None
+        self.waited = waited
+
+
+class GeminiLimiter:
+    def __init__(self, rpm=GEMINI_RPM, tpm=GEMINI_TPM, max_concurrency=GEMINI_MAX_CONCURRENCY,
+                 deadline_seconds=GEMINI_QUEUE_DEADLINE_SECONDS):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.deadline_seconds = deadline_seconds
+        self.keys = [cache.make_key(f'gemini:{name}') for name in
+                     ('queue', 'heartbeats', 'leases', 'rpm', 'tpm', 'cooldown')]
+        self._client = None
+        self._script = None
+        self._lock = threading.Lock()
+        self._unavailable = False
+        self._down_until = 0
+        self._cooldown_until = 0
+
+    def _redis(self):
+        """Shared Redis client, or None (limiter disabled) without django-redis or while Redis is down"""
+        if time.monotonic() < self._down_until:
+            return None
+        if self._client is None and not self._unavailable:
+            with self._lock:
+                if self._client is None and not self._unavailable:
+                    try:
+                        from django_redis import get_redis_connection
+                        self._client = get_redis_connection('default')
+                        self._script = self._client.register_script(ACQUIRE_SCRIPT)
+                    except Exception as e:
+                        self._unavailable = True
+                        logger.warning(f"⚠️ Gemini limiter disabled, no Redis: {e}")
+        return self._client
+
+    def _mark_down(self, error):
+        """Run unlimited for a while rather than hitting a dead Redis on every call"""
+        self._down_until = time.monotonic() + REDIS_RETRY_SECONDS
+        logger.warning(f"⚠️ Gemini limiter bypassed for {REDIS_RETRY_SECONDS}s, Redis unreachable: {error}")
+
+    def _forget(self, client, ticket):
+        try:
+            client.zrem(self.keys[0], ticket)
+            client.zrem(self.keys[1], ticket)
+        except REDIS_ERRORS as e:
+            self._mark_down(e)
+
+    def _acquire(self, client, ticket, priority, estimated_tokens, deadline, started):
+        """Poll until ticket holds a slot; False if Redis went away meanwhile"""
+        delay = POLL_MIN_SECONDS
+        try:
+            # Lower score = served first: priority, then arrival time
+            client.zadd(self.keys[0], {ticket: priority * 1e13 + time.time() * 1000})
+            while True:
+                status = self._script(keys=self.keys, args=[
+                    ticket, self.rpm, self.tpm, estimated_tokens,
+                    self.max_concurrency, LEASE_SECONDS, HEARTBEAT_SECONDS,
+                ])
+                if status in (b'ok', 'ok'):
+                    return True
+                if time.monotonic() + delay > deadline:
+                    raise QuotaDeadlineExceeded(
+                        f"No Gemini slot within {deadline - started:.1f}s (last: {status!r})"
+                    )
+                time.sleep(delay)
+                delay = min(delay * 2, POLL_MAX_SECONDS)
+        except REDIS_ERRORS as e:
+            self._mark_down(e)
+            self._forget(client, ticket)
+            return False
+        except BaseException:
+            self._forget(client, ticket)
+            raise
+
+    @contextmanager
+    def slot(self, priority=PRIORITY_LIVE, estimated_tokens=EXPECTED_OUTPUT_TOKENS, deadline=None):
+        """Wait (in priority order) for a slot; raises QuotaDeadlineExceeded"""
+        started = time.monotonic()
+        deadline = deadline or started + self.deadline_seconds
+        client = self._redis()
+        if client is None:
+            yield Lease(None, estimated_tokens, self._local_cooldown(deadline, started))
+            return
+
+        ticket = uuid.uuid4().hex
+        if not self._acquire(client, ticket, priority, estimated_tokens, deadline, started):
+            self._local_cooldown(deadline, started)
+            yield Lease(None, estimated_tokens, time.monotonic() - started)
+            return
+
+        lease = Lease(ticket, estimated_tokens, time.monotonic() - started)
+        if lease.waited > 1:
+            logger.info(f"⏳ Waited {lease.waited:.1f}s for a Gemini slot (priority {priority})")
+        try:
+            yield lease
+        finally:
+            _, _, leases, _, tpm_key, _ = self.keys
+            try:
+                pipe = client.pipeline()
+                pipe.zrem(leases, ticket)
+                if lease.used_tokens:
+                    # Give back (or charge) the difference to the estimate
+                    pipe.hincrbyfloat(tpm_key, 'tokens', estimated_tokens - lease.used_tokens)
+                pipe.execute()
+            except REDIS_ERRORS as e:
+                # The lease expires on its own after LEASE_SECONDS
+                self._mark_down(e)
+
+    def _local_cooldown(self, deadline, started):
+        """Without Redis, wait out this process's 429 cooldown; returns the seconds waited"""
+        pause = self._cooldown_until - time.monotonic()
+        if pause <= 0:
+            return 0
+        # Jitter, so the waiting threads don't all retry at the same instant
+        pause += random.uniform(0, POLL_MAX_SECONDS)
+        if time.monotonic() + pause > deadline:
+            raise QuotaDeadlineExceeded(f"Gemini cooling down past the deadline ({deadline - started:.1f}s)")
+        time.sleep(pause)
+        return pause
+
+    def cooldown(self, seconds=RATE_LIMIT_COOLDOWN_SECONDS):
+        """Pause all workers after Gemini said 429 (only this process without Redis)"""
+        self._cooldown_until = time.monotonic() + seconds
+        client = self._redis()
+        if client is not None:
+            try:
+                client.set(self.keys[5], 1, px=int(seconds * 1000))
+            except REDIS_ERRORS as e:
+                self._mark_down(e)
+
+    def run(self, func, priority=PRIORITY_LIVE, estimated_tokens=EXPECTED_OUTPUT_TOKENS, timeout=None,
+            retry_rate_limited=True, prompt=None):
+        """
+        func() inside a slot, re-queued after a 429 until the deadline
+        (unless retry_rate_limited=False: then the 429 is raised so the
+        caller can fail over to another model). prompt is what the TPM
+        bucket is charged for when the result has no usage_metadata.
+        Returns (result, seconds spent waiting for slots).
+        """
+        deadline = time.monotonic() + (timeout or self.deadline_seconds)
+        waited = 0
+        while True:
+            with self.slot(priority, estimated_tokens, deadline) as lease:
+                waited += lease.waited
+                try:
+                    result = func()
+                except Exception as e:
+                    if not is_rate_limit_error(e) or not retry_rate_limited:
+                        raise
+                    self.cooldown()
+                    logger.warning(f"🚦 Gemini 429, cooling down and re-queuing: {e}")
+                    if time.monotonic() >= deadline:
+                        raise QuotaDeadlineExceeded(f"Gemini rate limited until deadline: {e}") from e
+                    continue
+                lease.used_tokens = sum(telemetry.extract_usage(result, prompt))
+                return result, waited
+
+
+limiter = GeminiLimiter()
@@ -0,0 +1,214 @@
+"""
+Daily spray reminders from the crop calendar.
+
+Each FarmerCropProfile holds a variety and a pruning date. Once a day
+(manage.py send_reminders) all enabled profiles are loaded into arrays, their
+days-since-pruning computed in one numpy pass, and joined against each
+variety's sorted range start days (crop_calendar.VarietySchedule.starts)
+with np.searchsorted: a profile is due for the ranges starting after the day
+it was last reminded (at most MAX_CATCHUP_DAYS back) and up to today. Only
+due profiles are handled one by one.
+
+Reminders are WhatsApp templates (the farmer may not have written in the
+last 24h), sent through a RateLimitedSender so a large batch stays under the
+Cloud API throughput limit.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from . import crop_calendar
+from .models import Conversation, CropVariety, FarmerCropProfile, WhatsAppUser
+from .service import WhatsAppService
+
+logger = logging.getLogger(__name__)
+
+REMINDER_TEMPLATE = getattr(settings, 'REMINDER_TEMPLATE', 'spray_reminder')
+REMINDER_SENDS_PER_SECOND = getattr(settings, 'REMINDER_SENDS_PER_SECOND', 20)
+REMINDER_SEND_WORKERS = 4
+# A missed run (or failed send) is caught up for at most this many days
+MAX_CATCHUP_DAYS = 3
+# WhatsApp rejects longer template parameters
+MAX_PARAM_CHARS = 1000
+UPDATE_BATCH_SIZE = 1000
+PROFILE_COLUMNS = ['id', 'whatsapp_user_id', 'crop_variety_id', 'pruning_date', 'last_reminded_on', 'language']
+
+
+class Reminder:
+    __slots__ = ('profile_id', 'user_id', 'variety_id', 'language', 'day', 'entries')
+
+    def __init__(self, profile_id, user_id, variety_id, language, day, entries):
+        self.profile_id = profile_id
+        self.user_id = user_id
+        self.variety_id = variety_id
+        self.language = language
+        self.day = day
+        self.entries = entries
+
+
+def load_profiles():
+    """Enabled profiles of unblocked users as a DataFrame (one query)"""
+    # reply.escalation only clears an expired block on the user's next
+    # message, so a block whose time is up counts as lifted here
+    unblocked = Q(whatsapp_user__is_blocked=False) | Q(whatsapp_user__blocked_until__lte=timezone.now())
+    rows = (
+        FarmerCropProfile.objects.filter(unblocked, reminders_enabled=True)
+        .values_list(*PROFILE_COLUMNS)
+    )
+    return pd.DataFrame.from_records(rows.iterator(chunk_size=5000), columns=PROFILE_COLUMNS)
+
+
+def _epoch_days(column):
+    """Dates -> days since 1970 (NaT -> NaN)"""
+    days = pd.to_datetime(column).to_numpy(dtype='datetime64[D]')
+    return np.where(np.isnat(days), np.nan, days.astype('int64'))
+
+
+def due_reminders(profiles, index, today):
+    """[Reminder, ...] for the ranges starting today (or missed since the last reminder)"""
+    if profiles.empty:
+        return []
+    today_days = np.datetime64(today, 'D').astype('int64')
+    day = today_days - _epoch_days(profiles['pruning_date']).astype('int64')
+    # Window of start days to remind about: (previous day, today]; never
+    # reminded -> today only, already reminded today -> empty
+    gap = np.nan_to_num(today_days - _epoch_days(profiles['last_reminded_on']), nan=1)
+    previous = day - np.clip(gap, 0, MAX_CATCHUP_DAYS).astype('int64')
+
+    ids = profiles['id'].to_numpy()
+    user_ids = profiles['whatsapp_user_id'].to_numpy()
+    languages = profiles['language'].to_numpy()
+    reminders = []
+    for variety_id, positions in profiles.groupby('crop_variety_id').indices.items():
+        schedule = index.schedules.get(variety_id)
+        if not schedule:
+            continue
+        starts = np.asarray(schedule.starts)
+        first = np.searchsorted(starts, previous[positions], side='right')
+        last = np.searchsorted(starts, day[positions], side='right')
+        for i in np.nonzero(last > first)[0]:
+            entries = [e for e in schedule.entries[first[i]:last[i]] if e.is_useful()]
+            if not entries:
+                continue
+            position = positions[i]
+            reminders.append(Reminder(int(ids[position]), int(user_ids[position]), variety_id,
+                                      languages[position], int(day[position]), entries))
+    return reminders
+
+
+def template_components(reminder, variety):
+    """Body parameters: variety, day after pruning, today's work (one line)"""
+    name = variety.name if reminder.language == 'en' or not variety.name_marathi else variety.name_marathi
+    work = ' | '.join(crop_calendar.entry_summary(entry, reminder.language) for entry in reminder.entries)
+    return [{
+        'type': 'body',
+        'parameters': [
+            {'type': 'text', 'text': name},
+            {'type': 'text', 'text': str(reminder.day)},
+            {'type': 'text', 'text': ' '.join(work.split())[:MAX_PARAM_CHARS]},
+        ],
+    }]
+
+
+class RateLimitedSender:
+    """
+    Runs send(*args) on a few worker threads, started no faster than rate per
+    second overall (each call reserves the next free slot).
+    """
+
+    def __init__(self, send, rate=REMINDER_SENDS_PER_SECOND, workers=REMINDER_SEND_WORKERS):
+        self.send = send
+        self.interval = 1.0 / rate
+        self.sent = []
+        self.failed = 0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reminder-send')
+
+    def _wait_turn(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _run(self, key, args):
+        self._wait_turn()
+        try:
+            ok = self.send(*args)
+        except Exception as e:
+            logger.error(f"❌ Reminder send failed: {e}")
+            ok = False
+        finally:
+            close_old_connections()
+        with self._lock:
+            if ok:
+                self.sent.append(key)
+            else:
+                self.failed += 1
+
+    def submit(self, key, *args):
+        self._pool.submit(self._run, key, args)
+
+    def close(self):
+        """Wait for every queued send; returns (sent keys, failed count)"""
+        self._pool.shutdown(wait=True)
+        return self.sent, self.failed
+
+
+def send_reminders(today, dry_run=False, limit=None, sender_factory=RateLimitedSender):
+    """Compute and send today's reminders; returns a stats dict"""
+    stats = {}
+    started = time.perf_counter()
+    profiles = load_profiles()
+    stats['profiles'] = len(profiles)
+    stats['load_seconds'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index = crop_calendar.get_index()
+    reminders = due_reminders(profiles, index, today)[:limit]
+    stats['due'] = len(reminders)
+    stats['compute_seconds'] = time.perf_counter() - started
+    logger.info(f"⏰ {len(reminders)} reminder(s) due of {len(profiles)} profiles "
+                f"({stats['compute_seconds'] * 1000:.0f}ms)")
+    if dry_run or not reminders:
+        stats['reminders'] = reminders
+        return stats
+
+    # A few queries for the whole batch: recipients, their conversations, variety names
+    users = WhatsAppUser.objects.in_bulk({r.user_id for r in reminders})
+    varieties = CropVariety.objects.in_bulk({r.variety_id for r in reminders})
+    conversations = {c.whatsapp_user_id: c for c in Conversation.objects.filter(whatsapp_user_id__in=users)}
+    missing = [Conversation(whatsapp_user_id=user_id) for user_id in users if user_id not in conversations]
+    for conversation in Conversation.objects.bulk_create(missing):
+        conversations[conversation.whatsapp_user_id] = conversation
+
+    service = WhatsAppService()
+
+    def send(reminder):
+        message = service.send_template_message(
+            users[reminder.user_id].phone_number, REMINDER_TEMPLATE, reminder.language,
+            template_components(reminder, varieties[reminder.variety_id]), conversations[reminder.user_id],
+        )
+        return message is not None
+
+    started = time.perf_counter()
+    sender = sender_factory(send)
+    for reminder in reminders:
+        if reminder.user_id in users:
+            sender.submit(reminder.profile_id, reminder)
+    sent, failed = sender.close()
+    for i in range(0, len(sent), UPDATE_BATCH_SIZE):
+        FarmerCropProfile.objects.filter(id__in=sent[i:i + UPDATE_BATCH_SIZE]).update(last_reminded_on=today)
+    stats.update(sent=len(sent), failed=failed, send_seconds=time.perf_counter() - started)
+    logger.info(f"⏰ Reminders sent: {len(sent)}, failed: {failed}")
+    return stats
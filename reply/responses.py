@@ -0,0 +1,104 @@
+"""
+Canned replies for the messages that never need the LLM.
+
+Catalog: kind -> language -> variants. Variants rotate per user (Redis
+counter) so a farmer who says "hi" every morning doesn't get the exact same
+line, and {name} variants are only used when we actually know a name.
+"""
+import logging
+import re
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+GREETING = 'greeting'
+ACK = 'ack'
+FOLLOW_UP_LABOR = 'follow_up_labor'
+
+DEFAULT_LANGUAGE = 'en'
+ROTATION_TTL_SECONDS = 7 * 24 * 3600
+
+# Appended to any answer that names a spray / fertilizer product
+SPRAY_DISCLAIMER = "(कृपया फवारणी करण्यापूर्वी तुमच्या प्लॉटची परिस्थिती आणि हवामान तपासून घ्या.)"
+
+CATALOG = {
+    GREETING: {
+        'hi': [
+            "नमस्ते {name} जी! 🙏 बताइए, आपकी खेती में क्या मदद करें?",
+            "नमस्ते! 🌾 मजूर चाहिए या फसल की सलाह? बताइए।",
+            "राम राम {name} जी 🙏 आज खेत के लिए क्या चाहिए?",
+            "नमस्ते! 🙏 मैं मजूर बुकिंग और फसल सलाह में मदद करता हूँ, बताइए।",
+        ],
+        'mr': [
+            "नमस्कार {name}! 🙏 तुमच्या शेतीसाठी काय मदत करू?",
+            "नमस्कार! 🌾 मजूर हवेत की पिकाबद्दल सल्ला? सांगा.",
+            "राम राम {name} 🙏 आज शेतासाठी काय हवं आहे?",
+            "नमस्कार! 🙏 मजूर बुकिंग आणि पीक सल्ल्यासाठी मी आहे, सांगा.",
+        ],
+        'en': [
+            "Hello {name}! 🙏 How can I help with your farm today?",
+            "Hi! 🌾 Need workers or crop advice? Just tell me.",
+            "Namaste {name} 🙏 What does your farm need today?",
+            "Hello! 🙏 I can help with labor booking and crop advice.",
+        ],
+    },
+    ACK: {
+        'hi': ["स्वागत है! 🙏", "ठीक है! 👍", "बिल्कुल ✅"],
+        'mr': ["स्वागत आहे! 🙏", "ठीक आहे! 👍", "नक्की ✅"],
+        'en': ["Welcome! 🙏", "Sure! 👍", "Great! ✅"],
+    },
+    FOLLOW_UP_LABOR: {
+        'hi': [
+            "मैं आपके मजूर की request पर काम कर रहा हूँ। जल्द ही update मिलेगा 👍",
+            "{name} जी, आपकी मजूर request पर काम चल रहा है, जल्द बताता हूँ 👍",
+        ],
+        'mr': [
+            "मी तुमच्या मजूर request वर काम करत आहे। लवकरच update मिळेल 👍",
+            "{name}, तुमच्या मजूर request वर काम सुरू आहे, लवकरच कळवतो 👍",
+        ],
+        'en': [
+            "I'm working on your labor request. Will update soon 👍",
+            "{name}, your labor request is in progress - I'll update you soon 👍",
+        ],
+    },
+}
+
+# Profile names default to the phone number when WhatsApp sends none
+_NOT_A_NAME_RE = re.compile(r'^[\d\s+()-]*$')
+
+
+def _usable_name(name):
+    name = (name or '').strip()
+    if not name or _NOT_A_NAME_RE.match(name):
+        return None
+    return name.split()[0][:30]
+
+
+def _next_index(kind, user_id, count):
+    """Rotating index per (kind, user); process-agnostic via Redis"""
+    if user_id is None:
+        return 0
+    key = f'reply_rotation:{kind}:{user_id}'
+    try:
+        if cache.add(key, 0, timeout=ROTATION_TTL_SECONDS):
+            value = 0
+        else:
+            value = cache.incr(key)
+    except Exception as e:
+        logger.warning(f"⚠️ Reply rotation unavailable: {e}")
+        value = 0
+    return value % count
+
+
+def canned_reply(kind, language, name=None, user_id=None):
+    """Pick the next catalog variant for this user, filling in their name"""
+    by_language = CATALOG[kind]
+    variants = by_language.get(language) or by_language[DEFAULT_LANGUAGE]
+
+    first_name = _usable_name(name)
+    if not first_name:
+        variants = [v for v in variants if '{name}' not in v] or variants
+
+    reply = variants[_next_index(kind, user_id, len(variants))]
+    return reply.format(name=first_name or '')
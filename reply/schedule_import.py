@@ -0,0 +1,238 @@
+"""
+Bulk import of crop schedules into the calender_* tables.
+
+Shared engine for the ban.py-style populators: a parser turns a sheet into
+entries, this module writes them. Existing activities and products are
+prefetched into dicts, new rows go in with bulk_create, and the whole import
+is one transaction.
+
+Products are matched on product_parser.canonical_key(), so a spelling
+variant of an existing product ("रॅली गोल्ड" for "रॅलीगोल्ड") reuses its row
+instead of creating a duplicate.
+
+Re-importing is idempotent: day ranges are matched on (start day, end day,
+activity, info) and only the ones whose products / Marathi text changed are
+rewritten; ranges no longer in the sheet are deleted. dry_run=True returns
+the same diff without writing anything.
+
+Entry format (what ban.py's parse_* functions build):
+    {'activity_mar': 'फवारणी', 'activity_eng': 'Foliar Spray',
+     'start_day': 25, 'end_day': 30, 'purpose': 'English info',
+     'purpose_marathi': 'optional Marathi info',
+     'products': [(name_marathi, name, dosage, dosage_unit), ...]}
+"""
+import logging
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from . import catalog_versions, crop_calendar, product_documents
+from .models import Activity, Crop, CropVariety, DayRange, DayRangeProduct, Product
+from .product_parser import canonical_key
+from .text_utils import DEVANAGARI_DIGITS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRODUCT_TYPE = 'Agricultural Input'
+DOSAGE_UNIT_MAX_LENGTH = DayRangeProduct._meta.get_field('dosage_unit').max_length
+
+
+class ImportResult:
+    def __init__(self, dry_run):
+        self.dry_run = dry_run
+        self.activities_created = 0
+        self.products_created = 0
+        self.created = 0
+        self.updated = 0
+        self.deleted = 0
+        self.unchanged = 0
+        self.skipped_products = 0
+        self.diff = []  # "+ ...", "~ ...", "- ..." lines
+
+    @property
+    def changed(self):
+        return bool(self.activities_created or self.products_created or self.created or self.updated or self.deleted)
+
+    def __repr__(self):
+        return (f"<ImportResult +{self.created} ~{self.updated} -{self.deleted} ={self.unchanged} "
+                f"activities+{self.activities_created} products+{self.products_created}>")
+
+
+def parse_dosage(value):
+    """'०.५' / '2.5' / 3 -> Decimal, or None if it isn't a number"""
+    if value is None:
+        return None
+    try:
+        return Decimal(str(value).translate(DEVANAGARI_DIGITS).strip())
+    except InvalidOperation:
+        return None
+
+
+def _clean_entries(entries, result):
+    """Entries with usable product lines only, in the shape the diff works on"""
+    cleaned = []
+    for entry in entries:
+        products = []
+        for name_marathi, name, dosage, dosage_unit in entry['products']:
+            dosage = parse_dosage(dosage)
+            if dosage is None or not dosage_unit or len(dosage_unit) > DOSAGE_UNIT_MAX_LENGTH:
+                result.skipped_products += 1
+                continue
+            products.append((name, name_marathi, dosage, dosage_unit))
+        cleaned.append({
+            'activity': entry['activity_eng'],
+            'activity_marathi': entry.get('activity_mar') or entry['activity_eng'],
+            'start_day': int(entry['start_day']),
+            'end_day': int(entry['end_day']),
+            'info': (entry.get('purpose') or '').strip(),
+            'info_marathi': (entry.get('purpose_marathi') or entry.get('purpose') or '').strip(),
+            'products': products,
+        })
+    return cleaned
+
+
+def _resolve_products(entries, products):
+    """
+    Rename entry products to the existing product with the same canonical key
+    (English or Marathi spelling); unknown variants collapse onto the first
+    spelling seen in this import.
+    """
+    by_key = {}
+    for product in products.values():
+        by_key.setdefault(canonical_key(product.name), product.name)
+        by_key.setdefault(canonical_key(product.name_marathi), product.name)
+    by_key.pop('', None)
+    for entry in entries:
+        resolved = []
+        for name, name_marathi, dosage, dosage_unit in entry['products']:
+            name = by_key.get(canonical_key(name)) or by_key.get(canonical_key(name_marathi)) or name
+            by_key.setdefault(canonical_key(name), name)
+            by_key.setdefault(canonical_key(name_marathi), name)
+            by_key.pop('', None)
+            resolved.append((name, name_marathi, dosage, dosage_unit))
+        entry['products'] = resolved
+
+
+def _range_key(start_day, end_day, activity, info):
+    return (start_day, end_day, activity, info)
+
+
+def _signature(info_marathi, products):
+    """What a re-import may change on a matched range"""
+    return (info_marathi or '', sorted((name, dosage, unit) for name, dosage, unit in products))
+
+
+def _label(key):
+    start_day, end_day, activity, _ = key
+    days = f"day {start_day}" if start_day == end_day else f"days {start_day}-{end_day}"
+    return f"{days} {activity}"
+
+
+def import_schedule(crop_name, variety_name, entries, crop_name_marathi='', variety_name_marathi='',
+                    product_type=DEFAULT_PRODUCT_TYPE, dry_run=False):
+    """Sync one variety's schedule to entries; returns an ImportResult"""
+    result = ImportResult(dry_run)
+    entries = _clean_entries(entries, result)
+
+    with transaction.atomic():
+        crop = Crop.objects.filter(name=crop_name).first()
+        variety = crop and CropVariety.objects.filter(crop=crop, name=variety_name).first()
+
+        # Prefetch everything the import refers to: 4 queries, whatever the size.
+        # The product catalogue is small; all of it is needed for variant matching
+        activity_names = {e['activity'] for e in entries}
+        activities = {a.name: a for a in Activity.objects.filter(name__in=activity_names)}
+        products = {p.name: p for p in Product.objects.only('id', 'name', 'name_marathi')}
+        _resolve_products(entries, products)
+        existing = defaultdict(list)
+        if variety:
+            day_ranges = (
+                DayRange.objects.filter(crop_variety=variety)
+                .select_related('activity')
+                .prefetch_related(Prefetch('products', queryset=DayRangeProduct.objects.select_related('product')))
+            )
+            for day_range in day_ranges:
+                key = _range_key(day_range.start_day, day_range.end_day, day_range.activity.name, day_range.info)
+                existing[key].append(day_range)
+
+        # Diff: match each entry to an existing range with the same key
+        to_create, to_update = [], []
+        for entry in entries:
+            key = _range_key(entry['start_day'], entry['end_day'], entry['activity'], entry['info'])
+            wanted = _signature(entry['info_marathi'], [(n, d, u) for n, _, d, u in entry['products']])
+            if existing.get(key):
+                day_range = existing[key].pop(0)
+                current = _signature(day_range.info_marathi,
+                                     [(p.product.name, p.dosage, p.dosage_unit) for p in day_range.products.all()])
+                if current == wanted:
+                    result.unchanged += 1
+                else:
+                    to_update.append((day_range, entry))
+                    result.diff.append(f"~ {_label(key)} ({len(wanted[1])} products, was {len(current[1])})")
+            else:
+                to_create.append(entry)
+                result.diff.append(f"+ {_label(key)} ({len(entry['products'])} products)")
+        to_delete = [day_range for ranges in existing.values() for day_range in ranges]
+        for day_range in to_delete:
+            result.diff.append(f"- {_label(_range_key(day_range.start_day, day_range.end_day, day_range.activity.name, day_range.info))}")
+
+        new_activities = {e['activity']: e['activity_marathi'] for e in entries if e['activity'] not in activities}
+        new_products = {}
+        for entry in entries:
+            for name, name_marathi, _, _ in entry['products']:
+                if name not in products:
+                    new_products.setdefault(name, name_marathi)
+        result.activities_created = len(new_activities)
+        result.products_created = len(new_products)
+        result.diff.extend(f"+ activity {name}" for name in new_activities)
+        result.diff.extend(f"+ product {name}" for name in new_products)
+        result.created, result.updated, result.deleted = len(to_create), len(to_update), len(to_delete)
+
+        if dry_run:
+            return result
+
+        if not crop:
+            crop = Crop.objects.create(name=crop_name, name_marathi=crop_name_marathi or crop_name)
+        if not variety:
+            variety = CropVariety.objects.create(crop=crop, name=variety_name,
+                                                 name_marathi=variety_name_marathi or variety_name)
+        for activity in Activity.objects.bulk_create(
+                [Activity(name=name, name_marathi=marathi) for name, marathi in new_activities.items()]):
+            activities[activity.name] = activity
+        for product in Product.objects.bulk_create(
+                [Product(name=name, name_marathi=marathi, product_type=product_type)
+                 for name, marathi in new_products.items()]):
+            products[product.name] = product
+
+        # Changed ranges keep their row; their product lines are replaced
+        now = timezone.now()
+        for day_range, entry in to_update:
+            day_range.info_marathi = entry['info_marathi']
+            day_range.updated_at = now
+        DayRange.objects.bulk_update([day_range for day_range, _ in to_update], ['info_marathi', 'updated_at'])
+        DayRangeProduct.objects.filter(day_range__in=[day_range for day_range, _ in to_update]).delete()
+        DayRange.objects.filter(id__in=[day_range.id for day_range in to_delete]).delete()
+
+        created = DayRange.objects.bulk_create([
+            DayRange(crop_variety=variety, activity=activities[e['activity']], start_day=e['start_day'],
+                     end_day=e['end_day'], info=e['info'], info_marathi=e['info_marathi'])
+            for e in to_create
+        ])
+        lines = [
+            DayRangeProduct(day_range=day_range, product=products[name], dosage=dosage, dosage_unit=unit)
+            for day_range, entry in list(zip(created, to_create)) + to_update
+            for name, _, dosage, unit in entry['products']
+        ]
+        DayRangeProduct.objects.bulk_create(lines, batch_size=500)
+
+        # bulk_create / bulk_update send no signals (the deletes above do)
+        transaction.on_commit(crop_calendar.invalidate)
+        product_documents.schedule_rebuild({line.product_id for line in lines})
+        if new_products:
+            transaction.on_commit(lambda: catalog_versions.bump(Product._meta.db_table))
+
+    logger.info(f"📥 Imported {variety_name}: {result!r}")
+    return result
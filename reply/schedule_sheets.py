@@ -0,0 +1,140 @@
+"""
+Vectorized parser for crop schedule workbooks (the ban.py sheets).
+
+The workbook is read once (every sheet in one read_excel call). Each sheet
+is then parsed column-wise instead of row by row:
+  - a row starts a new entry when its serial number (or, without a serial
+    column, its day cell) is filled; cumsum() over that mask gives every
+    continuation row its entry's group id,
+  - day ranges come from one Series.str.extract over the whole day column,
+  - product cells are stacked and grouped, then parsed per cell.
+
+Output is the entry format reply.schedule_import expects. Per-sheet parse
+times are kept so slow workbooks show up at import time.
+"""
+import logging
+import time
+
+import pandas as pd
+
+from .product_parser import parse_product_lines
+from .text_utils import DEVANAGARI_DIGITS
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY_TRANS = {
+    'बेसल डोस': 'Basal Dose',
+    'आळवणी': 'Drenching',
+    'आळवणी बुंदयापासून थोडे लांब टाकणे': 'Drenching Away from Base',
+    'फवारणी': 'Foliar Spray',
+    'पोंगा भरणी': 'Pseudostem Filling',
+    'खत देणे': 'Fertilizer Application',
+    'खत देणे आळवणी': 'Fertilizer Drenching',
+    'ड्रिप मधून': 'Through Drip',
+    'केळी फ्रूट केयर': 'Banana Fruit Care',
+    'केळी फ्रूट केयर फवारणी': 'Banana Fruit Care Spray',
+    'फवारणी जमिनीवर': 'Ground Spray',
+    'पोंगा सड नियंत्रण': 'Pseudostem Rot Control',
+    'CMV नियंत्रण': 'CMV Virus Control',
+    'थंडी काळजी': 'Winter Care',
+}
+
+# "25 ते 30 दिवस", "20 -25 दिवस", "15 दिवस" (after digit translation)
+DAY_RANGE_PATTERN = r'(?P<start>-?\d+)(?:\s*(?:ते|to|-|–)\s*(?P<end>\d+))?'
+
+
+class SheetLayout:
+    """Where things are on a sheet (0-based column positions)"""
+
+    def __init__(self, day_col, activity_col, product_cols, group_col=None, first_row=0):
+        self.day_col = day_col
+        self.activity_col = activity_col
+        self.product_cols = list(product_cols)
+        # Serial-number column that marks a new entry; None = the day column does
+        self.group_col = group_col
+        self.first_row = first_row
+
+
+# ban.xlsx 'Foliar Application': serial, activity, days, spray products, fertilizer products.
+# ban.py read it with header=0 and started at iloc[15]; with header=None that is row 16.
+FOLIAR_LAYOUT = SheetLayout(day_col=2, activity_col=1, product_cols=[3, 4], group_col=0, first_row=16)
+
+
+def _text(column):
+    """Cells as stripped strings with Devanagari digits converted; blanks -> NA"""
+    text = column.astype('string').str.strip().str.translate(DEVANAGARI_DIGITS)
+    return text.mask(text == '')
+
+
+def parse_sheet(df, layout):
+    """One sheet (header=None DataFrame) -> entries, in sheet order"""
+    df = df.iloc[layout.first_row:]
+    if df.empty:
+        return []
+
+    days = _text(df[layout.day_col])
+    if layout.group_col is not None:
+        starts = _text(df[layout.group_col]).str.fullmatch(r'\d+').fillna(False)
+    else:
+        starts = days.notna()
+    group = starts.astype(int).cumsum()
+    keep = group > 0  # rows above the first entry are headers / notes
+    if not keep.any():
+        return []
+
+    # One regex pass over the whole day column
+    firsts = pd.DataFrame({
+        'day': df[layout.day_col].astype('string').str.strip()[starts],
+        'activity': df[layout.activity_col].astype('string').str.strip()[starts],
+        'group': group[starts],
+    }).set_index('group')
+    bounds = days[starts].str.extract(DAY_RANGE_PATTERN)
+    bounds.index = firsts.index
+    bounds['end'] = bounds['end'].fillna(bounds['start'])
+
+    # Every product cell of every row, grouped by entry (row order kept)
+    cells = df.loc[keep, layout.product_cols].stack()
+    cells = cells[cells.astype('string').str.strip() != '']
+    cells_by_group = cells.groupby(group.loc[cells.index.get_level_values(0)].to_numpy()).agg(list)
+
+    entries = []
+    for group_id, row in firsts.join(bounds).iterrows():
+        if pd.isna(row['start']):
+            continue
+        products = []
+        for cell in cells_by_group.get(group_id, []):
+            products.extend(parse_product_lines(str(cell)))
+        if not products:
+            continue
+        activity = row['activity'] if pd.notna(row['activity']) else ''
+        if not activity:
+            logger.warning(f"⚠️ Skipping '{row['day'][:40]}': no activity")
+            continue
+        entries.append({
+            'activity_mar': activity,
+            'activity_eng': ACTIVITY_TRANS.get(activity, activity),
+            'start_day': int(row['start']),
+            'end_day': int(row['end']),
+            'purpose': row['day'],
+            'products': products,
+        })
+    return entries
+
+
+def parse_workbook(path, layouts):
+    """
+    layouts: {sheet name: SheetLayout}. Reads the workbook once.
+    Returns (entries, {sheet name: (entry count, seconds)}).
+    """
+    started = time.perf_counter()
+    sheets = pd.read_excel(path, sheet_name=list(layouts), header=None, dtype=object)
+    timings = {'<read>': (len(sheets), time.perf_counter() - started)}
+
+    entries = []
+    for name, layout in layouts.items():
+        started = time.perf_counter()
+        sheet_entries = parse_sheet(sheets[name], layout)
+        timings[name] = (len(sheet_entries), time.perf_counter() - started)
+        entries.extend(sheet_entries)
+        logger.info(f"📄 {name}: {len(sheet_entries)} entries in {timings[name][1] * 1000:.0f}ms")
+    return entries, timings
@@ -0,0 +1,27 @@
+from rest_framework import serializers
+
+from .models import Crop, CropVariety, Product
+
+
+class ProductSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'name_marathi', 'product_type', 'created_at', 'updated_at']
+
+
+class CropVarietySerializer(serializers.ModelSerializer):
+    # The crop is the parent being serialized; its name comes from the
+    # prefetched relation, not a query per variety
+    crop_name = serializers.CharField(source='crop.name', read_only=True)
+
+    class Meta:
+        model = CropVariety
+        fields = ['id', 'name', 'name_marathi', 'crop', 'crop_name', 'created_at', 'updated_at']
+
+
+class CropSerializer(serializers.ModelSerializer):
+    varieties = CropVarietySerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Crop
+        fields = ['id', 'name', 'name_marathi', 'varieties', 'created_at', 'updated_at']
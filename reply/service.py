@@ -4,8 +4,14 @@ from django.conf import settings
 from .models import Message
 import json
 import os
+
+from .deadline import MIN_SEND_SECONDS
 logger = logging.getLogger(__name__)
 
+# No Graph API call may hold a worker thread indefinitely
+REQUEST_TIMEOUT_SECONDS = getattr(settings, 'WHATSAPP_TIMEOUT_SECONDS', 10)
+UPLOAD_TIMEOUT_SECONDS = 60
+
 
 class WhatsAppService:
     def __init__(self):
@@ -18,8 +24,10 @@ class WhatsAppService:
             'Content-Type': 'application/json'
         }
 
-    def send_text_message(self, to_phone, message_text, conversation):
+    def send_text_message(self, to_phone, message_text, conversation, deadline=None):
         url = f"{self.base_url}/messages"
+        # Within the message's budget, but an answer always gets a fair chance to go out
+        timeout = deadline.timeout(cap=REQUEST_TIMEOUT_SECONDS, floor=MIN_SEND_SECONDS) if deadline else REQUEST_TIMEOUT_SECONDS
         
         payload = {
             "messaging_product": "whatsapp",
@@ -33,7 +41,7 @@ class WhatsAppService:
         }
         
         try:
-            response = requests.post(url, headers=self.headers, json=payload)
+            response = requests.post(url, headers=self.headers, json=payload, timeout=timeout)
             response.raise_for_status()
             result = response.json()
             
@@ -47,7 +55,7 @@ class WhatsAppService:
             )
             
             conversation.last_message_preview = message_text[:100]
-            conversation.save()
+            conversation.save(update_fields=['last_message_preview', 'updated_at'])
             
             logger.info(f"Text message sent to {to_phone}")
             return message
@@ -80,7 +88,7 @@ class WhatsAppService:
         }
         
         try:
-            response = requests.post(url, headers=self.headers, json=payload)
+            response = requests.post(url, headers=self.headers, json=payload, timeout=REQUEST_TIMEOUT_SECONDS)
             response.raise_for_status()
             result = response.json()
             
@@ -98,7 +106,7 @@ class WhatsAppService:
             if caption:
                 preview += f" {caption[:50]}"
             conversation.last_message_preview = preview
-            conversation.save()
+            conversation.save(update_fields=['last_message_preview', 'updated_at'])
             
             logger.info(f"{media_type} sent to {to_phone}")
             return message
@@ -139,7 +147,7 @@ class WhatsAppService:
             logger.info(f"Sending template: {template_name} to {to_phone}")
             logger.info(f"Payload: {json.dumps(payload, indent=2)}")
 
-            response = requests.post(url, headers=self.headers, json=payload)
+            response = requests.post(url, headers=self.headers, json=payload, timeout=REQUEST_TIMEOUT_SECONDS)
 
             logger.info(f"Response status: {response.status_code}")
             logger.info(f"Response body: {response.text}")
@@ -159,7 +167,7 @@ class WhatsAppService:
             )
 
             conversation.last_message_preview = f"[Template: {template_name}]"
-            conversation.save()
+            conversation.save(update_fields=['last_message_preview', 'updated_at'])
 
             logger.info(f"✅ Template sent successfully to {to_phone}")
             return message
@@ -217,7 +225,7 @@ class WhatsAppService:
                 
                 logger.info(f"Uploading media: {file_path}, type: {mime_type}")
                 
-                response = requests.post(url, headers=headers, files=files, data=data)
+                response = requests.post(url, headers=headers, files=files, data=data, timeout=UPLOAD_TIMEOUT_SECONDS)
                 
                 # Log the response for debugging
                 logger.info(f"Upload response status: {response.status_code}")
@@ -242,11 +250,11 @@ class WhatsAppService:
         url = f"https://graph.facebook.com/{self.api_version}/{media_id}"
         
         try:
-            response = requests.get(url, headers=self.headers)
+            response = requests.get(url, headers=self.headers, timeout=REQUEST_TIMEOUT_SECONDS)
             response.raise_for_status()
             media_url = response.json()['url']
             
-            media_response = requests.get(media_url, headers=self.headers)
+            media_response = requests.get(media_url, headers=self.headers, timeout=UPLOAD_TIMEOUT_SECONDS)
             media_response.raise_for_status()
             
             return media_response.content, media_response.headers.get('Content-Type')
@@ -264,7 +272,7 @@ class WhatsAppService:
         }
         
         try:
-            response = requests.post(url, headers=self.headers, json=payload)
+            response = requests.post(url, headers=self.headers, json=payload, timeout=REQUEST_TIMEOUT_SECONDS)
             response.raise_for_status()
             return True
         except Exception as e:
@@ -0,0 +1,98 @@
+"""
+Model signal handlers, connected in ReplyConfig.ready().
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from . import catalog_versions, crop_calendar, history_cache, identity, product_documents
+from .models import (
+    Activity, Conversation, Crop, CropVariety, DayRange, DayRangeProduct, Message, Product, WhatsAppUser,
+)
+
+
+def invalidate_crop_calendar(sender, **kwargs):
+    """A calendar row was written here -> every worker's interval index reloads"""
+    transaction.on_commit(crop_calendar.invalidate)
+
+
+for _model in (CropVariety, Activity, Product, DayRange, DayRangeProduct):
+    post_save.connect(invalidate_crop_calendar, sender=_model, dispatch_uid=f'crop_calendar_save_{_model.__name__}')
+    post_delete.connect(invalidate_crop_calendar, sender=_model, dispatch_uid=f'crop_calendar_delete_{_model.__name__}')
+
+
+def rebuild_product_document(sender, instance, **kwargs):
+    product_documents.schedule_rebuild([instance.pk])
+
+
+def rebuild_line_product_documents(sender, instance, **kwargs):
+    """A product line changed -> its product's document (and the old product's, if it moved)"""
+    product_documents.schedule_rebuild([instance.product_id, getattr(instance, '_previous_product_id', None)])
+
+
+def remember_line_product(sender, instance, **kwargs):
+    if instance.pk:
+        instance._previous_product_id = (
+            DayRangeProduct.objects.filter(pk=instance.pk).values_list('product_id', flat=True).first()
+        )
+
+
+def rebuild_day_range_product_documents(sender, instance, **kwargs):
+    """Day range text / days changed -> documents of the products it lists (deletes cascade to lines)"""
+    product_documents.schedule_rebuild(
+        DayRangeProduct.objects.filter(day_range_id=instance.pk).values_list('product_id', flat=True)
+    )
+
+
+def invalidate_product_documents(sender, **kwargs):
+    """Crop / variety / activity names appear in many documents -> drop them all"""
+    transaction.on_commit(product_documents.invalidate_all)
+
+
+post_save.connect(rebuild_product_document, sender=Product, dispatch_uid='product_document_save')
+post_delete.connect(rebuild_product_document, sender=Product, dispatch_uid='product_document_delete')
+pre_save.connect(remember_line_product, sender=DayRangeProduct, dispatch_uid='product_document_line_pre_save')
+post_save.connect(rebuild_line_product_documents, sender=DayRangeProduct, dispatch_uid='product_document_line_save')
+post_delete.connect(rebuild_line_product_documents, sender=DayRangeProduct, dispatch_uid='product_document_line_delete')
+post_save.connect(rebuild_day_range_product_documents, sender=DayRange, dispatch_uid='product_document_range_save')
+for _model in (Crop, CropVariety, Activity):
+    post_save.connect(invalidate_product_documents, sender=_model,
+                      dispatch_uid=f'product_document_save_{_model.__name__}')
+    post_delete.connect(invalidate_product_documents, sender=_model,
+                        dispatch_uid=f'product_document_delete_{_model.__name__}')
+
+
+def bump_catalog_version(sender, **kwargs):
+    """ETags of the list endpoints that read this table change after commit"""
+    transaction.on_commit(lambda: catalog_versions.bump(sender._meta.db_table))
+
+
+for _model in (Crop, CropVariety, Product):
+    post_save.connect(bump_catalog_version, sender=_model, dispatch_uid=f'catalog_version_save_{_model.__name__}')
+    post_delete.connect(bump_catalog_version, sender=_model, dispatch_uid=f'catalog_version_delete_{_model.__name__}')
+
+
+def buffer_message(sender, instance, created, **kwargs):
+    """New inbound / outbound message -> the conversation's history ring buffer"""
+    if created:
+        transaction.on_commit(partial(history_cache.append, instance))
+
+
+def drop_message_buffer(sender, instance, **kwargs):
+    transaction.on_commit(partial(history_cache.invalidate, instance.conversation_id))
+
+
+post_save.connect(buffer_message, sender=Message, dispatch_uid='history_cache_save')
+post_delete.connect(drop_message_buffer, sender=Message, dispatch_uid='history_cache_delete')
+
+
+def forget_identity(sender, instance, **kwargs):
+    """Name / phone / block state changed, or the row is gone -> drop the cached identity"""
+    user_id = instance.pk if sender is WhatsAppUser else instance.whatsapp_user_id
+    transaction.on_commit(partial(identity.invalidate, user_id))
+
+
+post_save.connect(forget_identity, sender=WhatsAppUser, dispatch_uid='identity_user_save')
+post_delete.connect(forget_identity, sender=WhatsAppUser, dispatch_uid='identity_user_delete')
+post_delete.connect(forget_identity, sender=Conversation, dispatch_uid='identity_conversation_delete')
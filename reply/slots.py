@@ -0,0 +1,177 @@
+"""
+Labor booking slot state per conversation.
+
+Slots (task, count, date, location, farm_size) are filled from each inbound
+message as it arrives - one pass over that message only - instead of
+re-scanning the chat history every turn. Redis holds the live copy,
+Conversation.labor_slots the durable snapshot (used on a cache miss).
+
+Slots only describe the booking being discussed: they are cleared once a
+complete booking is logged, or when a message moves to another topic.
+"""
+import logging
+import re
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .intents import classify
+from .text_utils import LEFT_BOUNDARY, RIGHT_BOUNDARY
+
+logger = logging.getLogger(__name__)
+
+SLOT_NAMES = ('task', 'count', 'date', 'location', 'farm_size')
+SLOTS_TTL_SECONDS = 30 * 24 * 3600
+# Slots a booking needs before it counts as logged (farm_size is optional)
+BOOKING_SLOTS = ('task', 'count', 'date', 'location')
+
+# Matched against normalize()d text (lowercase, ASCII digits)
+WORKER_COUNT_RE = re.compile(
+    r'(?<!\d)(\d{1,4})\s*(?:workers?|labou?rs?|majur|mazdoor|मजूर|मजदूर|कामगार|लोक|माणसं)'
+)
+
+MONTHS = {
+    'jan': 'jan', 'january': 'jan', 'जानेवारी': 'jan', 'जनवरी': 'jan',
+    'feb': 'feb', 'february': 'feb', 'फेब्रुवारी': 'feb', 'फरवरी': 'feb',
+    'mar': 'mar', 'march': 'mar', 'मार्च': 'mar',
+    'apr': 'apr', 'april': 'apr', 'एप्रिल': 'apr', 'अप्रैल': 'apr',
+    'may': 'may', 'मे': 'may', 'मई': 'may',
+    'jun': 'jun', 'june': 'jun', 'जून': 'jun',
+    'jul': 'jul', 'july': 'jul', 'जुलै': 'jul', 'जुलाई': 'jul',
+    'aug': 'aug', 'august': 'aug', 'ऑगस्ट': 'aug', 'अगस्त': 'aug',
+    'sep': 'sep', 'sept': 'sep', 'september': 'sep', 'सप्टेंबर': 'sep', 'सितंबर': 'sep',
+    'oct': 'oct', 'october': 'oct', 'ऑक्टोबर': 'oct', 'अक्टूबर': 'oct',
+    'nov': 'nov', 'november': 'nov', 'नोव्हेंबर': 'nov', 'नवंबर': 'nov',
+    'dec': 'dec', 'december': 'dec', 'डिसेंबर': 'dec', 'दिसंबर': 'dec',
+}
+DATE_RE = re.compile(
+    r'(?<!\d)(\d{1,2})\s*(' + '|'.join(sorted(map(re.escape, MONTHS), key=len, reverse=True)) + r')(?![a-z])'
+)
+
+# Relative days are resolved when the message arrives, so "उद्या" stays right
+_RELATIVE_DAYS = {
+    'today': 0, 'आज': 0, 'tomorrow': 1, 'उद्या': 1, 'कल': 1, 'parva': 2, 'परवा': 2, 'परसों': 2,
+}
+RELATIVE_DATE_RE = re.compile(
+    LEFT_BOUNDARY + '(' + '|'.join(map(re.escape, _RELATIVE_DAYS)) + ')' + RIGHT_BOUNDARY
+)
+
+FARM_SIZE_RE = re.compile(
+    r'(\d+(?:\.\d+)?)\s*(acres?|एकर|guntha|गुंठे|गुंठा|hectares?|हेक्टर|bigha|बीघा)'
+)
+
+
+def empty_slots():
+    return dict.fromkeys(SLOT_NAMES)
+
+
+def is_labor_topic(intent):
+    """The message is about hiring workers (labor words or a labor task)"""
+    return intent.labor or bool(intent.tasks) or 'labor' in intent.services
+
+
+def is_other_topic(intent):
+    """The message is clearly about something else (crop, variety, price, another service)"""
+    if is_labor_topic(intent):
+        return False
+    return bool(intent.crop or intent.varieties or intent.price or intent.spam or intent.services)
+
+
+def booking_complete(slots):
+    return all(slots.get(name) for name in BOOKING_SLOTS)
+
+
+def extract_slots(text, intent=None):
+    """Slots mentioned in one message (only the ones found)"""
+    intent = intent or classify(text)
+    text = intent.text  # already normalized
+    found = {}
+
+    if intent.tasks:
+        found['task'] = intent.tasks[0]
+    if intent.locations:
+        found['location'] = intent.locations[0]
+
+    counts = WORKER_COUNT_RE.findall(text)
+    if counts:
+        found['count'] = counts[-1]  # last mentioned wins
+
+    dates = DATE_RE.findall(text)
+    if dates:
+        day, month = dates[-1]
+        found['date'] = f"{int(day)} {MONTHS[month]}"
+    else:
+        relative = RELATIVE_DATE_RE.findall(text)
+        if relative:
+            day = timezone.localdate() + timezone.timedelta(days=_RELATIVE_DAYS[relative[-1]])
+            found['date'] = f"{day.day} {day.strftime('%b').lower()}"
+
+    sizes = FARM_SIZE_RE.findall(text)
+    if sizes:
+        found['farm_size'] = f"{sizes[-1][0]} {sizes[-1][1]}"
+
+    return found
+
+
+def _cache_key(conversation_id):
+    return f'labor_slots:{conversation_id}'
+
+
+def get_slots(conversation):
+    """Current slots: Redis, else the DB snapshot"""
+    try:
+        slots = cache.get(_cache_key(conversation.id))
+    except Exception as e:
+        logger.warning(f"⚠️ Slot cache unavailable: {e}")
+        slots = None
+    if slots is None:
+        slots = {**empty_slots(), **(conversation.labor_slots or {})}
+    return slots
+
+
+def update_slots(conversation, text, intent=None):
+    """Merge what this message mentions into the conversation's slots"""
+    from .models import Conversation
+
+    intent = intent or classify(text)
+    slots = get_slots(conversation)
+    found = extract_slots(text, intent)
+    if not found and is_other_topic(intent) and any(slots.values()):
+        clear_slots(conversation)
+        return empty_slots()
+    changed = {name: value for name, value in found.items() if slots.get(name) != value}
+    if not changed:
+        return slots
+
+    slots.update(changed)
+    try:
+        cache.set(_cache_key(conversation.id), slots, timeout=SLOTS_TTL_SECONDS)
+    except Exception as e:
+        logger.warning(f"⚠️ Slot cache unavailable: {e}")
+    Conversation.objects.filter(id=conversation.id).update(labor_slots=slots)
+    conversation.labor_slots = slots
+    logger.info(f"🧩 Slots updated for conversation {conversation.id}: {changed}")
+    return slots
+
+
+def clear_slots(conversation):
+    """Forget the booking being discussed (logged, or the topic moved on)"""
+    from .models import Conversation
+
+    try:
+        cache.delete(_cache_key(conversation.id))
+    except Exception as e:
+        logger.warning(f"⚠️ Slot cache unavailable: {e}")
+    Conversation.objects.filter(id=conversation.id).update(labor_slots={})
+    conversation.labor_slots = {}
+    logger.info(f"🧩 Slots cleared for conversation {conversation.id}")
+
+
+def slots_from_history(history):
+    """Slots rebuilt from chat turns - for callers without a conversation"""
+    slots = empty_slots()
+    for msg in history:
+        if msg['role'] == 'user':
+            slots.update(extract_slots(msg['parts'][0]))
+    return slots
+
@@ -0,0 +1,194 @@
+"""
+Gemini usage telemetry.
+
+Every LLM / embedding call is recorded in memory (cheap dict update) and
+flushed in batches to the ApiUsage rollup table, so the hot path never waits
+on a DB write.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Paths through GeminiService.generate_reply
+PATH_GREETING = 'greeting'
+PATH_LABOR = 'labor'
+PATH_RAG = 'rag'
+PATH_SUMMARY = 'summary'
+
+FLUSH_EVERY_CALLS = 50
+FLUSH_EVERY_SECONDS = 60
+# Devanagari runs ~3 chars per token
+CHARS_PER_TOKEN = 3
+
+
+def estimate_tokens(text):
+    """Rough token count for text the API did not count for us"""
+    return (len(text or '') + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def extract_usage(response, prompt=None):
+    """
+    (input_tokens, output_tokens) from a Gemini response's usage_metadata.
+    embed_content results carry none, so their input is estimated from prompt.
+    """
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None and isinstance(response, dict):
+        usage = response.get('usage_metadata')
+    if usage is None:
+        return estimate_tokens(prompt), 0
+    if isinstance(usage, dict):
+        return usage.get('prompt_token_count', 0) or 0, usage.get('candidates_token_count', 0) or 0
+    return (getattr(usage, 'prompt_token_count', 0) or 0,
+            getattr(usage, 'candidates_token_count', 0) or 0)
+
+
+class UsageRecorder:
+    """Thread-safe in-memory aggregator with batched upserts into ApiUsage"""
+
+    def __init__(self, flush_every_calls=FLUSH_EVERY_CALLS, flush_every_seconds=FLUSH_EVERY_SECONDS):
+        self.flush_every_calls = flush_every_calls
+        self.flush_every_seconds = flush_every_seconds
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._buckets = defaultdict(lambda: [0, 0, 0, 0, 0, 0, 0])
+        self._pending_calls = 0
+        self._last_flush = time.monotonic()
+
+    def record(self, path, model, latency_ms, input_tokens=0, output_tokens=0,
+               call_type='generate', user_id=None, error=False, failover=False):
+        """Add one call to the in-memory rollup (never touches the DB)"""
+        key = (timezone.localdate(), path, model, call_type, user_id)
+        latency_ms = int(latency_ms)
+        with self._lock:
+            bucket = self._buckets[key]
+            bucket[0] += 1
+            bucket[1] += 1 if error else 0
+            bucket[2] += int(input_tokens)
+            bucket[3] += int(output_tokens)
+            bucket[4] += latency_ms
+            bucket[5] = max(bucket[5], latency_ms)
+            bucket[6] += 1 if failover else 0
+            self._pending_calls += 1
+            due = (self._pending_calls >= self.flush_every_calls or
+                   time.monotonic() - self._last_flush >= self.flush_every_seconds)
+
+        if due:
+            threading.Thread(target=self._flush_in_thread, name='usage-flush', daemon=True).start()
+
+    def _flush_in_thread(self):
+        try:
+            self.flush()
+        finally:
+            close_old_connections()
+
+    def _drain(self):
+        with self._lock:
+            buckets, self._buckets = self._buckets, defaultdict(lambda: [0, 0, 0, 0, 0, 0, 0])
+            self._pending_calls = 0
+            self._last_flush = time.monotonic()
+        return buckets
+
+    def _restore(self, buckets):
+        """Put unwritten buckets back, merged with whatever was recorded meanwhile"""
+        with self._lock:
+            for key, values in buckets.items():
+                bucket = self._buckets[key]
+                for i, value in enumerate(values):
+                    bucket[i] = max(bucket[i], value) if i == 5 else bucket[i] + value
+                self._pending_calls += values[0]
+
+    def flush(self):
+        """
+        Upsert all pending buckets. Safe to call from any thread. Each bucket
+        is written in its own transaction; if one fails, it and the ones not
+        yet written go back in memory for the next flush.
+        """
+        from .models import ApiUsage
+
+        if not self._flush_lock.acquire(blocking=False):
+            return 0  # another thread is already flushing
+        try:
+            buckets = self._drain()
+            flushed = len(buckets)
+            try:
+                for key, values in list(buckets.items()):
+                    date, path, model, call_type, user_id = key
+                    calls, errors, tokens_in, tokens_out, latency, max_latency, failovers = values
+                    lookup = dict(date=date, path=path, model=model, call_type=call_type, whatsapp_user_id=user_id)
+                    increments = dict(
+                        calls=F('calls') + calls,
+                        errors=F('errors') + errors,
+                        input_tokens=F('input_tokens') + tokens_in,
+                        output_tokens=F('output_tokens') + tokens_out,
+                        total_latency_ms=F('total_latency_ms') + latency,
+                        failovers=F('failovers') + failovers,
+                        updated_at=timezone.now(),
+                    )
+                    with transaction.atomic():
+                        if not ApiUsage.objects.filter(**lookup).update(**increments):
+                            try:
+                                with transaction.atomic():
+                                    ApiUsage.objects.create(
+                                        calls=calls, errors=errors, input_tokens=tokens_in,
+                                        output_tokens=tokens_out, total_latency_ms=latency,
+                                        max_latency_ms=max_latency, failovers=failovers, **lookup
+                                    )
+                            except IntegrityError:
+                                # Another worker created the row first
+                                ApiUsage.objects.filter(**lookup).update(**increments)
+                        ApiUsage.objects.filter(max_latency_ms__lt=max_latency, **lookup).update(
+                            max_latency_ms=max_latency
+                        )
+                    del buckets[key]
+            except Exception as e:
+                logger.error(f"❌ Usage flush failed, keeping {len(buckets)} buckets for the next one: {e}")
+                self._restore(buckets)
+                return flushed - len(buckets)
+
+            if flushed:
+                logger.info(f"📊 Flushed usage for {flushed} buckets")
+            return flushed
+        finally:
+            self._flush_lock.release()
+
+
+usage = UsageRecorder()
+atexit.register(usage.flush)
+
+
+ROLLUP_FIELDS = {
+    'day': ['date'],
+    'path': ['path'],
+    'model': ['model'],
+    'user': ['whatsapp_user_id', 'whatsapp_user__name', 'whatsapp_user__phone_number'],
+    'day_path': ['date', 'path'],
+}
+
+
+def usage_rollup(by='day', days=7):
+    """Aggregated ApiUsage rows for the last `days` days, grouped by `by`"""
+    from .models import ApiUsage
+
+    since = timezone.localdate() - timezone.timedelta(days=days - 1)
+    group = ROLLUP_FIELDS[by]
+    return (
+        ApiUsage.objects.filter(date__gte=since)
+        .values(*group)
+        .annotate(
+            calls=Sum('calls'),
+            errors=Sum('errors'),
+            input_tokens=Sum('input_tokens'),
+            output_tokens=Sum('output_tokens'),
+            total_latency_ms=Sum('total_latency_ms'),
+            failovers=Sum('failovers'),
+        )
+        .order_by(*group)
+    )
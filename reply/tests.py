@@ -1,3 +1,1442 @@
-from django.test import TestCase
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import pandas as pd
+from django.db import DatabaseError, connection, transaction
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import archive, bursts, catalog_versions, crop_calendar, deadline, escalation, history_cache, identity, knowledge_store, model_router, product_documents, quota, responses, views
+from .crop_calendar import CalendarEntry, CalendarIndex, VarietySchedule
+from . import gemini_service
+from .gemini_service import GeminiService
+from .intents import classify
+from .management.commands.bench_intents import SAMPLE_MESSAGES, legacy_classify
+from .knowledge_store import EMPTY_INDEX, KnowledgeBaseWatcher, KnowledgeIndex
+from .model_router import ModelRouter
+from .memory import KEEP_RECENT_TURNS, MAX_UNSUMMARIZED_TURNS, recent_history_queryset, summarize_conversation, summary_due
+from .models import (
+    Activity, ApiUsage, Conversation, Crop, CropVariety, DayRange, DayRangeProduct, FarmerCropProfile, Message,
+    MessageArchive, Product, WhatsAppUser,
+)
+from .product_parser import PRODUCT_TRANS, canonical_key
+from .product_search import ProductSearchIndex
+from .deadline import REPLY_BUDGET_SECONDS, Deadline, hedged
+from .quota import PRIORITY_LIVE, PRIORITY_SUMMARY, GeminiLimiter, QuotaDeadlineExceeded
+from .responses import ACK, CATALOG, GREETING, canned_reply
+from .reminders import MAX_CATCHUP_DAYS, PROFILE_COLUMNS, due_reminders, load_profiles
+from .schedule_import import import_schedule
+from .slots import booking_complete, extract_slots, get_slots, update_slots
+from .schedule_sheets import FOLIAR_LAYOUT, parse_workbook
+from .telemetry import UsageRecorder, extract_usage
+from .varieties import detect_variety, detect_varieties, source_variety
+
+# The calender_* tables belong to the crop calendar app (managed=False), so
+# the test database only has them if they are created here
+CALENDAR_MODELS = (Crop, CropVariety, Activity, Product, DayRange, DayRangeProduct)
+_created_tables = []
+# Per-process cache for the tests that need one (Redis is not required)
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'reply-tests'}}
+
+
+def setUpModule():
+    existing = set(connection.introspection.table_names())
+    with connection.schema_editor() as editor:
+        for model in CALENDAR_MODELS:
+            if model._meta.db_table not in existing:
+                editor.create_model(model)
+                _created_tables.append(model)
+
+
+def tearDownModule():
+    with connection.schema_editor() as editor:
+        for model in reversed(_created_tables):
+            editor.delete_model(model)
+    _created_tables.clear()
+
+
+def bare_gemini_service():
+    """GeminiService without the API client or a knowledge base; _generate is a Mock"""
+    service = GeminiService.__new__(GeminiService)
+    service.kb = EMPTY_INDEX
+    service._generate = mock.Mock(return_value='LLM reply')
+    return service
+
+
+def create_chat(texts, phone='919800000001', start=None):
+    """A conversation whose messages alternate user / bot, one minute apart"""
+    start = start or timezone.make_aware(datetime(2026, 10, 19, 9, 0))
+    user = WhatsAppUser.objects.create(phone_number=phone, name='Ramesh')
+    conversation = Conversation.objects.create(whatsapp_user=user)
+    messages = [
+        Message.objects.create(
+            conversation=conversation, direction='inbound' if i % 2 == 0 else 'outbound',
+            text_content=text, timestamp=start + timedelta(minutes=i),
+        )
+        for i, text in enumerate(texts)
+    ]
+    return conversation, messages
+
+
+def calendar_entry(start_day, end_day, activity='Spray', products=(), info=''):
+    """CalendarEntry without the DB: products are (name, name_marathi, dosage, unit)"""
+    day_range = SimpleNamespace(
+        start_day=start_day, end_day=end_day, info=info, info_marathi='',
+        activity=SimpleNamespace(name=activity, name_marathi=activity),
+        products=SimpleNamespace(all=lambda: [
+            SimpleNamespace(product=SimpleNamespace(name=name, name_marathi=name_marathi), dosage=dosage,
+                            dosage_unit=unit)
+            for name, name_marathi, dosage, unit in products
+        ]),
+    )
+    return CalendarEntry(day_range)
+
+
+class ScheduleAnswerTests(SimpleTestCase):
+    def setUp(self):
+        schedule = VarietySchedule([
+            calendar_entry(40, 50, products=[('Eclonmax', 'इकलोनमेक्स', Decimal('2'), 'ml/liter')]),
+        ])
+        index = CalendarIndex({1: schedule}, {'35': 1}, {'35': ('ARD 35', 'एआरडी 35')}, loaded_at=1.0)
+        patcher = mock.patch.object(crop_calendar, 'get_index', return_value=index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def answer(self, text, variety=None):
+        return crop_calendar.schedule_answer(text, 'en', variety, classify(text))
+
+    def test_spray_question_is_answered(self):
+        self.assertIn('Eclonmax', self.answer('ard 35 45 divas konta spray'))
+
+    def test_variety_from_history_without_schedule_question(self):
+        # "no water for 3 days": a day count, but not a schedule question
+        self.assertIsNone(self.answer('pani 3 divas zale nahi', variety='35'))
+        self.assertFalse(crop_calendar.asks_schedule('pani 3 divas zale nahi', classify('pani 3 divas zale nahi')))
+
+    def test_variety_from_history_with_schedule_question(self):
+        self.assertIn('Eclonmax', self.answer('45 divas spray kay karayche', variety='35'))
+
+    def test_next_days_is_a_span_not_a_day(self):
+        self.assertIsNone(crop_calendar.detect_day('ard 35 next 14 days'))
+        self.assertIsNone(crop_calendar.detect_day('पुढील 14 दिवस फवारणी'))
+        self.assertIsNone(self.answer('ard 35 next 45 days spray'))
+
+    def test_day_after_a_span_still_counts(self):
+        self.assertEqual(crop_calendar.detect_day('next 3 days rain, 45 divas spray'), 45)
+
+
+class ProductSearchTests(SimpleTestCase):
+    def setUp(self):
+        self.index = ProductSearchIndex([
+            (1, 'Eclonmax', 'इकलोनमॅक्स', 'Fertilizer'),
+            (2, 'Batalon', 'बॅटालॉन', 'Pesticide'),
+            (3, 'Boron', 'बोरॉन', 'Fertilizer'),
+        ], PRODUCT_TRANS)
+
+    def names(self, query):
+        return [product['name'] for product, _, _ in self.index.search(query)]
+
+    def test_virama_is_folded(self):
+        self.assertEqual(canonical_key('ईक्लोन'), canonical_key('इकलोन'))
+        self.assertEqual(self.names('ईक्लोन')[:1], ['Eclonmax'])
+
+    def test_english_spelling_with_space(self):
+        self.assertEqual(self.names('eclon max')[:1], ['Eclonmax'])
+
+
+class FoliarSheetTests(SimpleTestCase):
+    """A sheet laid out like ban.xlsx 'Foliar Application' (ban.py: header=0, iloc[15:])"""
+
+    def setUp(self):
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.title = 'Foliar Application'
+        sheet.append(['अ.क्र.', 'काम', 'दिवस', 'फवारणी', 'खत'])
+        for note in range(14):
+            sheet.append([f'टीप {note + 1}'])
+        # Sheet row 15 is the last one ban.py skipped; it must not become an entry
+        sheet.append([0, 'फवारणी', '5 दिवस', 'बोरॉन - 1 ग्रॅम'])
+        sheet.append([1, 'फवारणी', '२५ ते ३० दिवस', 'ईक-लोन-मॅक्स - २ मिली'])
+        sheet.append([None, None, None, None, 'बॅटोलोन - 2 मिली'])
+        sheet.append([2, 'आळवणी', '40 दिवस', 'बोरॉन - 1 ग्रॅम'])
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'ban.xlsx')
+        workbook.save(self.path)
+
+    def test_first_entry_is_sheet_row_16(self):
+        entries, _ = parse_workbook(self.path, {'Foliar Application': FOLIAR_LAYOUT})
+        self.assertEqual(len(entries), 2)
+        first = entries[0]
+        self.assertEqual((first['activity_eng'], first['start_day'], first['end_day']), ('Foliar Spray', 25, 30))
+        self.assertEqual([product[1] for product in first['products']], ['Eclonmax', 'Batalon'])
+        self.assertEqual((entries[1]['activity_eng'], entries[1]['start_day']), ('Drenching', 40))
+
+
+class ProductDocumentBatchTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(product_documents, 'rebuild')
+        self.rebuild = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def rebuilt(self):
+        return [set(call.args[0]) for call in self.rebuild.call_args_list]
+
+    def test_one_rebuild_per_transaction(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product_documents.schedule_rebuild([1, None])
+            product_documents.schedule_rebuild([2])
+        self.assertEqual(self.rebuilt(), [{1, 2}])
+
+    def test_rolled_back_savepoint_drops_its_ids(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    product_documents.schedule_rebuild([2])
+                    raise ValueError
+            except ValueError:
+                pass
+            product_documents.schedule_rebuild([1])
+            with transaction.atomic():
+                product_documents.schedule_rebuild([3])
+        self.assertEqual(self.rebuilt(), [{1}, {3}])
+
+    def test_rolled_back_batch_is_forgotten(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product_documents.schedule_rebuild([1])
+            try:
+                with transaction.atomic():
+                    product_documents.schedule_rebuild([2])
+                    self.assertEqual(len(product_documents._open_batches()), 2)
+                    raise ValueError
+            except ValueError:
+                pass
+            self.assertEqual(len(product_documents._open_batches()), 1)
+        self.assertEqual(self.rebuilt(), [{1}])
+
+    def test_ran_batch_is_not_reused(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product_documents.schedule_rebuild([1])
+        with self.captureOnCommitCallbacks(execute=True):
+            product_documents.schedule_rebuild([2])
+        self.assertEqual(self.rebuilt(), [{1}, {2}])
+
+
+class VarietyScheduleTests(SimpleTestCase):
+    """The bisect-based queries against a brute-force scan of random schedules"""
+
+    def setUp(self):
+        rng = random.Random(35)
+        self.schedules = []
+        for _ in range(30):
+            entries = []
+            for _ in range(rng.randint(0, 25)):
+                start = rng.randint(-20, 60)
+                entries.append(calendar_entry(start, start + rng.choice([0, 0, 1, 5, 10, 30])))
+            self.schedules.append((entries, VarietySchedule(entries)))
+
+    def assertSameEntries(self, found, expected):
+        self.assertCountEqual([id(e) for e in found], [id(e) for e in expected])
+
+    def test_between(self):
+        for entries, schedule in self.schedules:
+            for first in range(-25, 95, 3):
+                for last in (first, first + 4, first + 20):
+                    found = schedule.between(first, last)
+                    self.assertSameEntries(found, [e for e in entries if e.start_day <= last and e.end_day >= first])
+                    self.assertEqual([e.start_day for e in found], sorted(e.start_day for e in found))
+
+    def test_before(self):
+        for entries, schedule in self.schedules:
+            for day in range(-25, 95):
+                ended = [e for e in entries if e.end_day < day]
+                closest = max((e.end_day for e in ended), default=None)
+                self.assertSameEntries(schedule.before(day), [e for e in ended if e.end_day == closest])
+
+    def test_after(self):
+        for entries, schedule in self.schedules:
+            for day in range(-25, 95):
+                later = [e for e in entries if e.start_day > day]
+                closest = min((e.start_day for e in later), default=None)
+                self.assertSameEntries(schedule.after(day), [e for e in later if e.start_day == closest])
+
+
+class DueReminderTests(SimpleTestCase):
+    today = date(2026, 10, 19)
+
+    def setUp(self):
+        spray = [('Eclonmax', 'इकलोनमेक्स', Decimal('2'), 'ml/liter')]
+        schedule = VarietySchedule([
+            calendar_entry(40, 41, products=spray),
+            calendar_entry(41, 41),  # nothing to say: never sent
+            calendar_entry(42, 44, products=spray),
+            calendar_entry(44, 44, products=spray),
+            calendar_entry(45, 50, products=spray),
+            calendar_entry(46, 46, products=spray),
+        ])
+        self.index = CalendarIndex({1: schedule}, loaded_at=1.0)
+
+    def due(self, last_reminded_on, day=45, variety_id=1):
+        pruning_date = self.today - timedelta(days=day)
+        profiles = pd.DataFrame.from_records(
+            [(7, 70, variety_id, pruning_date, last_reminded_on, 'mr')], columns=PROFILE_COLUMNS,
+        )
+        return {reminder.day: [e.start_day for e in reminder.entries]
+                for reminder in due_reminders(profiles, self.index, self.today)}
+
+    def test_never_reminded_gets_today_only(self):
+        self.assertEqual(self.due(None), {45: [45]})
+
+    def test_reminded_yesterday_gets_today_only(self):
+        self.assertEqual(self.due(self.today - timedelta(days=1)), {45: [45]})
+
+    def test_missed_days_are_caught_up(self):
+        self.assertEqual(self.due(self.today - timedelta(days=3)), {45: [44, 45]})
+        self.assertEqual(self.due(self.today - timedelta(days=4), day=46), {46: [44, 45, 46]})
+
+    def test_catch_up_is_capped(self):
+        capped = self.due(self.today - timedelta(days=MAX_CATCHUP_DAYS))
+        self.assertEqual(self.due(self.today - timedelta(days=30)), capped)
+
+    def test_already_reminded_today(self):
+        self.assertEqual(self.due(self.today), {})
+
+    def test_unknown_variety(self):
+        self.assertEqual(self.due(None, variety_id=2), {})
+
+
+class LoadProfilesTests(TestCase):
+    """Blocked users get no reminders, but only while the block lasts"""
+
+    def profile(self, phone, **user_fields):
+        user = WhatsAppUser.objects.create(phone_number=phone, **user_fields)
+        return FarmerCropProfile.objects.create(whatsapp_user=user, crop_variety_id=1,
+                                                pruning_date=date(2026, 9, 1)).id
+
+    def test_expired_blocks_count_as_lifted(self):
+        now = timezone.now()
+        active = self.profile('919800000011')
+        self.profile('919800000012', is_blocked=True, blocked_until=now + timedelta(hours=1))
+        expired = self.profile('919800000013', is_blocked=True, blocked_until=now - timedelta(hours=1))
+        self.assertEqual(sorted(load_profiles()['id']), [active, expired])
+
+
+class GeminiLimiterFallbackTests(SimpleTestCase):
+    """Without Redis the limiter lets every call through (and still retries a 429)"""
+
+    def setUp(self):
+        self.limiter = GeminiLimiter(deadline_seconds=30)
+        patcher = mock.patch.object(self.limiter, '_redis', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(quota.time, 'sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_slot_is_immediate(self):
+        with self.limiter.slot(PRIORITY_SUMMARY) as lease:
+            self.assertIsNone(lease.ticket)
+            self.assertEqual(lease.waited, 0)
+        self.sleep.assert_not_called()
+
+    def test_rate_limited_call_is_retried_after_a_cooldown(self):
+        func = mock.Mock(side_effect=[Exception('429 Resource exhausted'), 'reply'])
+        result, waited = self.limiter.run(func)
+        self.assertEqual((result, func.call_count), ('reply', 2))
+        self.sleep.assert_called_once()
+        self.assertGreaterEqual(self.sleep.call_args.args[0], quota.RATE_LIMIT_COOLDOWN_SECONDS)
+        self.assertEqual(waited, self.sleep.call_args.args[0])
+
+    def test_cooldown_past_the_deadline_gives_up(self):
+        func = mock.Mock(side_effect=Exception('429 Resource exhausted'))
+        with self.assertRaises(QuotaDeadlineExceeded):
+            self.limiter.run(func, timeout=1)
+        self.assertEqual(func.call_count, 1)
+        self.sleep.assert_not_called()
+
+    def test_rate_limited_call_raised_when_not_retried(self):
+        func = mock.Mock(side_effect=Exception('429 Resource exhausted'))
+        with self.assertRaises(Exception):
+            self.limiter.run(func, retry_rate_limited=False)
+        self.assertEqual(func.call_count, 1)
+
+
+class GeminiLimiterRedisDownTests(SimpleTestCase):
+    """A configured but unreachable Redis lets calls through and is not re-probed every call"""
+
+    def setUp(self):
+        from redis.exceptions import ConnectionError as RedisConnectionError
+        self.limiter = GeminiLimiter(deadline_seconds=5)
+        self.client = mock.Mock()
+        self.client.zadd.side_effect = RedisConnectionError('Connection refused')
+        self.client.zrem.side_effect = RedisConnectionError('Connection refused')
+        self.limiter._client = self.client
+        self.limiter._script = mock.Mock()
+
+    def test_slot_is_unlimited(self):
+        with self.limiter.slot() as lease:
+            self.assertIsNone(lease.ticket)
+        self.limiter._script.assert_not_called()
+
+    def test_backs_off_before_reprobing(self):
+        self.assertEqual(self.limiter.run(lambda: 'reply'), ('reply', mock.ANY))
+        self.assertEqual(self.limiter.run(lambda: 'reply'), ('reply', 0))
+        self.assertEqual(self.client.zadd.call_count, 1)
+
+        self.limiter._down_until = 0
+        self.client.zadd.side_effect = None
+        self.limiter._script.return_value = b'ok'
+        with self.limiter.slot() as lease:
+            self.assertIsNotNone(lease.ticket)
+        self.client.pipeline.return_value.execute.assert_called_once()
+
+    def test_cooldown_ignores_dead_redis(self):
+        from redis.exceptions import TimeoutError as RedisTimeoutError
+        self.client.set.side_effect = RedisTimeoutError('Timeout')
+        self.limiter.cooldown()
+        self.assertIsNone(self.limiter._redis())
+
+
+class GeminiLimiterRedisTests(SimpleTestCase):
+    """The Lua acquire script against a real Redis (skipped without one)"""
+
+    def setUp(self):
+        try:
+            from django_redis import get_redis_connection
+            self.client = get_redis_connection('default')
+            self.client.ping()
+        except Exception as e:
+            self.skipTest(f'needs Redis: {e}')
+        self.prefix = f'test:gemini:{uuid.uuid4().hex}'
+        self.addCleanup(self.delete_keys)
+
+    def delete_keys(self):
+        keys = self.client.keys(f'{self.prefix}:*')
+        if keys:
+            self.client.delete(*keys)
+
+    def limiter(self, **kwargs):
+        limiter = GeminiLimiter(deadline_seconds=0.3, **kwargs)
+        limiter.keys = [f'{self.prefix}:{name}' for name in
+                        ('queue', 'heartbeats', 'leases', 'rpm', 'tpm', 'cooldown')]
+        return limiter
+
+    def acquire(self, limiter, ticket):
+        return limiter._script(keys=limiter.keys, args=[ticket, limiter.rpm, limiter.tpm, 100,
+                                                        limiter.max_concurrency, 60, 5])
+
+    def test_live_requests_are_served_first(self):
+        limiter = self.limiter()
+        limiter._redis()
+        now = time.time() * 1000
+        self.client.zadd(limiter.keys[0], {'summary': PRIORITY_SUMMARY * 1e13 + now,
+                                           'live': PRIORITY_LIVE * 1e13 + now + 1})
+        self.assertEqual(self.acquire(limiter, 'summary'), b'queued')
+        self.assertEqual(self.acquire(limiter, 'live'), b'ok')
+        self.assertEqual(self.acquire(limiter, 'summary'), b'ok')
+
+    def test_concurrency_limit(self):
+        limiter = self.limiter(max_concurrency=1)
+        with limiter.slot():
+            with self.assertRaises(QuotaDeadlineExceeded):
+                with limiter.slot():
+                    pass
+        self.assertEqual(self.client.zcard(limiter.keys[0]), 0)  # the loser left the queue
+        with limiter.slot() as lease:
+            self.assertIsNotNone(lease.ticket)
+
+    def test_rpm_bucket(self):
+        limiter = self.limiter(rpm=1)
+        with limiter.slot():
+            pass
+        with self.assertRaises(QuotaDeadlineExceeded):
+            with limiter.slot():
+                pass
+
+    def test_cooldown_holds_everyone(self):
+        limiter = self.limiter()
+        limiter.cooldown(1)
+        with self.assertRaises(QuotaDeadlineExceeded):
+            with limiter.slot():
+                pass
+
+
+class ImportScheduleTests(TestCase):
+    def entries(self, eclonmax_dose='2'):
+        return [
+            {'activity_mar': 'फवारणी', 'activity_eng': 'Foliar Spray', 'start_day': 25, 'end_day': 30,
+             'purpose': 'Growth', 'products': [('ईक-लोन-मॅक्स', 'Eclonmax', eclonmax_dose, 'ml/liter')]},
+            {'activity_mar': 'आळवणी', 'activity_eng': 'Drenching', 'start_day': 40, 'end_day': 40,
+             'purpose': '', 'products': [('बोरॉन', 'Boron', '1', 'gm/liter'),
+                                          ('बॅटोलोन', 'Batalon', 'x', 'ml/liter')]},
+        ]
+
+    def snapshot(self):
+        return (
+            list(DayRange.objects.order_by('id').values_list('id', 'start_day', 'end_day', 'activity__name')),
+            list(DayRangeProduct.objects.order_by('id').values_list('id', 'product__name', 'dosage', 'dosage_unit')),
+            Product.objects.count(), Activity.objects.count(),
+        )
+
+    def test_dry_run_writes_nothing(self):
+        result = import_schedule('Grapes', 'ARD 35', self.entries(), dry_run=True)
+        self.assertEqual((result.created, result.activities_created, result.products_created), (2, 2, 2))
+        self.assertEqual(result.skipped_products, 1)  # 'x' is no dosage
+        self.assertIn('+ days 25-30 Foliar Spray (1 products)', result.diff)
+        self.assertFalse(Crop.objects.exists())
+        self.assertEqual(self.snapshot(), ([], [], 0, 0))
+
+    def test_reimport_is_idempotent(self):
+        import_schedule('Grapes', 'ARD 35', self.entries())
+        before = self.snapshot()
+        self.assertEqual(len(before[0]), 2)
+
+        for dry_run in (True, False):
+            result = import_schedule('Grapes', 'ARD 35', self.entries(), dry_run=dry_run)
+            self.assertFalse(result.changed)
+            self.assertEqual(result.unchanged, 2)
+            self.assertEqual(result.diff, [])
+        self.assertEqual(self.snapshot(), before)
+
+    def test_reimport_rewrites_only_changed_ranges(self):
+        import_schedule('Grapes', 'ARD 35', self.entries())
+        day_ranges = dict(DayRange.objects.values_list('start_day', 'id'))
+
+        changed = self.entries(eclonmax_dose='2.5')[:1]
+        dry = import_schedule('Grapes', 'ARD 35', changed, dry_run=True)
+        self.assertEqual((dry.updated, dry.deleted, dry.created), (1, 1, 0))
+        self.assertEqual(DayRangeProduct.objects.get(day_range__start_day=25).dosage, Decimal('2'))
+
+        import_schedule('Grapes', 'ARD 35', changed)
+        self.assertEqual(dict(DayRange.objects.values_list('start_day', 'id')), {25: day_ranges[25]})
+        self.assertEqual(DayRangeProduct.objects.get(day_range__start_day=25).dosage, Decimal('2.5'))
+
+
+class VarietyTests(SimpleTestCase):
+    def test_aliases(self):
+        self.assertEqual(detect_variety('ard35 la konti favarni'), '35')
+        self.assertEqual(detect_variety('एआरडी ३५ साठी फवारणी'), '35')
+        self.assertEqual(detect_variety('Crimpson var dawny'), 'cri')
+        self.assertEqual(detect_varieties('ard 35 ani thompson'), {'35', 'th'})
+        self.assertIsNone(detect_variety('ard 35 ani thompson'))
+
+    def test_bare_number_is_not_a_variety(self):
+        self.assertIsNone(detect_variety('15 मजूर पाहिजेत'))
+        self.assertEqual(detect_variety('arra 15 sathi'), '15')
+
+    def test_source_variety(self):
+        self.assertEqual(source_variety('36'), '36')
+        self.assertEqual(source_variety('all - एआरडी ३५ '), '35')
+        self.assertIsNone(source_variety('company_info'))
+
+
+class VarietyPartitionTests(SimpleTestCase):
+    def setUp(self):
+        # Every chunk points the same way, so the partition alone decides what is found
+        self.index = KnowledgeIndex.from_vector_database([
+            {'source': '35', 'type': 'docx', 'content': 'ard 35 spray', 'vector': [1.0, 0.1]},
+            {'source': '36', 'type': 'docx', 'content': 'ard 36 spray', 'vector': [1.0, 0.0]},
+            {'source': 'company_info', 'type': 'text', 'content': 'company', 'vector': [1.0, 0.2]},
+            {'source': 'all - एआरडी ३६', 'type': 'xlsx', 'content': 'ard 36 sheet', 'vector': [1.0, 0.05]},
+        ])
+
+    def search(self, query, variety=None):
+        service = SimpleNamespace(kb=self.index, _embed=lambda *args, **kwargs: [1.0, 0.0])
+        return GeminiService.search_knowledge_base(service, query, top_k=4, variety=variety)
+
+    def test_partitions_are_own_plus_shared(self):
+        self.assertEqual(set(self.index.partitions), {'35', '36'})
+        self.assertEqual(list(self.index.partitions['35'][0]), [0, 2])
+        self.assertEqual(list(self.index.partitions['36'][0]), [1, 2, 3])
+
+    def test_search_stays_in_the_variety(self):
+        context = self.search('ard 35 la konta spray')
+        self.assertIn('ard 35 spray', context)
+        self.assertNotIn('ard 36', context)
+        self.assertIn('ard 36 sheet', self.search('konta spray', variety='36'))
+
+    def test_search_without_variety_scores_everything(self):
+        context = self.search('konta spray')
+        for content in ('ard 35 spray', 'ard 36 spray', 'company', 'ard 36 sheet'):
+            self.assertIn(content, context)
+
+
+class KnowledgeStoreFallbackTests(SimpleTestCase):
+    """Redis down at startup: the pointer objects, then the local file, still answer"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with open(os.path.join(directory.name, 'vector_database.json'), 'w', encoding='utf-8') as f:
+            json.dump([{'source': '35', 'type': 'docx', 'content': 'ard 35', 'vector': [1.0, 0.0]}], f)
+        override = self.settings(BASE_DIR=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        for method in ('get', 'set'):
+            patcher = mock.patch.object(knowledge_store.cache, method, side_effect=ConnectionError('redis down'))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_local_file_when_nothing_is_published(self):
+        with mock.patch.object(knowledge_store, '_read_pointer', return_value=None):
+            index = knowledge_store.load_current_index()
+        self.assertEqual((index.version, len(index)), (knowledge_store.LOCAL_VERSION, 1))
+
+    def test_pointer_answers_without_redis(self):
+        snapshot = KnowledgeIndex('20261019T080000', [], EMPTY_INDEX.vectors)
+        with mock.patch.object(knowledge_store, '_read_pointer', return_value='20261019T080000'), \
+                mock.patch.object(knowledge_store, 'load_snapshot', return_value=snapshot) as load:
+            self.assertIs(knowledge_store.load_current_index(), snapshot)
+        load.assert_called_once_with('20261019T080000')
+
+    def test_watcher_loads_the_local_file_after_an_empty_start(self):
+        owner = SimpleNamespace(kb=EMPTY_INDEX)
+        watcher = KnowledgeBaseWatcher(owner, interval=1)
+        with mock.patch.object(knowledge_store, '_read_pointer', return_value=None):
+            self.assertTrue(watcher.check_once())
+            self.assertEqual(owner.kb.version, knowledge_store.LOCAL_VERSION)
+            self.assertFalse(watcher.check_once())
+
+    def test_watcher_swaps_to_a_new_version(self):
+        owner = SimpleNamespace(kb=KnowledgeIndex(knowledge_store.LOCAL_VERSION, [], EMPTY_INDEX.vectors))
+        snapshot = KnowledgeIndex('20261019T080000', [], EMPTY_INDEX.vectors)
+        watcher = KnowledgeBaseWatcher(owner, interval=1)
+        with mock.patch.object(knowledge_store, '_read_pointer', return_value='20261019T080000'), \
+                mock.patch.object(knowledge_store, 'load_snapshot', return_value=snapshot):
+            self.assertTrue(watcher.check_once())
+        self.assertIs(owner.kb, snapshot)
+
+
+class ExtractUsageTests(SimpleTestCase):
+    def test_generate_response_usage(self):
+        response = SimpleNamespace(usage_metadata=SimpleNamespace(prompt_token_count=120, candidates_token_count=30))
+        self.assertEqual(extract_usage(response, 'ignored'), (120, 30))
+
+    def test_embedding_is_estimated_from_the_input(self):
+        self.assertEqual(extract_usage({'embedding': [0.1, 0.2]}, 'एआरडी ३५ फवारणी'), (5, 0))
+        self.assertEqual(extract_usage({'embedding': [0.1, 0.2]}), (0, 0))
+
+
+class UsageFlushTests(TestCase):
+    def setUp(self):
+        self.recorder = UsageRecorder(flush_every_calls=1000, flush_every_seconds=3600)
+
+    def rows(self):
+        return sorted(ApiUsage.objects.values_list('path', 'calls', 'input_tokens', 'max_latency_ms'))
+
+    def test_rows_without_a_user_are_upserted(self):
+        for latency in (100, 300):
+            self.recorder.record('rag', 'gemini', latency, input_tokens=10)
+            self.assertEqual(self.recorder.flush(), 1)
+        self.assertEqual(self.rows(), [('rag', 2, 20, 300)])
+
+    def test_failed_write_keeps_the_buckets(self):
+        self.recorder.record('rag', 'gemini', 100, input_tokens=10)
+        self.recorder.record('labor', 'gemini', 200, input_tokens=5)
+        create = ApiUsage.objects.create
+
+        def create_once(**kwargs):
+            if kwargs['path'] == 'labor':
+                raise DatabaseError('connection lost')
+            return create(**kwargs)
+
+        with mock.patch.object(ApiUsage.objects, 'create', side_effect=create_once):
+            self.assertEqual(self.recorder.flush(), 1)
+        self.assertEqual(self.rows(), [('rag', 1, 10, 100)])
+
+        self.recorder.record('labor', 'gemini', 50, input_tokens=1)
+        self.assertEqual(self.recorder.flush(), 1)
+        self.assertEqual(self.rows(), [('labor', 2, 6, 200), ('rag', 1, 10, 100)])
+
+
+class ConversationMemoryTests(TestCase):
+    def setUp(self):
+        self.texts = [f'turn {i}' for i in range(9)]
+        self.conversation, self.messages = create_chat(self.texts)
+        self.gemini = mock.Mock()
+        self.gemini._generate.return_value = 'Ramesh needs 20 workers in Satara'
+        self.later = self.messages[-1].timestamp + timedelta(minutes=1)
+
+    def prompt(self, call=-1):
+        return self.gemini._generate.call_args_list[call].args[0]
+
+    def test_summary_due(self):
+        self.assertFalse(summary_due(MAX_UNSUMMARIZED_TURNS - 1))
+        self.assertTrue(summary_due(MAX_UNSUMMARIZED_TURNS))
+
+    def test_all_but_the_recent_turns_are_folded(self):
+        self.assertEqual(summarize_conversation(self.conversation.id, self.gemini), 'Ramesh needs 20 workers in Satara')
+        self.conversation.refresh_from_db()
+        folded = len(self.texts) - KEEP_RECENT_TURNS
+        self.assertEqual(self.conversation.summary_until, self.messages[folded - 1].timestamp)
+        self.assertIn(f'turn {folded - 1}\n', self.prompt())
+        self.assertNotIn(f'turn {folded}', self.prompt())
+
+        # The prompt window is now just the turns the summary doesn't cover
+        window = recent_history_queryset(self.conversation, self.later)
+        self.assertEqual([m.text_content for m in window], self.texts[:folded - 1:-1])
+
+    def test_next_summary_starts_after_the_last_one(self):
+        summarize_conversation(self.conversation.id, self.gemini)
+        self.assertIsNone(summarize_conversation(self.conversation.id, self.gemini))  # only the kept turns left
+        self.assertEqual(self.gemini._generate.call_count, 1)
+
+        start = self.later
+        for i in range(4):
+            Message.objects.create(conversation=self.conversation, direction='inbound',
+                                   text_content=f'new {i}', timestamp=start + timedelta(minutes=i))
+        summarize_conversation(self.conversation.id, self.gemini)
+        self.assertIn('Ramesh needs 20 workers in Satara', self.prompt())  # the old summary is updated
+        self.assertNotIn('turn 0', self.prompt())
+        self.assertIn('turn 8', self.prompt())
+        self.assertNotIn('new 1', self.prompt())
+
+    def test_summary_moved_meanwhile_is_kept(self):
+        def other_worker_first(prompt, *args):
+            Conversation.objects.filter(id=self.conversation.id).update(
+                summary='newer', summary_until=self.messages[-1].timestamp)
+            return 'stale'
+
+        self.gemini._generate.side_effect = other_worker_first
+        summarize_conversation(self.conversation.id, self.gemini)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summary, 'newer')
+
+
+class IntentParityTests(SimpleTestCase):
+    """classify() against the keyword loops it replaced (bench_intents.legacy_classify)"""
+
+    def test_same_answers_on_the_sample(self):
+        for message in SAMPLE_MESSAGES:
+            old, new = legacy_classify(message), classify(message)
+            with self.subTest(message=message):
+                for flag in ('greeting', 'ack', 'follow_up', 'crop', 'urgent', 'price'):
+                    self.assertEqual(getattr(new, flag), old[flag], flag)
+                self.assertEqual(new.services, old['services'])
+                self.assertEqual((new.locations or [None])[0], old['location'])
+                self.assertEqual(new.numbers, old['numbers'])
+                # Only ever more: Devanagari words / junk the old checks missed
+                self.assertGreaterEqual(new.labor, old['labor'])
+                self.assertGreaterEqual(new.spam, old['spam'])
+
+    def test_devanagari_words_that_old_boundaries_missed(self):
+        self.assertFalse(legacy_classify('उद्या फवारणी आहे')['labor'])
+        self.assertTrue(classify('उद्या फवारणी आहे').labor)
+        self.assertTrue(classify('फवारणीसाठी मजूरांना बोलवा').labor)
+
+    def test_no_matches_inside_other_words(self):
+        self.assertTrue(legacy_classify('multiple rows dararoj')['spam'])
+        self.assertFalse(classify('multiple rows dararoj').spam)
+        self.assertTrue(legacy_classify('दररोज पाणी')['price'])
+        self.assertFalse(classify('दररोज पाणी').price)
+
+    def test_greetings_only_as_the_whole_message(self):
+        self.assertTrue(classify('Namaste').greeting)
+        self.assertFalse(classify('hi I need 20 workers').greeting)
+        self.assertTrue(classify('good morning, 20 workers pahije').greeting)
+
+    def test_junk(self):
+        for message in ('asdfghjkl', '12345', 'bcdfghjk', 'x'):
+            self.assertTrue(classify(message).spam, message)
+        for message in ('मला 20 मजूर पाहिजेत', 'ok', 'ard 35 spray'):
+            self.assertFalse(classify(message).spam, message)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CannedReplyTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_variants_rotate_per_user(self):
+        variants = [v.format(name='Ramesh') for v in CATALOG[GREETING]['mr']]
+        replies = [canned_reply(GREETING, 'mr', 'Ramesh Patil', user_id=7) for _ in range(len(variants) + 1)]
+        self.assertEqual(replies, variants + variants[:1])
+        self.assertEqual(canned_reply(GREETING, 'mr', 'Ramesh', user_id=8), variants[0])
+
+    def test_phone_number_is_not_a_name(self):
+        for _ in range(6):
+            reply = canned_reply(GREETING, 'en', '+91 98000 00001', user_id=7)
+            self.assertNotIn('98000', reply)
+            self.assertIn(reply, [v for v in CATALOG[GREETING]['en'] if '{name}' not in v])
+
+    def test_unknown_language_falls_back_to_english(self):
+        self.assertEqual(canned_reply(ACK, 'gu'), CATALOG[ACK]['en'][0])
+
+    def test_cache_down_still_replies(self):
+        with mock.patch.object(responses.cache, 'add', side_effect=ConnectionError('redis down')):
+            self.assertEqual(canned_reply(ACK, 'hi', user_id=7), CATALOG[ACK]['hi'][0])
+
+    def test_greetings_and_acks_skip_the_llm(self):
+        service = bare_gemini_service()
+        self.assertIn(service.generate_reply([], 'नमस्कार', 'mr', 'Ramesh', user_id=7),
+                      [v.format(name='Ramesh') for v in CATALOG[GREETING]['mr']])
+        self.assertIn(service.generate_reply([], 'ok', 'en', 'Ramesh', user_id=7), CATALOG[ACK]['en'])
+        service._generate.assert_not_called()
+
+        with self.settings(GEMINI_LLM_GREETINGS=True):
+            self.assertEqual(service.generate_reply([], 'hello', 'en', 'Ramesh', user_id=7), 'LLM reply')
+
+
+class SlotExtractionTests(SimpleTestCase):
+    def test_one_message(self):
+        self.assertEqual(
+            extract_slots('मला 20 मजूर पाहिजेत 15 डिसेंबर सातारा छाटणी नंतर कटाई, 3 एकर'),
+            {'task': 'कटाई', 'count': '20', 'date': '15 dec', 'location': 'सातारा', 'farm_size': '3 एकर'},
+        )
+        self.assertEqual(extract_slots('I need 15 workers for pruning in Nashik on 2nd'),
+                         {'task': 'pruning', 'count': '15', 'location': 'nashik'})
+
+    def test_last_mention_wins(self):
+        self.assertEqual(extract_slots('10 workers, no make it 12 workers')['count'], '12')
+
+    def test_devanagari_digits_and_relative_days(self):
+        with mock.patch('django.utils.timezone.localdate', return_value=date(2026, 12, 31)):
+            self.assertEqual(extract_slots('उद्या २० मजूर'), {'count': '20', 'date': '1 jan'})
+
+    def test_numbers_that_are_not_worker_counts(self):
+        self.assertEqual(extract_slots('ard 35 la 45 divas'), {})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SlotStateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.conversation, _ = create_chat([])
+
+    def test_slots_build_up_over_messages(self):
+        update_slots(self.conversation, 'मजूर पाहिजेत कटाई साठी')
+        update_slots(self.conversation, '20 मजूर')
+        slots = update_slots(self.conversation, '15 dec satara')
+        self.assertEqual(slots, {'task': 'कटाई', 'count': '20', 'date': '15 dec', 'location': 'satara',
+                                 'farm_size': None})
+        self.assertTrue(booking_complete(slots))
+
+    def test_db_snapshot_after_a_cache_miss(self):
+        update_slots(self.conversation, '20 workers for pruning')
+        cache.clear()
+        conversation = Conversation.objects.get(id=self.conversation.id)
+        self.assertEqual(get_slots(conversation)['count'], '20')
+        self.assertFalse(booking_complete(get_slots(conversation)))
+
+    def test_another_topic_clears_them(self):
+        update_slots(self.conversation, '20 workers for pruning')
+        self.assertEqual(update_slots(self.conversation, 'ard 35 la konta spray'), dict.fromkeys(
+            ('task', 'count', 'date', 'location', 'farm_size')))
+        self.assertEqual(Conversation.objects.get(id=self.conversation.id).labor_slots, {})
+
+    def test_small_talk_keeps_them(self):
+        update_slots(self.conversation, '20 workers for pruning')
+        self.assertEqual(update_slots(self.conversation, 'ok')['count'], '20')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BurstReplyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.conversation, _ = create_chat([])
+        self.gemini = mock.Mock()
+        self.gemini.generate_reply.return_value = 'Reply for both'
+        for target, value in (('get_gemini_service', mock.Mock(return_value=self.gemini)),
+                              ('WhatsAppService', mock.Mock())):
+            patcher = mock.patch.object(views, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(views.history_cache, 'recent_history', return_value=[])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def receive(self, text):
+        message = Message.objects.create(conversation=self.conversation, direction='inbound', text_content=text)
+        seq, start = bursts.register_message(self.conversation.id, message.id)
+        return seq, start
+
+    def reply(self, seq, start):
+        views._generate_and_send(self.conversation.id, seq, start['message_id'], start['at'])
+
+    def sent(self):
+        return [call.args[1] for call in views.WhatsAppService.return_value.send_text_message.call_args_list]
+
+    def burst_open(self):
+        return cache.get(bursts._start_key(self.conversation.id)) is not None
+
+    def test_one_reply_for_the_burst(self):
+        self.receive('20 workers pahije')
+        seq, start = self.receive('satara la')
+        self.reply(seq, start)
+        self.assertEqual(self.gemini.generate_reply.call_args.args[1], '20 workers pahije\nsatara la')
+        self.assertEqual(self.sent(), ['Reply for both'])
+        self.assertFalse(self.burst_open())
+
+    def test_superseded_job_skips_the_llm(self):
+        seq, start = self.receive('20 workers pahije')
+        self.receive('satara la')
+        self.reply(seq, start)
+        self.gemini.generate_reply.assert_not_called()
+        self.assertEqual(self.sent(), [])
+        self.assertTrue(self.burst_open())  # the newer job still answers both
+
+    def test_busy_reply_closes_the_burst(self):
+        self.gemini.generate_reply.side_effect = QuotaDeadlineExceeded('no slot')
+        seq, start = self.receive('20 workers pahije')
+        self.reply(seq, start)
+        self.assertEqual(len(self.sent()), 1)
+        self.assertIn('busy', self.sent()[0])
+        self.assertFalse(self.burst_open())
+
+    def test_failure_closes_the_burst(self):
+        seq, start = self.receive('20 workers pahije')
+        with mock.patch.object(views, 'get_slots', side_effect=DatabaseError('gone')):
+            with self.assertRaises(DatabaseError):
+                self.reply(seq, start)
+        self.assertFalse(self.burst_open())
+
+    def test_budget_starts_at_the_first_message(self):
+        seq, start = self.receive('20 workers pahije')
+        self.reply(seq, {**start, 'at': start['at'] - 10})
+        deadline = self.gemini.generate_reply.call_args.kwargs['deadline']
+        self.assertLessEqual(deadline.remaining(), REPLY_BUDGET_SECONDS - 10)
+        self.assertGreater(deadline.remaining(), REPLY_BUDGET_SECONDS - 12)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ModelRouterTests(SimpleTestCase):
+    """Healthy models in configured order; slow, failing or rate-limited ones last"""
+
+    def setUp(self):
+        cache.clear()
+        self.router = ModelRouter(routes={'rag': ['primary', 'fallback'], 'default': ['primary']},
+                                  slow_p95_ms=1000)
+
+    def test_primary_first_when_healthy(self):
+        self.assertEqual(self.router.candidates('rag'), [('primary', False), ('fallback', True)])
+
+    def test_unknown_path_uses_default_route(self):
+        self.assertEqual(self.router.candidates('greeting'), [('primary', False)])
+
+    def test_erroring_primary_goes_last(self):
+        for _ in range(5):
+            self.router.observe('primary', 100, error=True)
+        self.assertEqual(self.router.candidates('rag'), [('fallback', True), ('primary', False)])
+
+    def test_slow_primary_goes_last(self):
+        for _ in range(5):
+            self.router.observe('primary', 5000)
+        self.assertEqual(self.router.candidates('rag')[0], ('fallback', True))
+
+    def test_too_few_samples_stay_healthy(self):
+        for _ in range(4):
+            self.router.observe('primary', 100, error=True)
+        self.assertEqual(self.router.candidates('rag')[0], ('primary', False))
+
+    def test_rate_limited_primary_goes_last(self):
+        self.router.mark_rate_limited('primary')
+        self.assertEqual(self.router.unhealthy_reason('primary'), 'rate_limited')
+        self.assertEqual(self.router.candidates('rag')[0], ('fallback', True))
+
+    def test_cache_outage_keeps_every_model(self):
+        from redis.exceptions import ConnectionError as RedisConnectionError
+        with mock.patch.object(model_router, 'cache') as broken:
+            broken.get.side_effect = broken.set.side_effect = RedisConnectionError('Connection refused')
+            self.router.mark_rate_limited('primary')
+            self.assertEqual(self.router.candidates('rag'), [('primary', False), ('fallback', True)])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ModelFailoverTests(SimpleTestCase):
+    """GeminiService._generate walks the router's candidates until one answers"""
+
+    def setUp(self):
+        cache.clear()
+        self.router = ModelRouter(routes={'rag': ['primary', 'fallback'], 'default': ['primary']})
+        patcher = mock.patch.object(gemini_service, 'model_router', self.router)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service = GeminiService.__new__(GeminiService)
+
+    def models_tried(self, call_model):
+        return [(call.args[0], call.args[4]) for call in call_model.call_args_list]
+
+    def test_fails_over_on_error(self):
+        with mock.patch.object(self.service, '_call_model',
+                               side_effect=[Exception('500 internal'), 'fallback reply']) as call_model:
+            self.assertEqual(self.service._generate('prompt', 'rag'), 'fallback reply')
+        self.assertEqual(self.models_tried(call_model), [('primary', False), ('fallback', True)])
+        self.assertIsNone(self.router.unhealthy_reason('primary'))
+
+    def test_rate_limit_cools_the_model_down(self):
+        with mock.patch.object(self.service, '_call_model',
+                               side_effect=[Exception('429 Resource exhausted'), 'fallback reply']):
+            self.assertEqual(self.service._generate('prompt', 'rag'), 'fallback reply')
+        self.assertEqual(self.router.unhealthy_reason('primary'), 'rate_limited')
+
+    def test_only_the_last_model_retries_rate_limits(self):
+        with mock.patch.object(self.service, '_call_model', return_value='reply') as call_model:
+            self.service._generate('prompt', 'rag')
+        self.assertFalse(call_model.call_args.args[6])
+
+        with mock.patch.object(self.service, '_call_model', return_value='reply') as call_model:
+            self.service._generate('prompt', 'greeting')
+        self.assertTrue(call_model.call_args.args[6])
+
+    def test_last_error_is_raised(self):
+        with mock.patch.object(self.service, '_call_model',
+                               side_effect=[Exception('500 internal'), Exception('503 unavailable')]):
+            with self.assertRaisesMessage(Exception, '503 unavailable'):
+                self.service._generate('prompt', 'rag')
+
+
+class HedgedCallTests(SimpleTestCase):
+    """hedged() returns the first answer and never queues a hedge behind stuck ones"""
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def slow_then_fast(self):
+        """The first call hangs until released, later ones answer at once"""
+        with self.lock:
+            self.calls.append(threading.current_thread().name)
+            first = len(self.calls) == 1
+        if first:
+            self.release.wait(5)
+            return 'primary'
+        return 'hedge'
+
+    def test_no_hedge_delay_runs_inline(self):
+        self.assertEqual(hedged(lambda: threading.current_thread(), None, Deadline(5)),
+                         threading.current_thread())
+
+    def test_fast_primary_is_not_hedged(self):
+        self.release.set()
+        self.assertEqual(hedged(self.slow_then_fast, 1, Deadline(5)), 'primary')
+        self.assertEqual(len(self.calls), 1)
+
+    def test_hedge_wins_over_slow_primary(self):
+        self.assertEqual(hedged(self.slow_then_fast, 0.05, Deadline(5)), 'hedge')
+        self.assertTrue(self.calls[0].startswith('gemini-call'))
+        self.assertTrue(self.calls[1].startswith('gemini-hedge'))
+
+    def test_no_hedge_when_all_hedge_slots_are_taken(self):
+        threading.Timer(0.2, self.release.set).start()
+        with mock.patch.object(deadline, '_hedge_slots', threading.BoundedSemaphore(1)) as slots:
+            slots.acquire()
+            self.assertEqual(hedged(self.slow_then_fast, 0.05, Deadline(5)), 'primary')
+        self.assertEqual(len(self.calls), 1)
+
+    def test_queued_loser_is_cancelled(self):
+        busy = threading.Event()
+        self.addCleanup(busy.set)
+        pool = deadline.ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(pool.shutdown)
+        pool.submit(busy.wait, 5)
+        threading.Timer(0.2, self.release.set).start()
+        with mock.patch.object(deadline, '_hedge_pool', pool):
+            self.assertEqual(hedged(self.slow_then_fast, 0.05, Deadline(5)), 'primary')
+        busy.set()
+        pool.shutdown(wait=True)
+        self.assertEqual(len(self.calls), 1)  # the queued hedge never ran
+
+    def test_deadline_beats_both(self):
+        with self.assertRaises(deadline.DeadlineExceeded):
+            hedged(lambda: self.release.wait(5), 0.05, Deadline(0.3))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogEtagTests(TestCase):
+    """List ETags: 304 on a match, and they move on writes made here or by the crop-calendar app"""
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name='Eclon Max', product_type='Fungicide')
+        self.url = reverse('whatsapp_chat:products_readonly')
+
+    def get(self, etag=None):
+        return self.client.get(self.url, **({'HTTP_IF_NONE_MATCH': etag} if etag else {}))
+
+    def expire_versions(self):
+        cache.delete(catalog_versions._key(Product._meta.db_table))
+
+    def test_matching_etag_is_not_modified(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            revalidated = self.get(response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['ETag'], response['ETag'])
+
+    def test_stale_etag_gets_the_page(self):
+        self.assertEqual(self.get('"stale"').status_code, 200)
+
+    def test_write_here_shows_at_once(self):
+        etag = self.get()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Ridomil')
+        self.assertEqual(self.get(etag).status_code, 200)
+
+    def test_external_update_shows_after_ttl(self):
+        etag = self.get()['ETag']
+        # QuerySet.update sends no signals, like a write by the other app
+        Product.objects.filter(pk=self.product.pk).update(
+            name='Eclon Max 2', updated_at=timezone.now() + timedelta(seconds=1))
+        self.assertEqual(self.get(etag).status_code, 304)  # within VERSION_TTL_SECONDS
+        self.expire_versions()
+        self.assertEqual(self.get(etag).status_code, 200)
+
+    def test_external_delete_shows_after_ttl(self):
+        Product.objects.create(name='Ridomil')
+        etag = self.get()['ETag']
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {Product._meta.db_table} WHERE id = %s', [self.product.pk])
+        self.expire_versions()
+        self.assertEqual(self.get(etag).status_code, 200)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class EscalationTests(TestCase):
+    """Strikes decay out of the window; a block is a TTL key mirrored on the user"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = WhatsAppUser.objects.create(phone_number='919800000002', name='Suresh')
+        self.conversation = Conversation.objects.create(whatsapp_user=self.user)
+        patcher = mock.patch.object(escalation, '_redis', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_second_strike_blocks(self):
+        self.assertFalse(escalation.should_block(escalation.record_strike(self.conversation)))
+        self.assertTrue(escalation.should_block(escalation.record_strike(self.conversation)))
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.escalation_strikes, 2)
+
+    def test_old_strikes_decay(self):
+        long_ago = time.time() - escalation.ESCALATION_STRIKE_WINDOW_SECONDS - 60
+        with mock.patch.object(escalation.time, 'time', return_value=long_ago):
+            escalation.record_strike(self.conversation)
+        self.assertEqual(escalation.record_strike(self.conversation), 1)
+
+    def test_strikes_reseeded_from_the_database(self):
+        escalation.record_strike(self.conversation)
+        cache.clear()
+        conversation = Conversation.objects.get(pk=self.conversation.pk)
+        self.assertEqual(len(escalation.strikes(conversation)), 1)
+
+    def test_block_and_its_mirror(self):
+        escalation.record_strike(self.conversation)
+        escalation.block(self.user, self.conversation)
+        self.assertTrue(escalation.is_blocked(self.user))
+        self.assertEqual(escalation.strikes(self.conversation), [])
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_blocked)
+        self.assertGreater(self.user.blocked_until, timezone.now())
+
+    def test_lost_block_is_restored_from_the_mirror(self):
+        escalation.block(self.user, self.conversation)
+        cache.clear()
+        user = WhatsAppUser.objects.get(pk=self.user.pk)
+        self.assertTrue(escalation.is_blocked(user))
+        self.assertTrue(cache.get(escalation._block_key(user.id)))
+
+    def test_expired_block_is_lifted(self):
+        escalation.block(self.user, self.conversation, seconds=60)
+        cache.clear()
+        WhatsAppUser.objects.filter(pk=self.user.pk).update(blocked_until=timezone.now() - timedelta(seconds=1))
+        user = WhatsAppUser.objects.get(pk=self.user.pk)
+        self.assertFalse(escalation.is_blocked(user))
+        user.refresh_from_db()
+        self.assertFalse(user.is_blocked)
+        self.assertIsNone(user.blocked_until)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class HistoryRingBufferTests(TestCase):
+    """The buffered history matches what the DB query would give, and stays capped"""
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(history_cache, '_redis', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def from_db(self, conversation, before, limit):
+        messages = reversed(recent_history_queryset(conversation, before)[:limit])
+        return [{'role': 'user' if m.direction == 'inbound' else 'model', 'parts': [m.text_content]}
+                for m in messages]
+
+    def add(self, conversation, text, at):
+        message = Message.objects.create(conversation=conversation, direction='inbound', text_content=text,
+                                         timestamp=at)
+        history_cache.append(message)
+        return message
+
+    def test_cold_miss_backfills_once(self):
+        conversation, messages = create_chat([f'turn {i}' for i in range(6)])
+        before = messages[-1].timestamp + timedelta(minutes=1)
+        history = history_cache.recent_history(conversation, before, 4)
+        self.assertEqual(history, self.from_db(conversation, before, 4))
+        with self.assertNumQueries(0):
+            self.assertEqual(history_cache.recent_history(conversation, before, 4), history)
+
+    def test_append_only_to_a_warm_buffer(self):
+        conversation, messages = create_chat(['hello', 'hi'])
+        self.add(conversation, 'cold', messages[-1].timestamp + timedelta(minutes=1))
+        self.assertIsNone(history_cache._read(conversation.id))
+
+        history_cache.backfill(conversation)
+        self.add(conversation, 'warm', messages[-1].timestamp + timedelta(minutes=2))
+        self.assertEqual(history_cache._read(conversation.id)[-1][3], 'warm')
+
+    def test_buffer_is_capped(self):
+        conversation, messages = create_chat(['hello'])
+        history_cache.backfill(conversation)
+        for i in range(history_cache.HISTORY_CACHE_TURNS + 5):
+            self.add(conversation, f'more {i}', messages[0].timestamp + timedelta(minutes=i + 1))
+        turns = history_cache._read(conversation.id)
+        self.assertEqual(len(turns), history_cache.HISTORY_CACHE_TURNS)
+        self.assertEqual(turns[-1][3], f'more {history_cache.HISTORY_CACHE_TURNS + 4}')
+
+    def test_summarized_turns_are_left_out(self):
+        conversation, messages = create_chat([f'turn {i}' for i in range(6)])
+        conversation.summary_until = messages[2].timestamp
+        before = messages[-1].timestamp
+        history = history_cache.recent_history(conversation, before, 10)
+        self.assertEqual([turn['parts'][0] for turn in history], ['turn 3', 'turn 4'])
+
+    def test_window_longer_than_the_buffer_reads_the_db(self):
+        turns = history_cache.HISTORY_CACHE_TURNS + 6
+        conversation, messages = create_chat([f'turn {i}' for i in range(turns)])
+        before = messages[-1].timestamp + timedelta(minutes=1)
+        history_cache.backfill(conversation)
+        history = history_cache.recent_history(conversation, before, turns)
+        self.assertEqual(len(history), turns)
+        self.assertEqual(history, self.from_db(conversation, before, turns))
+
+    def test_failed_append_drops_the_buffer(self):
+        conversation, messages = create_chat(['hello', 'hi'])
+        history_cache.backfill(conversation)
+        with mock.patch.object(history_cache, '_append', side_effect=ValueError('bad')):
+            history_cache.append(messages[-1])
+        self.assertIsNone(history_cache._read(conversation.id))
+
+
+class LocalLRUTests(SimpleTestCase):
+    def test_least_recently_used_is_evicted(self):
+        lru = identity.LocalLRU(maxsize=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')), (1, None, 3))
+        self.assertEqual(len(lru), 2)
+
+    def test_entries_expire(self):
+        lru = identity.LocalLRU(maxsize=2, ttl=30)
+        with mock.patch.object(identity.time, 'monotonic', return_value=1000):
+            lru.set('a', 1)
+        with mock.patch.object(identity.time, 'monotonic', return_value=1030):
+            self.assertEqual(lru.get('a'), 1)
+        with mock.patch.object(identity.time, 'monotonic', return_value=1031):
+            self.assertIsNone(lru.get('a'))
+        self.assertEqual(len(lru), 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class IdentityCacheTests(TestCase):
+    """resolve / for_user_id hit the DB once, and writes reach both tiers"""
+
+    def setUp(self):
+        cache.clear()
+        identity._local.clear()
+        self.addCleanup(identity._local.clear)
+
+    def test_resolve_creates_then_caches(self):
+        user, conversation = identity.resolve('919800000003', 'Ganesh')
+        self.assertEqual(WhatsAppUser.objects.get(pk=user.pk).name, 'Ganesh')
+        with self.assertNumQueries(0):
+            cached_user, cached_conversation = identity.resolve('919800000003', 'Someone else')
+        self.assertEqual((cached_user.pk, cached_user.name), (user.pk, 'Ganesh'))
+        self.assertEqual(cached_conversation.pk, conversation.pk)
+        self.assertEqual(cached_conversation.whatsapp_user_id, user.pk)
+
+    def test_shared_tier_refills_the_local_one(self):
+        user, _ = identity.resolve('919800000003', 'Ganesh')
+        identity._local.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(identity.for_user_id(user.pk)[0].phone_number, '919800000003')
+
+    def test_for_user_id(self):
+        conversation, _ = create_chat(['hello'], phone='919800000004')
+        user, found = identity.for_user_id(conversation.whatsapp_user_id)
+        self.assertEqual((user.phone_number, found.pk), ('919800000004', conversation.pk))
+        self.assertIsNone(identity.for_user_id(conversation.whatsapp_user_id + 1))
+
+    def test_user_save_invalidates(self):
+        user, _ = identity.resolve('919800000003', 'Ganesh')
+        with self.captureOnCommitCallbacks(execute=True):
+            row = WhatsAppUser.objects.get(pk=user.pk)
+            row.name = 'Ganesh Patil'
+            row.save()
+        self.assertEqual(identity.resolve('919800000003', 'Ganesh')[0].name, 'Ganesh Patil')
+
+    def test_conversation_delete_invalidates(self):
+        user, conversation = identity.resolve('919800000003', 'Ganesh')
+        with self.captureOnCommitCallbacks(execute=True):
+            Conversation.objects.filter(pk=conversation.pk).delete()
+        _, recreated = identity.resolve('919800000003', 'Ganesh')
+        self.assertNotEqual(recreated.pk, conversation.pk)
+        self.assertTrue(Conversation.objects.filter(pk=recreated.pk, whatsapp_user_id=user.pk).exists())
+        self.assertEqual(identity.for_user_id(user.pk)[1].pk, recreated.pk)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ArchiveTests(TestCase):
+    """Archiving is safe to re-run, and rehydrated messages interleave with live ones"""
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = self.settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.start = timezone.now() - timedelta(days=400)
+        self.conversation, self.old = create_chat([f'old {i}' for i in range(4)], start=self.start)
+        self.cutoff = self.start + timedelta(days=1)
+
+    def add_live(self, text, at):
+        return Message.objects.create(conversation=self.conversation, direction='inbound', text_content=text,
+                                      timestamp=at)
+
+    def test_rows_move_to_one_file(self):
+        stats = archive.archive_messages(self.cutoff)
+        self.assertEqual((stats['files'], stats['rows']), (1, 4))
+        self.assertFalse(self.conversation.messages.exists())
+        tombstone = MessageArchive.objects.get()
+        self.assertEqual((tombstone.row_count, tombstone.first_at), (4, self.old[0].timestamp))
+        self.assertEqual(archive.archived_count(self.conversation), 4)
+
+    def test_rerun_is_a_no_op(self):
+        archive.archive_messages(self.cutoff)
+        stats = archive.archive_messages(self.cutoff)
+        self.assertEqual((stats['files'], stats['rows'], stats['finished']), (0, 0, 0))
+        self.assertEqual(MessageArchive.objects.count(), 1)
+
+    def test_interrupted_run_is_finished_not_archived_again(self):
+        with mock.patch.object(archive, '_delete_in_chunks', side_effect=DatabaseError('connection lost')):
+            with self.assertRaises(DatabaseError):
+                archive.archive_messages(self.cutoff)
+        self.assertEqual(archive.archived_count(self.conversation), 0)  # every archived row is still live
+        self.assertEqual(len(archive.with_archived(self.conversation, self.conversation.messages.all())), 4)
+
+        stats = archive.archive_messages(self.cutoff)
+        self.assertEqual((stats['files'], stats['finished']), (0, 4))
+        self.assertEqual(MessageArchive.objects.count(), 1)
+        self.assertFalse(self.conversation.messages.exists())
+
+    def test_with_archived_is_oldest_first(self):
+        archive.archive_messages(self.cutoff)
+        late = self.add_live('late', self.start + timedelta(days=2))
+        early = self.add_live('early', self.start - timedelta(minutes=1))
+        messages = archive.with_archived(self.conversation, self.conversation.messages.all())
+        self.assertEqual([m.text_content for m in messages], ['early', 'old 0', 'old 1', 'old 2', 'old 3', 'late'])
+        self.assertEqual([getattr(m, 'archived', False) for m in messages], [False] + [True] * 4 + [False])
+        self.assertEqual((messages[0].id, messages[-1].id), (early.id, late.id))
+
+    def test_range_filters_archived_rows(self):
+        archive.archive_messages(self.cutoff)
+        since = self.old[1].timestamp
+        until = self.old[2].timestamp
+        messages = archive.with_archived(self.conversation, [], since=since, until=until)
+        self.assertEqual([m.text_content for m in messages], ['old 1', 'old 2'])
+
+    def test_export_rows_has_every_message_once(self):
+        archive.archive_messages(self.cutoff)
+        self.add_live('new', self.start + timedelta(days=2))
+        rows = list(archive.export_rows(self.conversation))
+        self.assertEqual([(row['text_content'], row['archived']) for row in rows],
+                         [(f'old {i}', True) for i in range(4)] + [('new', False)])
+
+
+class EscalationCacheDownTests(TestCase):
+    """With the cache unreachable, strikes and blocks run on the DB mirror"""
+
+    def setUp(self):
+        from redis.exceptions import ConnectionError as RedisConnectionError
+        self.user = WhatsAppUser.objects.create(phone_number='919800000002', name='Suresh')
+        self.conversation = Conversation.objects.create(whatsapp_user=self.user)
+        patcher = mock.patch.object(escalation, '_redis', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(escalation, 'cache')
+        broken = patcher.start()
+        self.addCleanup(patcher.stop)
+        broken.get.side_effect = broken.set.side_effect = broken.delete.side_effect = \
+            RedisConnectionError('Connection refused')
+
+    def test_strikes_are_counted_in_the_database(self):
+        self.assertEqual(escalation.record_strike(self.conversation), 1)
+        self.assertEqual(escalation.record_strike(self.conversation), 2)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.escalation_strikes, 2)
+
+    def test_old_database_strike_starts_over(self):
+        Conversation.objects.filter(pk=self.conversation.pk).update(
+            escalation_strikes=1,
+            last_strike_at=timezone.now() - timedelta(seconds=escalation.ESCALATION_STRIKE_WINDOW_SECONDS + 60))
+        self.assertEqual(escalation.record_strike(self.conversation), 1)
+
+    def test_block_uses_the_mirror(self):
+        self.assertFalse(escalation.is_blocked(self.user))
+        escalation.block(self.user, self.conversation)
+        self.assertTrue(escalation.is_blocked(WhatsAppUser.objects.get(pk=self.user.pk)))
+
+    def test_expired_mirror_is_not_blocked(self):
+        WhatsAppUser.objects.filter(pk=self.user.pk).update(
+            is_blocked=True, blocked_until=timezone.now() - timedelta(seconds=1))
+        self.assertFalse(escalation.is_blocked(WhatsAppUser.objects.get(pk=self.user.pk)))
+
+
+class EscalationRedisTests(TestCase):
+    """Strikes in a real Redis sorted set (skipped without one)"""
+
+    def setUp(self):
+        try:
+            from django_redis import get_redis_connection
+            client = get_redis_connection('default')
+            client.ping()
+        except Exception as e:
+            self.skipTest(f'needs Redis: {e}')
+        patcher = mock.patch.object(escalation, '_redis', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = WhatsAppUser.objects.create(phone_number='919800000002', name='Suresh')
+        self.conversation = Conversation.objects.create(whatsapp_user=self.user)
+        self.addCleanup(escalation.clear_strikes, self.conversation)
+
+    def test_concurrent_strikes_are_all_counted(self):
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            counts = sorted(pool.map(lambda _: escalation._add_strike(self.conversation, time.time()), range(4)))
+        self.assertEqual(counts, [1, 2, 3, 4])
+        self.assertEqual(len(escalation.strikes(self.conversation)), 4)
+
+    def test_lost_set_is_reseeded_from_the_database(self):
+        escalation.record_strike(self.conversation)
+        escalation._redis().delete(cache.make_key(escalation._strikes_key(self.conversation.id)))
+        conversation = Conversation.objects.get(pk=self.conversation.pk)
+        self.assertEqual(escalation.record_strike(conversation), 2)
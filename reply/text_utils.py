@@ -0,0 +1,37 @@
+"""
+Small text helpers shared by the keyword / alias matchers.
+"""
+import re
+
+# Marathi/Hindi numerals -> ASCII (users write both "35" and "३५")
+DEVANAGARI_DIGITS = str.maketrans('०१२३४५६७८९', '0123456789')
+
+# Python's \b is useless for Devanagari: vowel signs (ा, ी, ु ...) are not \w,
+# so "फवारणी" has a "word boundary" *before* its last matra. Treat the whole
+# Devanagari block plus ASCII alphanumerics as word characters instead.
+WORD_CHARS = r'0-9a-z\u0900-\u097F'
+LEFT_BOUNDARY = rf'(?<![{WORD_CHARS}])'
+RIGHT_BOUNDARY = rf'(?![{WORD_CHARS}])'
+
+
+def normalize(text):
+    """Lowercase, convert Devanagari digits and collapse whitespace"""
+    if not text:
+        return ''
+    return ' '.join(str(text).translate(DEVANAGARI_DIGITS).lower().split())
+
+
+def term_pattern(term):
+    """Regex source for one term - spaces match any (or no) whitespace"""
+    return r'\s*'.join(re.escape(part) for part in normalize(term).split(' '))
+
+
+def compile_terms(terms):
+    """
+    Compile terms into ONE alternation with Devanagari-aware boundaries.
+    Longest terms first so 'good morning' wins over 'good'.
+    Match against normalize()d text.
+    """
+    ordered = sorted({normalize(t) for t in terms if t}, key=len, reverse=True)
+    alternation = '|'.join(term_pattern(t) for t in ordered)
+    return re.compile(f'{LEFT_BOUNDARY}(?:{alternation}){RIGHT_BOUNDARY}')
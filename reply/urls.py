@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import catalog_views, views
 
 
 app_name = 'whatsapp_chat'
@@ -7,7 +7,13 @@ urlpatterns = [
     path('webhook', views.whatsapp_webhook, name='webhook'),
     path('chat', views.chat_list_view, name='chat_list'),
     path('chat/<int:user_id>/', views.chat_detail_view, name='chat_detail'),
+    path('chat/<int:user_id>/export/', views.chat_export_view, name='chat_export'),
     path('api/send-message/', views.send_message_api, name='send_message'),
     path('api/upload-media/', views.upload_media_api, name='upload_media'),
     path('api/add-contact/', views.add_contact_api, name='add_contact'), 
+    path('api/product-relationships/<int:product_id>/', catalog_views.product_relationships_api,
+         name='product_relationships'),
+    path('api/products-readonly/', catalog_views.ProductReadOnlyList.as_view(), name='products_readonly'),
+    path('api/products/autocomplete/', catalog_views.product_autocomplete_api, name='product_autocomplete'),
+    path('api/crops/', catalog_views.CropList.as_view(), name='crops'),
 ]
\ No newline at end of file
@@ -0,0 +1,101 @@
+"""
+Grape variety table + alias matcher.
+
+Shared by the knowledge-base builder (base.py) and the bot, so keep it free of
+Django imports.
+"""
+import os
+
+from .text_utils import compile_terms, normalize
+
+GRAPE_VARIETIES = [
+    {
+        "name": "ARD 35 / Arra 35",
+        "aliases": ["ard35", "ard 35", "arra35", "arra 35", "अरा ३५", "आरा ३५", "एआरडी ३५"],
+        "description": "ARD 35 (Arra 35) is a premium black seeded grape variety popular in Maharashtra. Known for excellent yield and market demand.",
+        "file": "35.docx"
+    },
+    {
+        "name": "ARD 36 / Arra 36",
+        "aliases": ["ard36", "ard 36", "arra36", "arra 36", "अरा ३६", "आरा ३६", "एआरडी ३६"],
+        "description": "ARD 36 (Arra 36) is another premium grape variety with high export potential.",
+        "file": "36.docx"
+    },
+    {
+        "name": "Arra 15",
+        "aliases": ["arra15", "arra 15", "अरा १५", "आरा १५", "15"],
+        "description": "Arra 15 is a popular grape variety in Maharashtra known for good sweetness.",
+        "file": "15.docx"
+    },
+    {
+        "name": "Crimson Seedless",
+        "aliases": ["crimson", "crimpson", "क्रिमसन"],
+        "description": "Crimson Seedless is a globally popular red seedless grape variety with high market value.",
+        "file": "cri.docx"
+    },
+    {
+        "name": "Thompson Seedless",
+        "aliases": ["thompson", "thomson", "थॉम्पसन"],
+        "description": "Thompson Seedless is one of the most widely cultivated seedless grape varieties worldwide.",
+        "file": "th.docx"
+    },
+]
+
+
+def variety_key(variety):
+    """Key used as chunk 'source' by base.py ('35.docx' -> '35')"""
+    return os.path.splitext(variety['file'])[0]
+
+
+VARIETY_KEYS = [variety_key(v) for v in GRAPE_VARIETIES]
+VARIETY_BY_KEY = {variety_key(v): v for v in GRAPE_VARIETIES}
+
+# alias -> key, keyed without spaces so "ard35" and "ard 35" both resolve.
+# Bare numbers ("15") are skipped: in a chat "15" is far more likely to be a
+# day or a worker count than the variety.
+_ALIAS_TO_KEY = {}
+for _variety in GRAPE_VARIETIES:
+    for _alias in _variety['aliases'] + [_variety['name'].split(' / ')[0]]:
+        _alias = normalize(_alias)
+        if not _alias.isdigit():
+            _ALIAS_TO_KEY[_alias.replace(' ', '')] = variety_key(_variety)
+
+# Precompiled once at import - one pass over the query finds every alias
+_ALIAS_RE = compile_terms(
+    normalize(alias)
+    for variety in GRAPE_VARIETIES
+    for alias in variety['aliases'] + [variety['name'].split(' / ')[0]]
+    if not normalize(alias).isdigit()
+)
+
+
+def detect_varieties(text):
+    """All variety keys mentioned in text (single regex pass)"""
+    return {
+        _ALIAS_TO_KEY[''.join(m.group(0).split())]
+        for m in _ALIAS_RE.finditer(normalize(text))
+    }
+
+
+def remove_varieties(text):
+    """normalize()d text with variety names blanked out ("arra 15" is not a day)"""
+    return _ALIAS_RE.sub(' ', normalize(text))
+
+
+def detect_variety(text):
+    """The variety key if exactly one variety is mentioned, else None"""
+    found = detect_varieties(text)
+    return found.pop() if len(found) == 1 else None
+
+
+def source_variety(source):
+    """
+    Variety a knowledge-base chunk belongs to, or None for shared chunks.
+    DOCX chunks use the file stem ('35'), XLSX chunks the sheet name
+    ('all - एआरडी ३५ ').
+    """
+    if source in VARIETY_BY_KEY:
+        return source
+    if ' - ' in source:
+        return detect_variety(source.split(' - ', 1)[1])
+    return None
@@ -1,20 +1,28 @@
 import json
 import logging
-from django.http import JsonResponse, HttpResponse
+from django.http import Http404, JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
+from django.db.models import F
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.files.base import ContentFile
 import requests
 import os
 import tempfile
+import threading
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 
 from .models import WhatsAppUser, Conversation, Message, MediaFile, WebhookLog, WhatsAppTemplate
 from .service import WhatsAppService
+from .intents import classify
+from .slots import booking_complete, clear_slots, get_slots, update_slots
+from . import archive, bursts, escalation, history_cache, identity
+from .deadline import Deadline, DeadlineExceeded
+from .memory import MAX_UNSUMMARIZED_TURNS, schedule_summary, summary_due
 
 logger = logging.getLogger(__name__)
 
@@ -74,6 +82,8 @@ def whatsapp_webhook(request):
     No verification needed - centralized webhook routes data here.
     """
     if request.method == 'POST':
+        # Picks up reply jobs left by a restarted worker, even before a text arrives here
+        bursts.ensure_scheduler()
         try:
             data = json.loads(request.body.decode('utf-8'))
             logger.info(f"====== INCOMING WEBHOOK ======\n{json.dumps(data, indent=2)}")
@@ -115,32 +125,30 @@ SPAM_KEYWORDS = ['xxx', 'bank', 'password', 'joke', 'random', 'movie', 'cricket'
 
 ESCALATE_KEYWORDS = ['help', 'urgent', 'complaint', 'problem', 'error']
 # Add this at the TOP of webhooks.py (after imports)
-from django.core.cache import cache
 from .gemini_service import GeminiService
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Cache key for singleton
-GEMINI_SERVICE_CACHE_KEY = 'gemini_service_singleton'
+# One GeminiService per worker process. It owns the in-memory knowledge base
+# and a background thread that hot-swaps it, so it must NOT round-trip
+# through Redis (pickling it on every message also copied all the vectors).
+_gemini_service = None
+_gemini_service_lock = threading.Lock()
 
 def get_gemini_service():
     """
-    Returns cached GeminiService instance (survives across requests/processes)
+    Returns the process-wide GeminiService instance
     """
-    # Try to get from cache first
-    gemini = cache.get(GEMINI_SERVICE_CACHE_KEY)
-    
-    if gemini is None:
-        # Create new instance
-        gemini = GeminiService()
-        # Cache it forever (or until server restart)
-        cache.set(GEMINI_SERVICE_CACHE_KEY, gemini, timeout=None)
-        logger.info("🚀 Created NEW GeminiService and cached it")
-    else:
-        logger.info("♻️ Reusing CACHED GeminiService instance")
+    global _gemini_service
+    
+    if _gemini_service is None:
+        with _gemini_service_lock:
+            if _gemini_service is None:
+                _gemini_service = GeminiService()
+                logger.info("🚀 Created NEW GeminiService for this worker")
     
-    return gemini
+    return _gemini_service
 
 
 def process_incoming_messages(value, full_webhook_data):
@@ -163,23 +171,13 @@ def process_incoming_messages(value, full_webhook_data):
 
         # --- 1. Get or Create User & Conversation ---
         profile_name = contacts[0].get('profile', {}).get('name', from_number)
-        whatsapp_user, _ = WhatsAppUser.objects.get_or_create(
-            phone_number=from_number,
-            defaults={'name': profile_name}
-        )
-        conversation, _ = Conversation.objects.get_or_create(
-            whatsapp_user=whatsapp_user
-        )
+        whatsapp_user, conversation = identity.resolve(from_number, profile_name)
 
         # --- 2. Check for 24-Hour Escalation Block ---
-        if whatsapp_user.is_blocked and whatsapp_user.blocked_until and whatsapp_user.blocked_until > timezone.now():
+        if escalation.is_blocked(whatsapp_user):
             logger.info(f"User {from_number} is in 24-hour escalation block. Ignoring message.")
             _save_incoming_message(msg_data, conversation, whatsapp_user, whatsapp_message_id, timestamp)
             return
-        elif whatsapp_user.is_blocked:
-            whatsapp_user.is_blocked = False
-            whatsapp_user.blocked_until = None
-            whatsapp_user.save()
 
         # --- 3. Save the Incoming Message to DB ---
         msg_obj = _save_incoming_message(msg_data, conversation, whatsapp_user, whatsapp_message_id, timestamp)
@@ -195,130 +193,185 @@ def process_incoming_messages(value, full_webhook_data):
             logger.info(f"Ignoring non-text message type '{message_type}' for AI reply.")
             return
 
-        # --- 6. Prepare data for Gemini ---
         txt = msg_data.get('text', {}).get('body', '').strip()
         if not txt:
             logger.info("Ignoring empty text message.")
             return
 
-        user_lang = 'hi' if any(u'\u0900' <= char <= u'\u097f' for char in txt) else 'en'
-        user_name = whatsapp_user.name
+        # --- 6. Update slot state from THIS message only ---
+        intent = classify(txt)
+        update_slots(conversation, txt, intent)
 
-        # --- 7. Gather History ---
-        history = []
-        qs = conversation.messages.filter(timestamp__lt=timestamp).order_by('-timestamp')[:10]
-        
-        for m in reversed(qs):
-            if m.message_type not in ('document'):
-                role = 'user' if m.direction == 'inbound' else 'model'
-                content = m.text_content or m.caption or f'[{m.message_type}]'
-                history.append({"role": role, "parts": [content]})
-        
-        # --- 8. Get CACHED GeminiService instance ---
-        gemini = get_gemini_service()
-        
-        # --- 9. Handle quota errors gracefully ---
+        # --- 7. Debounce: rapid-fire messages get ONE combined reply ---
         try:
-            reply = gemini.generate_reply(history, txt, user_lang, user_name)
-            log_inquiry_details(
-            txt, 
-            reply, 
-            whatsapp_user, 
-            conversation, 
-            user_lang
-        )
+            seq, start = bursts.register_message(conversation.id, msg_obj.id)
         except Exception as e:
-            error_msg = str(e)
-            
-            # Check if it's a quota error
-            if '429' in error_msg or 'quota' in error_msg.lower():
-                logger.error(f"🚫 QUOTA EXCEEDED: {error_msg}")
-                
-                # Send friendly message to user
-                quota_msg = (
-                    "क्षमा करें, अभी सिस्टम व्यस्त है। कृपया थोड़ी देर बाद try करें। 🙏"
-                    if user_lang == 'hi' else
-                    "Sorry, system is busy right now. Please try again in a few minutes. 🙏"
-                )
-                WhatsAppService().send_text_message(from_number, quota_msg, conversation)
-                return
-            else:
-                # Other errors, escalate
-                logger.error(f"❌ Gemini error: {error_msg}")
-                reply = "[ESCALATE]"
-
-        # --- 10. Process Gemini's Decision ---
-        if reply == "[IGNORE]":
-            logger.info(f"Gemini classified as [IGNORE]. No reply sent to {from_number}.")
+            logger.error(f"❌ Burst state unavailable, replying to {msg_obj.id} alone: {e}")
+            bursts.reply_now(conversation.id, _generate_and_send, conversation.id, None, msg_obj.id)
             return
+        delay = bursts.delay_for(intent, start)
+        logger.info(f"⏳ Reply for conversation {conversation.id}#{seq} in {delay:.1f}s")
+        bursts.schedule(conversation.id, seq, delay, _generate_and_send,
+                        conversation.id, seq, start['message_id'], start['at'])
 
-        if reply == "[ESCALATE]":
-            logger.warning(f"⚠️ ESCALATE triggered for: '{txt}' from {from_number}")
-            
-            recent_redirects = conversation.messages.filter(
-                direction='outbound',
-                text_content__contains='सिर्फ खेती और मजूर'
-            ).count()
-            
-            recent_escalations = conversation.messages.filter(
-                direction='outbound',
-                text_content__contains='Our team will reach you soon'
-            ).count()
-            
-            # First strike: Polite redirect
-            if recent_redirects == 0 and recent_escalations == 0:
-                redirect_msg = (
-                    "मैं सिर्फ खेती और मजूर की मदद कर सकता हूँ 🌾 क्या कोई खेती से related सवाल है?"
-                    if user_lang == 'hi' else
-                    "I can only help with farming and labor 🌾 Any farming-related questions?"
-                )
-                WhatsAppService().send_text_message(from_number, redirect_msg, conversation)
-                logger.info(f"↩️ First escalation - sent redirect message")
-            
-            # Second strike: Block
-            elif recent_redirects >= 1 or recent_escalations >= 1:
-                escalation_msg = (
-                    "हमारी टीम जल्द ही आपसे संपर्क करेगी।" 
-                    if user_lang == 'hi' else 
-                    "Our team will reach you soon."
-                )
-                WhatsAppService().send_text_message(from_number, escalation_msg, conversation)
-                
-                whatsapp_user.is_blocked = True
-                whatsapp_user.blocked_until = timezone.now() + timezone.timedelta(hours=24)
-                whatsapp_user.save()
-                logger.warning(f"🚫 User {from_number} blocked for 24 hours")
+    except Exception as e:
+        logger.error(f"CRITICAL Error: {str(e)}", exc_info=True)
+
+
+def _generate_and_send(conversation_id, seq, first_message_id, burst_started_at=None):
+    """
+    Answer every inbound text of the burst starting at first_message_id with
+    one generation (a burst job; seq None = no debouncing, see bursts.reply_now).
+    The burst is closed even when no answer goes out (busy message, errors).
+    """
+    try:
+        _answer_burst(conversation_id, seq, first_message_id, burst_started_at)
+    finally:
+        # A superseded job leaves the burst to the newer one, which answers it all
+        if bursts.is_latest(conversation_id, seq):
+            bursts.finish_burst(conversation_id, first_message_id)
+
+
+def _answer_burst(conversation_id, seq, first_message_id, burst_started_at):
+    # REPLY_BUDGET_SECONDS from the burst's first message for everything below
+    deadline = Deadline(since=burst_started_at)
+    conversation = Conversation.objects.select_related('whatsapp_user').get(id=conversation_id)
+    whatsapp_user = conversation.whatsapp_user
+    from_number = whatsapp_user.phone_number
+
+    # --- 1. Collect the burst: its latest MAX_BATCH_MESSAGES texts, oldest first ---
+    batch = list(
+        conversation.messages.filter(direction='inbound', message_type='text', id__gte=first_message_id)
+        .order_by('-id')[:bursts.MAX_BATCH_MESSAGES]
+    )[::-1]
+    texts = [m.text_content.strip() for m in batch if m.text_content and m.text_content.strip()]
+    if not texts:
+        return
+    txt = "\n".join(texts)
+    if len(texts) > 1:
+        logger.info(f"🧺 Coalesced {len(texts)} messages for conversation {conversation_id}")
+
+    user_lang = 'hi' if any(u'\u0900' <= char <= u'\u097f' for char in txt) else 'en'
+    user_name = whatsapp_user.name
+
+    # --- 2. Gather History (only turns the rolling summary doesn't cover) ---
+    # From the Redis ring buffer; the DB only on a cold miss
+    history = history_cache.recent_history(conversation, batch[0].timestamp, MAX_UNSUMMARIZED_TURNS)
+    
+    # --- 3. Get CACHED GeminiService instance ---
+    gemini = get_gemini_service()
+    
+    # --- 4. Handle quota errors gracefully ---
+    intent = classify(txt)  # one pass, shared by the reply and the inquiry log
+    slots = get_slots(conversation)
+    # A newer message arrived while the burst was collected: its job answers instead
+    if not bursts.is_latest(conversation_id, seq):
+        logger.info(f"⏩ Burst {conversation_id}#{seq} superseded before generation")
+        return
+    try:
+        reply = gemini.generate_reply(
+            history, txt, user_lang, user_name,
+            user_id=whatsapp_user.id, summary=conversation.summary, intent=intent, slots=slots,
+            deadline=deadline
+        )
+    except Exception as e:
+        error_msg = str(e)
+        
+        # Quota errors are queued/retried by reply.quota - only a missed deadline ends up here
+        if isinstance(e, DeadlineExceeded) or '429' in error_msg:
+            logger.error(f"🚫 QUOTA EXCEEDED: {error_msg}")
             
+            # Send friendly message to user
+            quota_msg = (
+                "क्षमा करें, अभी सिस्टम व्यस्त है। कृपया थोड़ी देर बाद try करें। 🙏"
+                if user_lang == 'hi' else
+                "Sorry, system is busy right now. Please try again in a few minutes. 🙏"
+            )
+            WhatsAppService().send_text_message(from_number, quota_msg, conversation, deadline=deadline)
             return
+        else:
+            # Other errors, escalate
+            logger.error(f"❌ Gemini error: {error_msg}")
+            reply = "[ESCALATE]"
 
-        # --- 11. Send the Gemini Reply ---
-        if reply:
-            WhatsAppService().send_text_message(from_number, reply, conversation)
+    # --- 5. Drop the answer if a newer message arrived meanwhile ---
+    if not bursts.is_latest(conversation_id, seq):
+        logger.info(f"🗑️ Dropping stale reply for conversation {conversation_id}#{seq}")
+        return
+    # Closed before sending, so a message arriving meanwhile starts a new burst
+    bursts.finish_burst(conversation_id, first_message_id)
+
+    log_inquiry_details(
+        txt, 
+        reply, 
+        whatsapp_user, 
+        conversation, 
+        user_lang,
+        intent=intent,
+        slots=slots
+    )
+
+    # --- 6. Process Gemini's Decision ---
+    if reply == "[IGNORE]":
+        logger.info(f"Gemini classified as [IGNORE]. No reply sent to {from_number}.")
+        return
+
+    if reply == "[ESCALATE]":
+        logger.warning(f"⚠️ ESCALATE triggered for: '{txt}' from {from_number}")
+        strikes = escalation.record_strike(conversation)
+        
+        # First strike: Polite redirect
+        if not escalation.should_block(strikes):
+            redirect_msg = (
+                "मैं सिर्फ खेती और मजूर की मदद कर सकता हूँ 🌾 क्या कोई खेती से related सवाल है?"
+                if user_lang == 'hi' else
+                "I can only help with farming and labor 🌾 Any farming-related questions?"
+            )
+            WhatsAppService().send_text_message(from_number, redirect_msg, conversation, deadline=deadline)
+            logger.info(f"↩️ First escalation - sent redirect message")
+        
+        # Second strike inside the window: Block
         else:
-            logger.error("Gemini returned empty reply.")
-            fallback_msg = (
+            escalation_msg = (
                 "हमारी टीम जल्द ही आपसे संपर्क करेगी।" 
                 if user_lang == 'hi' else 
                 "Our team will reach you soon."
             )
-            WhatsAppService().send_text_message(from_number, fallback_msg, conversation)
+            WhatsAppService().send_text_message(from_number, escalation_msg, conversation, deadline=deadline)
+            escalation.block(whatsapp_user, conversation)
+        
+        return
 
-    except Exception as e:
-        logger.error(f"CRITICAL Error: {str(e)}", exc_info=True)
+    # --- 7. Send the Gemini Reply ---
+    if reply:
+        WhatsAppService().send_text_message(from_number, reply, conversation, deadline=deadline)
+        logger.info(f"⏱️ Replied to conversation {conversation_id} in {deadline.elapsed():.1f}s")
+        
+        # history + this burst + our reply
+        if summary_due(len(history) + len(batch) + 1):
+            schedule_summary(conversation, gemini, user_id=whatsapp_user.id)
+    else:
+        logger.error("Gemini returned empty reply.")
+        fallback_msg = (
+            "हमारी टीम जल्द ही आपसे संपर्क करेगी।" 
+            if user_lang == 'hi' else 
+            "Our team will reach you soon."
+        )
+        WhatsAppService().send_text_message(from_number, fallback_msg, conversation, deadline=deadline)
 
 
-def log_inquiry_details(user_message, bot_reply, whatsapp_user, conversation, language):
+def log_inquiry_details(user_message, bot_reply, whatsapp_user, conversation, language, intent=None, slots=None):
     """
     Smart logger - extracts and stores inquiry details in ANY language
     """
     from .models import ServiceInquiry, UnknownQuery
-    import re
     
     # Skip very short messages
     if len(user_message.strip()) < 3:
         return
     
-    msg_lower = user_message.lower()
+    intent = intent or classify(user_message)
+    slots = slots if slots is not None else get_slots(conversation)
     
     # ✅ FIX: Map language codes to full names
     language_map = {
@@ -332,42 +385,19 @@ def log_inquiry_details(user_message, bot_reply, whatsapp_user, conversation, la
     }
     service_lang = language_map.get(language, 'mixed')
     
-    # Detect service type (multilingual keywords)
-    service_keywords = {
-        'labor': ['labor', 'labour', 'majur', 'मजूर', 'मजदूर', 'kamgar', 'कामगार', 'worker', 'काम'],
-        'spray': ['spray', 'फवारणी', 'spraying', 'छिडकाव'],
-        'fertilizer': ['fertilizer', 'खाद', 'खत'],
-        'disease': ['disease', 'रोग', 'बीमारी', 'problem'],
-        'equipment': ['equipment', 'machine', 'यंत्र', 'मशीन'],
-        'transport': ['transport', 'वाहतूक', 'vehicle'],
-        'storage': ['storage', 'साठवण', 'भंडारण'],
-        'price': ['price', 'rate', 'किंमत', 'दर', 'cost'],
-    }
-    
-    detected_services = []
-    for service, keywords in service_keywords.items():
-        if any(kw in msg_lower for kw in keywords):
-            detected_services.append(service)
+    # Detect service type (multilingual keywords, see reply.intents)
+    detected_services = intent.services
     
     # Only log if we detected something or it's an escalation
     if not detected_services and '[escalate]' not in str(bot_reply).lower():
         return
     
     try:
-        # Extract numbers
-        numbers = re.findall(r'\d+', user_message)
-        quantity = numbers[0] if numbers else None
-        
-        # Detect urgency
-        urgent_keywords = ['urgent', 'तुरंत', 'आज', 'today', 'अभी', 'now', 'जल्दी', 'emergency']
-        is_urgent = any(kw in msg_lower for kw in urgent_keywords)
-        
-        # Detect location
-        locations = ['satara', 'सातारा', 'pune', 'पुणे', 'mumbai', 'मुंबई', 'nashik', 'नाशिक']
-        detected_location = next((loc for loc in locations if loc in msg_lower), None)
-        
-        # Check if price was requested
-        asked_price = any(kw in msg_lower for kw in ['price', 'rate', 'किंमत', 'दर', 'रेट', 'cost'])
+        # Booking details come from the conversation's slot state
+        quantity = slots.get('count') or (intent.numbers[0] if intent.numbers else None)
+        is_urgent = intent.urgent
+        detected_location = slots.get('location')
+        asked_price = intent.price
         
         # Truncate long responses
         ai_response_truncated = str(bot_reply)[:500] if bot_reply else ''
@@ -381,6 +411,8 @@ def log_inquiry_details(user_message, bot_reply, whatsapp_user, conversation, la
             service_language=service_lang,
             quantity_needed=str(quantity) if quantity else None,
             location_mentioned=detected_location,
+            farm_size=slots.get('farm_size'),
+            requested_date=slots.get('date'),
             urgency='high' if is_urgent else 'medium',
             original_query=user_message[:1000],  # Limit size
             ai_response=ai_response_truncated,
@@ -390,6 +422,10 @@ def log_inquiry_details(user_message, bot_reply, whatsapp_user, conversation, la
         )
         
         logger.info(f"✅ Logged inquiry: {', '.join(detected_services) if detected_services else 'general'}")
+
+        # The booking is on record: the next labor request starts from scratch
+        if 'labor' in detected_services and booking_complete(slots):
+            clear_slots(conversation)
         
     except Exception as e:
         logger.error(f"❌ Error logging ServiceInquiry: {str(e)}")
@@ -438,12 +474,7 @@ def handle_text_message(msg_data, conversation, whatsapp_user, whatsapp_message_
     )
     
     # Update conversation/user for preview
-    conversation.last_message_preview = text_content[:100]
-    conversation.unread_count += 1
-    conversation.save()
-    
-    whatsapp_user.last_message_at = timestamp
-    whatsapp_user.save()
+    _record_inbound(conversation, whatsapp_user, text_content[:100], timestamp)
     
     logger.info(f"Text message: '{text_content}' from {whatsapp_user.phone_number}")
     return msg_obj # Return the created object
@@ -468,12 +499,7 @@ def handle_image_message(msg_data, conversation, whatsapp_user, whatsapp_message
     preview = "[IMAGE]"
     if caption:
         preview += f" {caption[:50]}"
-    conversation.last_message_preview = preview
-    conversation.unread_count += 1
-    conversation.save()
-    
-    whatsapp_user.last_message_at = timestamp
-    whatsapp_user.save()
+    _record_inbound(conversation, whatsapp_user, preview, timestamp)
 
 
 def handle_video_message(msg_data, conversation, whatsapp_user, whatsapp_message_id, timestamp):
@@ -495,12 +521,7 @@ def handle_video_message(msg_data, conversation, whatsapp_user, whatsapp_message
     preview = "[VIDEO]"
     if caption:
         preview += f" {caption[:50]}"
-    conversation.last_message_preview = preview
-    conversation.unread_count += 1
-    conversation.save()
-    
-    whatsapp_user.last_message_at = timestamp
-    whatsapp_user.save()
+    _record_inbound(conversation, whatsapp_user, preview, timestamp)
 
 
 def handle_audio_message(msg_data, conversation, whatsapp_user, whatsapp_message_id, timestamp):
@@ -518,12 +539,7 @@ def handle_audio_message(msg_data, conversation, whatsapp_user, whatsapp_message
     
     download_and_save_media(message, media_id)
     
-    conversation.last_message_preview = "[AUDIO]"
-    conversation.unread_count += 1
-    conversation.save()
-    
-    whatsapp_user.last_message_at = timestamp
-    whatsapp_user.save()
+    _record_inbound(conversation, whatsapp_user, "[AUDIO]", timestamp)
 
 
 def handle_document_message(msg_data, conversation, whatsapp_user, whatsapp_message_id, timestamp):
@@ -546,12 +562,7 @@ def handle_document_message(msg_data, conversation, whatsapp_user, whatsapp_mess
     preview = f"[DOCUMENT: {filename}]"
     if caption:
         preview += f" {caption[:30]}"
-    conversation.last_message_preview = preview
-    conversation.unread_count += 1
-    conversation.save()
-    
-    whatsapp_user.last_message_at = timestamp
-    whatsapp_user.save()
+    _record_inbound(conversation, whatsapp_user, preview, timestamp)
 
 
 def handle_location_message(msg_data, conversation, whatsapp_user, whatsapp_message_id, timestamp):
@@ -574,12 +585,7 @@ def handle_location_message(msg_data, conversation, whatsapp_user, whatsapp_mess
         location_text, None, None, None, 'delivered', timestamp
     )
     
-    conversation.last_message_preview = "[LOCATION]"
-    conversation.unread_count += 1
-    conversation.save()
-    
-    whatsapp_user.last_message_at = timestamp
-    whatsapp_user.save()
+    _record_inbound(conversation, whatsapp_user, "[LOCATION]", timestamp)
 
 
 def handle_button_message(msg_data, conversation, whatsapp_user, whatsapp_message_id, timestamp):
@@ -599,12 +605,7 @@ def handle_button_message(msg_data, conversation, whatsapp_user, whatsapp_messag
         text_content, None, None, None, 'delivered', timestamp
     )
     
-    conversation.last_message_preview = f"[Button: {button_text}]"
-    conversation.unread_count += 1
-    conversation.save()
-    
-    whatsapp_user.last_message_at = timestamp
-    whatsapp_user.save()
+    _record_inbound(conversation, whatsapp_user, f"[Button: {button_text}]", timestamp)
 
 
 def handle_interactive_message(msg_data, conversation, whatsapp_user, whatsapp_message_id, timestamp):
@@ -647,12 +648,7 @@ def handle_interactive_message(msg_data, conversation, whatsapp_user, whatsapp_m
         text_content, None, None, None, 'delivered', timestamp
     )
     
-    conversation.last_message_preview = text_content[:100]
-    conversation.unread_count += 1
-    conversation.save()
-    
-    whatsapp_user.last_message_at = timestamp
-    whatsapp_user.save()
+    _record_inbound(conversation, whatsapp_user, text_content[:100], timestamp)
 
 
 def process_status_updates(value):
@@ -687,6 +683,17 @@ def process_status_updates(value):
             logger.error(f"Error processing status update: {str(e)}", exc_info=True)
 
 
+def _record_inbound(conversation, whatsapp_user, preview, timestamp):
+    """Preview, unread counter and last-seen as two UPDATEs (no re-read, no lost increments)"""
+    now = timezone.now()
+    Conversation.objects.filter(id=conversation.id).update(
+        last_message_preview=preview, unread_count=F('unread_count') + 1, updated_at=now
+    )
+    WhatsAppUser.objects.filter(id=whatsapp_user.id).update(last_message_at=timestamp, updated_at=now)
+    conversation.last_message_preview = preview
+    whatsapp_user.last_message_at = timestamp
+
+
 def create_message(conversation, whatsapp_message_id, message_type, direction, 
                    text_content, media_id, mime_type, caption, status, timestamp):
     """Helper function to create a message"""
@@ -764,6 +771,12 @@ def chat_detail_view(request, user_id):
     conversation = get_object_or_404(Conversation, whatsapp_user=whatsapp_user)
     messages = conversation.messages.all()
     templates = WhatsAppTemplate.objects.filter(status='approved')
+
+    # Older messages live in archive files; read them only when asked for
+    archived_count = archive.archived_count(conversation)
+    show_archived = request.GET.get('archived') == '1'
+    if show_archived and archived_count:
+        messages = archive.with_archived(conversation, messages)
     
     conversation.unread_count = 0
     conversation.save()
@@ -773,9 +786,21 @@ def chat_detail_view(request, user_id):
         'conversation': conversation,
         'messages': messages,
         'templates': templates,
+        'archived_count': archived_count,
+        'show_archived': show_archived,
     })
 
 
+def chat_export_view(request, user_id):
+    """Whole conversation, archived messages included, as JSON Lines"""
+    conversation = get_object_or_404(Conversation.objects.select_related('whatsapp_user'), whatsapp_user_id=user_id)
+    lines = (json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+             for row in archive.export_rows(conversation))
+    response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    response['Content-Disposition'] = f'attachment; filename="chat-{conversation.whatsapp_user.phone_number}.jsonl"'
+    return response
+
+
 @require_http_methods(["POST"])
 def send_message_api(request):
     """API endpoint to send messages"""
@@ -786,8 +811,10 @@ def send_message_api(request):
         
         logger.info(f"Send message request: type={message_type}, user_id={user_id}")
         
-        whatsapp_user = get_object_or_404(WhatsAppUser, id=user_id)
-        conversation = get_object_or_404(Conversation, whatsapp_user=whatsapp_user)
+        found = identity.for_user_id(user_id)
+        if found is None:
+            raise Http404('No conversation for this user')
+        whatsapp_user, conversation = found
         whatsapp_service = WhatsAppService()
         
         message = None
@@ -975,12 +1002,7 @@ def handle_unknown_message(msg_data, conversation, whatsapp_user, whatsapp_messa
         text_content, None, None, None, 'delivered', timestamp
     )
     
-    conversation.last_message_preview = text_content
-    conversation.unread_count += 1
-    conversation.save()
-    
-    whatsapp_user.last_message_at = timestamp
-    whatsapp_user.save()
+    _record_inbound(conversation, whatsapp_user, text_content, timestamp)
     
     logger.warning(f"Saved unsupported message type from {whatsapp_user.phone_number}")
     return msg_obj